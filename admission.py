@@ -0,0 +1,235 @@
+import time
+import logging
+import threading
+from collections import deque
+from flask import Response, g, request
+
+logger = logging.getLogger(__name__)
+
+CHECKOUT, NORMAL, EXPENSIVE, LOW = 'checkout', 'normal', 'expensive', 'low'
+CLASSES = (CHECKOUT, NORMAL, EXPENSIVE, LOW)
+
+# Endpoints not listed are 'normal'. The order flow is never shed: keeping it
+# responsive is what shedding everything else is for.
+ENDPOINT_CLASSES = {
+    'order': CHECKOUT,
+    'submit_order': CHECKOUT,
+    'create_checkout_session': CHECKOUT,
+    'checkout_failed': CHECKOUT,
+    'payment_success': CHECKOUT,
+    'payment_cancel': CHECKOUT,
+    'admin_dashboard': EXPENSIVE,
+    'admin_order_search': EXPENSIVE,
+    'site_search': EXPENSIVE,
+    'admin_analytics_funnel': LOW,
+    'admin_analytics_rollups': LOW,
+    'newsletter_signup': LOW,
+    'download_template': LOW,
+}
+
+# File responses are cheap and would only dilute the 'normal' latency average.
+# Event streams stay open for minutes; their duration says nothing about load
+# and would read as overload.
+UNADMITTED_ENDPOINTS = ('static', 'built_asset', 'chat_stream')
+
+EWMA_WEIGHT = 0.2
+# Samples older than this no longer say anything about current load
+STALE_SECONDS = 10
+SHED_MESSAGE = 'The server is busy. Please retry shortly.'
+
+def classify(endpoint):
+    return ENDPOINT_CLASSES.get(endpoint, NORMAL)
+
+def queue_time_ms(header, now):
+    """Time since the proxy accepted the request, from X-Request-Start: t=<epoch in s, ms or us>"""
+    if not header:
+        return 0.0
+    try:
+        started = float(header.strip().lstrip('t='))
+    except ValueError:
+        return 0.0
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return max(0.0, (now - started) * 1000)
+
+class _Average:
+    """Exponentially weighted moving average that goes stale when samples stop"""
+
+    __slots__ = ('value', 'updated_at')
+
+    def __init__(self):
+        self.value = 0.0
+        self.updated_at = 0.0
+
+    def add(self, sample, now):
+        if now - self.updated_at > STALE_SECONDS:
+            self.value = sample
+        else:
+            self.value += EWMA_WEIGHT * (sample - self.value)
+        self.updated_at = now
+
+    def current(self, now):
+        return self.value if now - self.updated_at <= STALE_SECONDS else 0.0
+
+class AdmissionController:
+    """Per-worker admission control by endpoint class
+
+    Tracks requests in flight and a moving average of latency for each
+    class, plus how long requests waited in the proxy and socket backlog
+    before a worker picked them up (X-Request-Start). The worker counts as
+    overloaded while any class's latency is over its SLO or queue time is
+    over ADMISSION_MAX_QUEUE_MS. Then 'low' requests are turned away with
+    503 + Retry-After, 'expensive' ones are held to one at a time, and
+    checkout and normal pages are always admitted. 'expensive' and 'low'
+    also have a concurrency cap that applies at all times.
+
+    Low-priority side work (analytics writes) can be deferred instead of
+    dropped: defer() holds it in memory and it is written in a batch after
+    a response once the worker is no longer overloaded.
+
+    Counts are per worker on purpose: overload is a property of the worker
+    the request landed on.
+    """
+
+    def __init__(self):
+        self.slo_ms = {}
+        self.max_queue_ms = 0.0
+        self.concurrency = {}
+        self.retry_after = 10
+        self.in_flight = dict.fromkeys(CLASSES, 0)
+        self.shed = dict.fromkeys(CLASSES, 0)
+        self.latency = {name: _Average() for name in CLASSES}
+        self.queue = _Average()
+        self.deferred = deque()
+        self._was_overloaded = False
+        self._lock = threading.Lock()
+
+    def configure(self, config):
+        self.slo_ms = dict(config['ADMISSION_SLO_MS'])
+        self.max_queue_ms = config['ADMISSION_MAX_QUEUE_MS']
+        self.concurrency = dict(config['ADMISSION_CONCURRENCY'])
+        self.retry_after = config['ADMISSION_RETRY_AFTER']
+        self.deferred = deque(self.deferred, maxlen=config['ADMISSION_DEFER_LIMIT'])
+
+    def _overloaded(self, now):
+        overloaded = (self.max_queue_ms > 0 and self.queue.current(now) > self.max_queue_ms) or any(
+            self.latency[name].current(now) > slo for name, slo in self.slo_ms.items())
+        if overloaded != self._was_overloaded:
+            self._was_overloaded = overloaded
+            if overloaded:
+                logger.warning(f"Worker overloaded, shedding low-priority requests: {self._summary(now)}")
+            else:
+                logger.info("Worker load back under its SLOs")
+        return overloaded
+
+    def _summary(self, now):
+        latency = ', '.join(f"{name} {self.latency[name].current(now):.0f}ms" for name in self.slo_ms)
+        return f"{latency}, queue {self.queue.current(now):.0f}ms"
+
+    def overloaded(self):
+        with self._lock:
+            return self._overloaded(time.time())
+
+    def admit(self, endpoint_class, queue_ms=0.0):
+        """Whether to serve a request of this class now; admitted requests must be released"""
+        now = time.time()
+        with self._lock:
+            if queue_ms:
+                self.queue.add(queue_ms, now)
+            overloaded = self._overloaded(now)
+            limit = self.concurrency.get(endpoint_class)
+            if endpoint_class == LOW and overloaded:
+                admitted = False
+            elif limit is not None:
+                admitted = self.in_flight[endpoint_class] < (min(limit, 1) if overloaded else limit)
+            else:
+                admitted = True
+
+            if admitted:
+                self.in_flight[endpoint_class] += 1
+            else:
+                self.shed[endpoint_class] += 1
+            return admitted
+
+    def release(self, endpoint_class, duration_ms):
+        with self._lock:
+            self.in_flight[endpoint_class] -= 1
+            self.latency[endpoint_class].add(duration_ms, time.time())
+
+    def defer(self, flush, item):
+        """Hold one item of low-priority work; flush(items) gets a batch once load drops"""
+        with self._lock:
+            self.deferred.append((flush, item))
+
+    def run_deferred(self, limit=500):
+        with self._lock:
+            batch = [self.deferred.popleft() for _ in range(min(limit, len(self.deferred)))]
+
+        groups = {}
+        for flush, item in batch:
+            groups.setdefault(flush, []).append(item)
+        for flush, items in groups.items():
+            try:
+                flush(items)
+            except Exception as e:
+                logger.error(f"Deferred {flush.__name__} failed for {len(items)} items: {str(e)}")
+        return len(batch)
+
+    def status(self):
+        now = time.time()
+        with self._lock:
+            return {
+                'overloaded': self._overloaded(now),
+                'queue_ms': round(self.queue.current(now), 1),
+                'max_queue_ms': self.max_queue_ms,
+                'deferred': len(self.deferred),
+                'classes': {name: {
+                    'in_flight': self.in_flight[name],
+                    'latency_ms': round(self.latency[name].current(now), 1),
+                    'slo_ms': self.slo_ms.get(name),
+                    'concurrency': self.concurrency.get(name),
+                    'shed': self.shed[name],
+                } for name in CLASSES},
+            }
+
+admission = AdmissionController()
+
+def shed_response():
+    return Response(SHED_MESSAGE, status=503, mimetype='text/plain',
+                    headers={'Retry-After': str(admission.retry_after)})
+
+def init_admission(app):
+    """Admit or shed each request by endpoint class; registered before the routes' own hooks"""
+    if not app.config['ADMISSION_ENABLED']:
+        return app
+    admission.configure(app.config)
+
+    @app.before_request
+    def admit_request():
+        if request.endpoint in UNADMITTED_ENDPOINTS:
+            return
+        endpoint_class = classify(request.endpoint)
+        queue_ms = queue_time_ms(request.headers.get('X-Request-Start'), time.time())
+        if not admission.admit(endpoint_class, queue_ms):
+            return shed_response()
+        g.admission = (endpoint_class, time.perf_counter())
+
+    @app.after_request
+    def run_deferred_work(response):
+        # After the response is sent, so the client that happens to trigger it does not wait
+        if admission.deferred and not admission.overloaded():
+            def run():
+                with app.app_context():
+                    admission.run_deferred()
+            response.call_on_close(run)
+        return response
+
+    @app.teardown_request
+    def release_request(exc):
+        ticket = g.pop('admission', None)
+        if ticket is not None:
+            admission.release(ticket[0], (time.perf_counter() - ticket[1]) * 1000)
+
+    return app
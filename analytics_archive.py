@@ -0,0 +1,271 @@
+import os
+import json
+from datetime import datetime
+from sqlalchemy import text
+from flask import current_app
+from app import db
+from models import Analytics, RollupCheckpoint
+
+EXPORT_BATCH_SIZE = 50000
+
+# Columns with few distinct, long values are dictionary encoded on export
+DICTIONARY_COLUMNS = ('event_type', 'user_agent', 'referrer', 'page')
+
+def month_start(timestamp):
+    """Truncate a timestamp to the first instant of its month"""
+    return datetime(timestamp.year, timestamp.month, 1)
+
+def next_month(start):
+    """Get the start of the month after the given month start"""
+    if start.month == 12:
+        return datetime(start.year + 1, 1, 1)
+    return datetime(start.year, start.month + 1, 1)
+
+def previous_month(start):
+    """Get the start of the month before the given month start"""
+    if start.month == 1:
+        return datetime(start.year - 1, 12, 1)
+    return datetime(start.year, start.month - 1, 1)
+
+def partition_name(start):
+    """Name of the PostgreSQL partition holding a month of events"""
+    return f"analytics_y{start.year}m{start.month:02d}"
+
+def is_partitioned(connection):
+    """Check whether the analytics table is a native PostgreSQL partitioned table"""
+    if connection.dialect.name != 'postgresql':
+        return False
+    relkind = connection.execute(text(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass('analytics')"
+    )).scalar()
+    return relkind == 'p'
+
+DEFAULT_PARTITION = 'analytics_default'
+
+def ensure_partitions(connection, first_month, months_ahead=2):
+    """Create monthly partitions from first_month through the next few months
+
+    Events for months without a partition land in the default partition, so
+    inserts keep working if this has not run in a while; any months found
+    there are split out into their own partitions here.
+    """
+    connection.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF analytics DEFAULT"))
+
+    last_month = month_start(datetime.utcnow())
+    for _ in range(months_ahead):
+        last_month = next_month(last_month)
+
+    stray = connection.execute(text(f"SELECT min(created_at) FROM {DEFAULT_PARTITION}")).scalar()
+    start = month_start(min(first_month, stray) if stray else first_month)
+    while start <= last_month:
+        _create_partition(connection, start)
+        start = next_month(start)
+
+def _create_partition(connection, start):
+    """Attach one month's partition, moving its rows out of the default partition"""
+    name = partition_name(start)
+    if connection.execute(text("SELECT to_regclass(:name)"), {'name': name}).scalar():
+        return
+
+    end = next_month(start)
+    bounds = {'start': start, 'end': end}
+    # A partition overlapping rows in the default partition cannot be
+    # attached, so they are moved into the new table first
+    connection.execute(text(f"CREATE TABLE {name} (LIKE analytics INCLUDING DEFAULTS)"))
+    connection.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end "
+        f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+    ), bounds)
+    connection.execute(text(
+        f"ALTER TABLE analytics ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+
+def ensure_current_partitions():
+    """Create partitions for this month and the next ones if analytics is partitioned"""
+    with db.engine.begin() as connection:
+        if not is_partitioned(connection):
+            return False
+        ensure_partitions(connection, datetime.utcnow())
+    return True
+
+def partition_analytics_table():
+    """One-off migration of the analytics table to monthly range partitions on PostgreSQL"""
+    with db.engine.begin() as connection:
+        if connection.dialect.name != 'postgresql':
+            raise RuntimeError("Native partitioning is only available on PostgreSQL")
+        if is_partitioned(connection):
+            return False
+
+        # Secondary indexes (including expression indexes) are rebuilt on the
+        # partitioned table, which cascades them to every partition. Unique
+        # indexes cannot be, since they would have to include created_at.
+        index_definitions = [row.indexdef for row in connection.execute(text(
+            "SELECT i.indexdef FROM pg_indexes i "
+            "JOIN pg_index x ON x.indexrelid = format('%I.%I', i.schemaname, i.indexname)::regclass "
+            "WHERE i.schemaname = current_schema() AND i.tablename = 'analytics' AND NOT x.indisunique"
+        ))]
+
+        connection.execute(text("ALTER TABLE analytics RENAME TO analytics_legacy"))
+        connection.execute(text("ALTER INDEX IF EXISTS analytics_pkey RENAME TO analytics_legacy_pkey"))
+        # The partition key has to be part of the primary key
+        connection.execute(text(
+            "CREATE TABLE analytics (LIKE analytics_legacy INCLUDING DEFAULTS, "
+            "PRIMARY KEY (id, created_at)) PARTITION BY RANGE (created_at)"
+        ))
+        connection.execute(text("ALTER SEQUENCE analytics_id_seq OWNED BY analytics.id"))
+        connection.execute(text("UPDATE analytics_legacy SET created_at = now() WHERE created_at IS NULL"))
+
+        oldest = connection.execute(text("SELECT min(created_at) FROM analytics_legacy")).scalar()
+        ensure_partitions(connection, oldest or datetime.utcnow())
+
+        connection.execute(text("INSERT INTO analytics SELECT * FROM analytics_legacy"))
+        connection.execute(text("DROP TABLE analytics_legacy"))
+
+        for definition in index_definitions:
+            connection.execute(text(definition.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS", 1)))
+
+    return True
+
+def _dictionary_array(pa, values, dictionary, codes):
+    """Encode values against an append-only dictionary shared by all batches"""
+    indices = []
+    for value in values:
+        if value is None:
+            indices.append(None)
+            continue
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(dictionary)
+            dictionary.append(value)
+        indices.append(code)
+    return pa.DictionaryArray.from_arrays(pa.array(indices, type=pa.int32()), pa.array(dictionary, type=pa.string()))
+
+def export_month(start, export_folder, source_table='analytics'):
+    """Write one month of events to a compressed Arrow IPC file
+
+    Long, repetitive strings (user agents, referrers, event types, pages)
+    are dictionary encoded. Sample weights are kept so rollups can be
+    rebuilt from the archive. The file can be opened with
+    pyarrow.memory_map for offline analysis.
+    """
+    import pyarrow as pa
+
+    end = next_month(start)
+    os.makedirs(export_folder, exist_ok=True)
+    export_path = os.path.join(export_folder, f"{partition_name(start)}.arrow")
+    tmp_path = export_path + '.tmp'
+
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('event_type', pa.dictionary(pa.int32(), pa.string())),
+        ('event_data', pa.string()),
+        ('user_id', pa.string()),
+        ('ip_address', pa.string()),
+        ('user_agent', pa.dictionary(pa.int32(), pa.string())),
+        ('referrer', pa.dictionary(pa.int32(), pa.string())),
+        ('created_at', pa.timestamp('us')),
+        ('sample_weight', pa.float64()),
+        ('page', pa.dictionary(pa.int32(), pa.string())),
+        ('order_id', pa.int64()),
+        ('template_id', pa.int64()),
+    ])
+    dictionaries = {column: ([], {}) for column in DICTIONARY_COLUMNS}
+
+    options = pa.ipc.IpcWriteOptions(
+        compression=current_app.config.get('ANALYTICS_EXPORT_COMPRESSION', 'zstd'),
+        emit_dictionary_deltas=True
+    )
+
+    # Typed through the model's columns so SQLite's text timestamps come back as datetimes
+    query = text(
+        f"SELECT {', '.join(schema.names)} "
+        f"FROM {source_table} WHERE created_at >= :start AND created_at < :end AND id > :last_id "
+        f"ORDER BY id LIMIT :limit"
+    ).columns(*(Analytics.__table__.c[name] for name in schema.names))
+
+    exported = 0
+    last_id = 0
+    with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, schema, options=options) as writer:
+        while True:
+            rows = db.session.execute(query, {
+                'start': start, 'end': end, 'last_id': last_id, 'limit': EXPORT_BATCH_SIZE
+            }).all()
+            if not rows:
+                break
+
+            columns = {name: [getattr(row, name) for row in rows] for name in schema.names}
+            columns['event_data'] = [
+                value if value is None or isinstance(value, str) else json.dumps(value)
+                for value in columns['event_data']
+            ]
+
+            arrays = []
+            for name in schema.names:
+                if name in dictionaries:
+                    dictionary, codes = dictionaries[name]
+                    arrays.append(_dictionary_array(pa, columns[name], dictionary, codes))
+                else:
+                    arrays.append(pa.array(columns[name], type=schema.field(name).type))
+
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            exported += len(rows)
+            last_id = rows[-1].id
+
+    if not exported:
+        os.remove(tmp_path)
+        return None, 0, last_id
+
+    os.replace(tmp_path, export_path)
+    return export_path, exported, last_id
+
+def _rolled_up_through(month_last_id):
+    """Check that the rollup job has consumed every event up to an id"""
+    checkpoint = db.session.get(RollupCheckpoint, 'analytics')
+    return checkpoint is not None and checkpoint.last_id >= month_last_id
+
+def apply_retention(keep_months=None, export_folder=None):
+    """Export and remove months of events older than the retention window"""
+    keep_months = keep_months or current_app.config['ANALYTICS_RETENTION_MONTHS']
+    export_folder = export_folder or current_app.config['ANALYTICS_EXPORT_FOLDER']
+
+    # Keep the current month plus keep_months full months before it
+    cutoff = month_start(datetime.utcnow())
+    for _ in range(keep_months):
+        cutoff = previous_month(cutoff)
+
+    connection = db.session.connection()
+    partitioned = is_partitioned(connection)
+    if partitioned:
+        ensure_partitions(connection, datetime.utcnow())
+        db.session.commit()
+
+    archived = []
+    oldest = db.session.query(db.func.min(Analytics.created_at)).scalar()
+    start = month_start(oldest) if oldest else cutoff
+
+    while start < cutoff:
+        source_table = partition_name(start) if partitioned else 'analytics'
+        path, exported, last_id = export_month(start, export_folder, source_table=source_table)
+
+        if exported and not _rolled_up_through(last_id):
+            current_app.logger.warning(f"Skipping retention for {start:%Y-%m}: events not rolled up yet")
+            break
+
+        if partitioned:
+            db.session.execute(text(f"ALTER TABLE analytics DETACH PARTITION {source_table}"))
+            db.session.execute(text(f"DROP TABLE {source_table}"))
+        else:
+            # No native partitions: remove the month in id-ordered chunks
+            while db.session.execute(text(
+                "DELETE FROM analytics WHERE id IN (SELECT id FROM analytics "
+                "WHERE created_at >= :start AND created_at < :end LIMIT :limit)"
+            ), {'start': start, 'end': next_month(start), 'limit': EXPORT_BATCH_SIZE}).rowcount:
+                db.session.commit()
+
+        db.session.commit()
+        current_app.logger.info(f"Archived {exported} analytics event(s) for {start:%Y-%m} to {path}")
+        archived.append((start, exported, path))
+        start = next_month(start)
+
+    return archived
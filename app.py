@@ -15,6 +15,10 @@ from flask_limiter.util import get_remote_address
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 import redis
+from replicas import RoutingSession
+from pooling import engine_options
+import rate_limits  # registers the hybrid+redis:// limiter storage
+from breakers import GuardedMail, init_breakers
 >>>>>>> ded7f2e4447248a018f7dd7d09de9c43eb09fa0d
 
 # Configure logging
@@ -23,9 +27,9 @@ logging.basicConfig(level=logging.DEBUG)
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
 login_manager = LoginManager()
-mail = Mail()
+mail = GuardedMail()
 <<<<<<< HEAD
 =======
 csrf = CSRFProtect()
@@ -46,10 +50,8 @@ def create_app():
 =======
     app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "postgresql://localhost/resume_service")
 >>>>>>> ded7f2e4447248a018f7dd7d09de9c43eb09fa0d
-    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-        "pool_recycle": 300,
-        "pool_pre_ping": True,
-    }
+    # Pool sizing follows the gunicorn worker model, see pooling.engine_options
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     
 <<<<<<< HEAD
@@ -86,19 +88,84 @@ def create_app():
     # Stripe configuration
     app.config["STRIPE_SECRET_KEY"] = os.environ.get("STRIPE_SECRET_KEY")
     app.config["STRIPE_PUBLISHABLE_KEY"] = os.environ.get("STRIPE_PUBLISHABLE_KEY")
+    app.config["STRIPE_WEBHOOK_SECRET"] = os.environ.get("STRIPE_WEBHOOK_SECRET")
     
     # Redis and Caching configuration
     redis_url = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
-    app.config["CACHE_TYPE"] = "RedisCache"
+    # Degrades to a no-op cache while the 'redis' circuit is open (see breakers.py)
+    app.config["CACHE_TYPE"] = "breakers.BreakerRedisCache"
     app.config["CACHE_REDIS_URL"] = redis_url
     app.config["CACHE_DEFAULT_TIMEOUT"] = 300
+    app.config["REDIS_URL"] = redis_url
+    app.config["REDIS_TIMEOUT"] = float(os.environ.get("REDIS_TIMEOUT", 0.25))  # seconds
+    app.config["CACHE_OPTIONS"] = {"socket_timeout": app.config["REDIS_TIMEOUT"],
+                                   "socket_connect_timeout": app.config["REDIS_TIMEOUT"]}
+    
+    # Circuit breakers: per-dependency timeouts and trip thresholds, counted across workers
+    app.config["SMTP_TIMEOUT"] = 10  # seconds
+    app.config["STRIPE_TIMEOUT"] = 10  # seconds
+    app.config["CIRCUIT_BREAKERS"] = {
+        "redis": {"failure_rate": 0.5, "min_calls": 20, "window_seconds": 10, "open_seconds": 10},
+        "smtp": {"failure_rate": 0.5, "min_calls": 3, "window_seconds": 60, "open_seconds": 60},
+        "stripe": {"failure_rate": 0.5, "min_calls": 5, "window_seconds": 30, "open_seconds": 30},
+    }
+    
+    # Read replicas (comma-separated URLs) serve SELECTs from views marked read_only
+    replica_urls = [url.strip() for url in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+    app.config["SQLALCHEMY_BINDS"] = {f"replica_{i}": url for i, url in enumerate(replica_urls)}
+    app.config["REPLICA_BIND_KEYS"] = list(app.config["SQLALCHEMY_BINDS"])
+    app.config["REPLICA_MAX_LAG_SECONDS"] = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", 10))
+    app.config["REPLICA_CHECK_SECONDS"] = 5
+    app.config["READ_YOUR_WRITES_SECONDS"] = 5
+    
+    # ASGI mode (asgi:app): async views share these per worker
+    app.config["ASYNC_DB_POOL_SIZE"] = int(os.environ.get("ASYNC_DB_POOL_SIZE", 10))
+    app.config["ASYNC_STRIPE_TIMEOUT"] = 30  # seconds
     
     # Rate limiting configuration
-    app.config["RATELIMIT_STORAGE_URL"] = redis_url
+    # Counted in process, reconciled with Redis every RATELIMIT_SYNC_SECONDS (see rate_limits.py)
+    app.config["RATELIMIT_STORAGE_URI"] = f"hybrid+{redis_url}"
+    app.config["RATELIMIT_STORAGE_OPTIONS"] = {"sync_interval": float(os.environ.get("RATELIMIT_SYNC_SECONDS", 1))}
     app.config["RATELIMIT_DEFAULT"] = "100 per hour"
+    app.config["RATELIMIT_ENABLED"] = os.environ.get("RATELIMIT_ENABLED", "1") == "1"  # 0 for load tests
+    
+    # Admission control: per-worker load shedding by endpoint class (see admission.py)
+    app.config["ADMISSION_ENABLED"] = os.environ.get("ADMISSION_ENABLED", "1") == "1"
+    app.config["ADMISSION_SLO_MS"] = {"checkout": 1500, "normal": 1000}  # moving-average latency targets
+    app.config["ADMISSION_MAX_QUEUE_MS"] = float(os.environ.get("ADMISSION_MAX_QUEUE_MS", 500))  # from X-Request-Start
+    app.config["ADMISSION_CONCURRENCY"] = {"expensive": 2, "low": 2}  # in flight per worker
+    app.config["ADMISSION_RETRY_AFTER"] = 10  # seconds
+    app.config["ADMISSION_DEFER_LIMIT"] = 10000  # deferred analytics events held per worker
     
     # Session configuration
+    # Stored server-side with a sliding TTL; the cookie only carries an id (see sessions.py)
     app.config["PERMANENT_SESSION_LIFETIME"] = 86400  # 24 hours
+    app.config["SESSION_BACKEND"] = os.environ.get("SESSION_BACKEND", "redis")  # redis or sqlite
+    app.config["SESSION_SQLITE_PATH"] = os.environ.get("SESSION_SQLITE_PATH", "instance/sessions.db")
+    app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
+    
+    # Compression configuration
+    app.config["COMPRESS_MIN_SIZE"] = 500  # bytes
+    app.config["COMPRESS_MIMETYPES"] = {"text/html", "application/json", "text/plain", "text/css", "application/javascript"}
+    app.config["ASSETS_BUILD_FOLDER"] = "static/dist"
+    
+    # Conditional GET: page ETags already change with code, templates and assets (see versions.py);
+    # the salt is only needed to invalidate them by hand
+    app.config["ETAG_SALT"] = os.environ.get("ETAG_SALT", "")
+    
+    # Template configuration: compiled bytecode is shared by all workers
+    app.config["TEMPLATE_CACHE_FOLDER"] = os.environ.get("TEMPLATE_CACHE_FOLDER", ".jinja_cache")
+    app.config["TEMPLATE_WARMUP"] = os.environ.get("TEMPLATE_WARMUP", "1") == "1"
+    app.config["FRAGMENT_CACHE_ENABLED"] = True
+    app.config["FRAGMENT_CACHE_TIMEOUT"] = 3600  # tag versions expire fragments on writes
+    
+    # On-demand stack sampling of gunicorn workers (see gunicorn.conf.py)
+    app.config["PROFILER_ENABLED"] = os.environ.get("PROFILER_ENABLED", "1") == "1"
+    app.config["PROFILER_MAX_SECONDS"] = 60
+    
+    # Slow query log: statements over the threshold are recorded in Redis and EXPLAINed once per fingerprint
+    app.config["SLOW_QUERY_THRESHOLD_MS"] = float(os.environ.get("SLOW_QUERY_THRESHOLD_MS", 200))  # 0 disables
+    app.config["SLOW_QUERY_EXPLAIN"] = os.environ.get("SLOW_QUERY_EXPLAIN", "1") == "1"
     
     # Feature flags
     app.config["ENABLE_TESTIMONIALS"] = True
@@ -106,6 +173,25 @@ def create_app():
     app.config["ENABLE_LIVE_CHAT"] = True
     app.config["ENABLE_REFERRALS"] = True
     app.config["ENABLE_ANALYTICS"] = True
+    
+    # Analytics sampling (event type -> fraction recorded) and page-view dedupe
+    app.config["ANALYTICS_SAMPLE_RATES"] = {
+        "page_view": float(os.environ.get("ANALYTICS_PAGE_VIEW_SAMPLE_RATE", 0.1)),
+    }
+    app.config["ANALYTICS_DEDUPE_SECONDS"] = 30
+    app.config["ANALYTICS_SKIP_BOTS"] = True
+    
+    # Analytics retention (older months are exported to Arrow files, then dropped)
+    app.config["ANALYTICS_RETENTION_MONTHS"] = int(os.environ.get("ANALYTICS_RETENTION_MONTHS", 6))
+    app.config["ANALYTICS_EXPORT_FOLDER"] = os.environ.get("ANALYTICS_EXPORT_FOLDER", "archive/analytics")
+    app.config["ANALYTICS_EXPORT_COMPRESSION"] = "zstd"
+    
+    # Live chat streaming
+    app.config["CHAT_HEARTBEAT_SECONDS"] = int(os.environ.get("CHAT_HEARTBEAT_SECONDS", 15))
+    app.config["CHAT_REPLAY_LIMIT"] = 100
+    app.config["CHAT_PAGE_SIZE"] = 50
+    app.config["CHAT_ARCHIVE_FOLDER"] = os.environ.get("CHAT_ARCHIVE_FOLDER", "archive/chats")
+    app.config["CHAT_ARCHIVE_AFTER_HOURS"] = 24
 >>>>>>> ded7f2e4447248a018f7dd7d09de9c43eb09fa0d
     
     # Initialize extensions
@@ -164,6 +250,7 @@ def create_app():
 
 # Create app instance
 =======
+    init_breakers(app)
     csrf.init_app(app)
     cache.init_app(app)
     limiter.init_app(app)
@@ -185,8 +272,40 @@ def create_app():
         # Import models
         import models
         
+        # Keep derived indexes in sync with model writes
+        from facets import register_facet_listeners
+        from search import register_search_listeners, init_search_index
+        from versions import register_version_listeners, init_table_versions
+        register_facet_listeners()
+        register_search_listeners()
+        register_version_listeners()
+        
         # Create tables
         db.create_all()
+        init_search_index(db.engine)
+        init_table_versions()
+        
+        # Partitions are also created by the retention cron; doing it at boot
+        # keeps inserts off the default partition if that job stops running
+        from analytics_archive import ensure_current_partitions
+        try:
+            ensure_current_partitions()
+        except Exception as e:
+            logging.warning(f"Analytics partition check skipped: {str(e)}")
+        
+        # Databases created before facet counters and search indexes existed get them built once
+        from facets import backfill_facets
+        from search import backfill_search_index
+        try:
+            if backfill_facets():
+                logging.info("Facet counts backfilled from existing rows")
+            indexed = backfill_search_index()
+            if indexed:
+                logging.info(f"Search index backfilled with {indexed} documents")
+        except Exception as e:
+            # Another worker booting at the same time may have won the race
+            db.session.rollback()
+            logging.warning(f"Index backfill skipped: {str(e)}")
         
         # Create default admin user if not exists
         from models import Admin, Service
@@ -245,10 +364,42 @@ def create_app():
         
         db.session.commit()
     
+    # Server-side session store
+    from sessions import init_sessions
+    init_sessions(app)
+    
+    # Admission control, registered first so shed requests skip the routes' own hooks
+    from admission import init_admission
+    init_admission(app)
+    
     # Register routes
     from routes import register_routes
     register_routes(app)
     
+    # Read replica routing with read-your-writes stickiness
+    from replicas import init_replicas
+    init_replicas(app)
+    
+    # Slow query log with EXPLAIN capture on every engine
+    from slow_queries import init_slow_query_log
+    init_slow_query_log(app)
+    
+    # Response compression and fingerprinted static assets
+    from compression import init_compression
+    init_compression(app)
+    
+    # Page ETags follow the deployed code, templates and asset manifest
+    from versions import init_etag_salt
+    init_etag_salt(app)
+    
+    # Register maintenance commands
+    from commands import register_commands
+    register_commands(app)
+    
+    # Template bytecode cache and warmup, last so every template global is registered
+    from templating import init_templating
+    init_templating(app)
+    
     return app
 
 >>>>>>> ded7f2e4447248a018f7dd7d09de9c43eb09fa0d
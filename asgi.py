@@ -0,0 +1,279 @@
+import os
+import json
+import time
+import contextlib
+import stripe
+import redis.asyncio as aioredis
+from a2wsgi import WSGIMiddleware
+from flask import session
+from flask_login import current_user
+from limits import parse as parse_limit
+from limits.storage import storage_from_string
+from limits.aio.strategies import FixedWindowRateLimiter
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import FileResponse, PlainTextResponse, RedirectResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+from app import app as flask_app
+from models import Order, Template, LiveChat, ChatMessage
+from chat import chat_channel, format_sse, serialize_message
+from utils import track_event
+from breakers import get_breaker
+from admission import admission, queue_time_ms, CHECKOUT, LOW, SHED_MESSAGE
+
+# Async drivers for the sync URLs in SQLALCHEMY_DATABASE_URI
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+def async_database_url(database_uri):
+    scheme, _, rest = database_uri.partition('://')
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}://{rest}"
+
+class FlaskFallback:
+    """Response that hands the request to the mounted Flask app, for outcomes it renders (flashes, error pages)"""
+
+    def __init__(self, wsgi):
+        self.wsgi = wsgi
+
+    async def __call__(self, scope, receive, send):
+        await self.wsgi(scope, receive, send)
+
+def create_asgi_app(flask_app):
+    """Async views for the I/O-bound routes, with the sync Flask app mounted for the rest
+
+    Views that only wait on Stripe, Redis, the database or the disk run on
+    the event loop, so one worker keeps serving while they wait. Anything
+    needing Flask's request machinery (flashes, Flask-Login, track_event)
+    runs in a thread inside a Flask request context, or is handed to Flask.
+    """
+    config = flask_app.config
+    wsgi = WSGIMiddleware(flask_app)
+    database_url = async_database_url(config['SQLALCHEMY_DATABASE_URI'])
+    engine_options = {} if database_url.startswith('sqlite') else {'pool_size': config['ASYNC_DB_POOL_SIZE']}
+    engine = create_async_engine(database_url, **engine_options)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    redis_client = aioredis.Redis.from_url(config['REDIS_URL'])
+    # redis-py's asyncio client, already installed, rather than limits' default coredis
+    limiter_storage = storage_from_string(f"async+{config['REDIS_URL']}", implementation='redispy')
+    rate_limiter = FixedWindowRateLimiter(limiter_storage)
+    download_limit = parse_limit("10 per hour")
+    # Sync Stripe calls in the mounted app keep using requests; *_async calls go through httpx
+    stripe.default_http_client = stripe.RequestsClient(
+        timeout=config['STRIPE_TIMEOUT'],
+        async_fallback_client=stripe.HTTPXClient(timeout=config['ASYNC_STRIPE_TIMEOUT'])
+    )
+
+    def flask_context(request):
+        environ = {'REMOTE_ADDR': request.client.host if request.client else None}
+        return flask_app.test_request_context(request.url.path, query_string=request.url.query,
+                                              headers=list(request.headers.items()), environ_base=environ)
+
+    def in_flask(request, function, *args):
+        """Run a sync helper in a thread, inside a Flask request context for this request"""
+        def call():
+            with flask_context(request):
+                return function(*args)
+        return run_in_threadpool(call)
+
+    def admitted(endpoint_class, view):
+        """Admission control for async views, which never reach Flask's request hooks"""
+        async def wrapper(request):
+            queue_ms = queue_time_ms(request.headers.get('X-Request-Start'), time.time())
+            if not admission.admit(endpoint_class, queue_ms):
+                return PlainTextResponse(SHED_MESSAGE, status_code=503,
+                                         headers={'Retry-After': str(admission.retry_after)})
+            started = time.perf_counter()
+            try:
+                return await view(request)
+            finally:
+                admission.release(endpoint_class, (time.perf_counter() - started) * 1000)
+        return wrapper
+
+    async def create_checkout_session(request):
+        order_id = request.path_params['order_id']
+        api_key = config.get('STRIPE_SECRET_KEY')
+
+        async with Session() as db_session:
+            order = await db_session.get(Order, order_id, options=[selectinload(Order.service)])
+            # Flask renders the "payment temporarily unavailable" page while the Stripe circuit is open
+            breaker = get_breaker('stripe')
+            if order is None or not api_key or not breaker.allow():
+                return FlaskFallback(wsgi)
+
+            service = order.service
+            domain = str(request.base_url).rstrip('/')
+            try:
+                checkout_session = await stripe.checkout.Session.create_async(
+                    api_key=api_key,
+                    payment_method_types=['card'],
+                    line_items=[{
+                        'price_data': {
+                            'currency': 'usd',
+                            'product_data': {
+                                'name': f'{service.name} - {order.service_tier.title()}',
+                                'description': f'Resume writing service for {order.full_name}',
+                            },
+                            'unit_amount': int(order.total_amount * 100),  # Convert to cents
+                        },
+                        'quantity': 1,
+                    }],
+                    mode='payment',
+                    success_url=f'{domain}/payment-success?session_id={{CHECKOUT_SESSION_ID}}',
+                    cancel_url=f'{domain}/payment-cancel?order_id={order.id}',
+                    client_reference_id=str(order.id),
+                    customer_email=order.email,
+                )
+            except Exception as e:
+                breaker.record_exception(e)
+                flask_app.logger.error(f"Stripe error: {e}")
+                return RedirectResponse(f"/checkout-failed/{order.id}", status_code=303)
+            breaker.record_success()
+
+            order.stripe_session_id = checkout_session.id
+            await db_session.commit()
+
+        return RedirectResponse(checkout_session.url or '/order', status_code=303)
+
+    def authorize_chat(session_id):
+        if not config.get('ENABLE_LIVE_CHAT', False):
+            return 404
+        if not current_user.is_authenticated and session.get('chat_session_id') != session_id:
+            return 403
+        return None
+
+    async def chat_stream(request):
+        session_id = request.path_params['session_id']
+        denied = await in_flask(request, authorize_chat, session_id)
+        if denied:
+            return FlaskFallback(wsgi) if denied == 404 else PlainTextResponse('Forbidden', status_code=403)
+
+        async with Session() as db_session:
+            chat = (await db_session.execute(
+                select(LiveChat).filter_by(session_id=session_id))).scalar_one_or_none()
+        if chat is None:
+            return FlaskFallback(wsgi)
+
+        last_event_id = request.headers.get('Last-Event-ID') or request.query_params.get('after')
+        last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+
+        async def events():
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            # Subscribe before replaying so nothing published in between is lost
+            await pubsub.subscribe(chat_channel(chat.session_id))
+            try:
+                last_sent = last_event_id or 0
+
+                # Replay only what the client missed while disconnected
+                if last_event_id:
+                    async with Session() as db_session:
+                        missed = (await db_session.execute(
+                            select(ChatMessage).where(ChatMessage.chat_id == chat.id, ChatMessage.id > last_event_id)
+                            .order_by(ChatMessage.id.asc()).limit(config.get('CHAT_REPLAY_LIMIT', 100))
+                        )).scalars().all()
+                    for message in missed:
+                        last_sent = message.id
+                        yield format_sse(json.dumps(serialize_message(message)), event_id=message.id)
+
+                yield format_sse('{}', event='ready')
+
+                while True:
+                    event = await pubsub.get_message(ignore_subscribe_messages=True,
+                                                     timeout=config.get('CHAT_HEARTBEAT_SECONDS', 15))
+                    if event is None:
+                        yield ': keep-alive\n\n'
+                        continue
+
+                    data = event['data']
+                    if isinstance(data, bytes):
+                        data = data.decode('utf-8')
+                    message_id = json.loads(data).get('id', 0)
+                    if message_id <= last_sent:
+                        continue
+                    last_sent = message_id
+                    yield format_sse(data, event_id=message_id)
+            finally:
+                await pubsub.aclose()
+
+        return StreamingResponse(events(), media_type='text/event-stream',
+                                 headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    async def download_template(request):
+        template_id = request.path_params['template_id']
+        client_ip = request.client.host if request.client else 'unknown'
+        if not await rate_limiter.hit(download_limit, 'download_template', client_ip):
+            return PlainTextResponse('Too Many Requests', status_code=429)
+
+        async with Session() as db_session:
+            template = await db_session.get(Template, template_id)
+            if template is None or not template.active or template.premium_only:
+                return FlaskFallback(wsgi)
+
+            file_path = os.path.join(config['UPLOAD_FOLDER'], 'templates', template.file_path)
+            if not os.path.exists(file_path):
+                return FlaskFallback(wsgi)
+
+            # Through the ORM so the table version (and cached pages) follow the new count
+            template.download_count += 1
+            await db_session.commit()
+
+        await in_flask(request, track_event, 'template_downloaded', {'template_id': template_id})
+
+        return FileResponse(file_path, filename=f"{template.name}.{template.file_path.split('.')[-1]}")
+
+    async def stripe_webhook(request):
+        secret = config.get('STRIPE_WEBHOOK_SECRET')
+        if not secret:
+            return PlainTextResponse('Not Found', status_code=404)
+
+        try:
+            event = stripe.Webhook.construct_event(await request.body(), request.headers.get('Stripe-Signature', ''),
+                                                   secret)
+        except (ValueError, stripe.SignatureVerificationError):
+            return PlainTextResponse('Bad Request', status_code=400)
+
+        if event['type'] == 'checkout.session.completed':
+            async with Session() as db_session:
+                order = (await db_session.execute(
+                    select(Order).filter_by(stripe_session_id=event['data']['object']['id']))).scalar_one_or_none()
+                if order is not None and order.payment_status != 'paid':
+                    order.payment_status = 'paid'
+                    order.status = 'in_progress'
+                    await db_session.commit()
+                    await run_in_threadpool(send_payment_confirmation, order.id)
+
+        return Response(status_code=200)
+
+    def send_payment_confirmation(order_id):
+        from routes import send_payment_confirmation_email
+        with flask_app.app_context():
+            try:
+                send_payment_confirmation_email(Order.query.get(order_id))
+            except Exception as e:
+                flask_app.logger.error(f"Failed to send payment confirmation email: {e}")
+
+    @contextlib.asynccontextmanager
+    async def lifespan(asgi_app):
+        yield
+        await engine.dispose()
+        await redis_client.aclose()
+
+    asgi_app = Starlette(routes=[
+        Route('/create-checkout-session/{order_id:int}', admitted(CHECKOUT, create_checkout_session)),
+        # Not admitted: a stream's lifetime is not a latency sample
+        Route('/chat/{session_id}/stream', chat_stream),
+        Route('/download-template/{template_id:int}', admitted(LOW, download_template)),
+        Route('/stripe/webhook', stripe_webhook, methods=['POST']),
+        Mount('/', app=wsgi),
+    ], lifespan=lifespan)
+    # gunicorn.conf.py starts per-worker services against the Flask app
+    asgi_app.state.flask_app = flask_app
+    return asgi_app
+
+app = create_asgi_app(flask_app)
@@ -0,0 +1,328 @@
+import os
+import time
+import logging
+import smtplib
+import threading
+import redis
+import stripe
+from redis.retry import Retry
+from redis.backoff import NoBackoff
+from flask import current_app
+from flask_mail import Mail, Connection
+from flask_caching.backends import RedisCache
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+# Exceptions that mean the dependency is unhealthy; anything else (a declined card, a bad
+# address) is the caller's problem and counts as a successful round trip
+FAILURES = {
+    'redis': (redis.RedisError,),
+    'smtp': (smtplib.SMTPException, OSError),
+    'stripe': (stripe.APIConnectionError, stripe.APIError, stripe.RateLimitError),
+}
+
+def no_retry():
+    """redis-py retries with backoff by default, which outlasts any socket timeout; fail once instead"""
+    return Retry(NoBackoff(), 0)
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} circuit is open")
+        self.name = name
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """Fail fast on a dependency once its failure rate crosses a threshold
+
+    Calls and failures are counted in fixed windows. Once at least
+    `min_calls` were made in a window and `failure_rate` of them failed, the
+    circuit opens for `open_seconds`; after that each worker lets one probe
+    call through (half-open) and closes again on success.
+
+    With a `shared` Redis client a background thread adds this worker's
+    counts to cluster-wide counters every `sync_seconds` and shares the
+    open-until time, so every worker trips on the combined failure rate and
+    stops calling a dead dependency together.
+    """
+
+    def __init__(self, name, failure_rate=0.5, min_calls=10, window_seconds=30, open_seconds=30,
+                 sync_seconds=1.0, shared=None):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.sync_seconds = sync_seconds
+        self.shared = shared
+        self.failure_types = FAILURES.get(name, (Exception,))
+        self.state = CLOSED
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+        self._reset_window(self._bucket(time.time()))
+        self._unsynced_calls = 0
+        self._unsynced_failures = 0
+        self._probing = False
+        self._sync_started = False
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._sync_started = False
+
+    def _bucket(self, now):
+        return int(now // self.window_seconds)
+
+    def _reset_window(self, bucket):
+        self._window_bucket = bucket
+        self.calls = 0
+        self.failures = 0
+
+    def _count(self, now, failed):
+        bucket = self._bucket(now)
+        if bucket != self._window_bucket:
+            self._reset_window(bucket)
+        self.calls += 1
+        self._unsynced_calls += 1
+        if failed:
+            self.failures += 1
+            self._unsynced_failures += 1
+
+    def _tripped(self, calls, failures):
+        return calls >= self.min_calls and failures >= calls * self.failure_rate
+
+    def _open(self, now, until=None):
+        if self.state != OPEN:
+            logger.warning(f"Circuit {self.name} opened after {self.failures}/{self.calls} failures")
+        self.state = OPEN
+        self.open_until = until or now + self.open_seconds
+        self._probing = False
+
+    def retry_after(self):
+        return max(1, int(self.open_until - time.time()))
+
+    def allow(self):
+        """Whether a call may go out now; half-open lets one probe through per worker"""
+        if self.shared is not None and not self._sync_started:
+            self._start_sync_thread()
+
+        with self._lock:
+            if self.state == OPEN:
+                if time.time() < self.open_until:
+                    return False
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                logger.info(f"Circuit {self.name} closed after a successful probe")
+                self.state = CLOSED
+                self._reset_window(self._bucket(time.time()))
+            self._count(time.time(), failed=False)
+
+    def record_failure(self):
+        now = time.time()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._open(now)
+                return
+            self._count(now, failed=True)
+            if self.state == CLOSED and self._tripped(self.calls, self.failures):
+                self._open(now)
+
+    def record_exception(self, error):
+        if isinstance(error, self.failure_types):
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def call(self, function, *args, **kwargs):
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_after())
+        try:
+            result = function(*args, **kwargs)
+        except Exception as e:
+            self.record_exception(e)
+            raise
+        self.record_success()
+        return result
+
+    def _start_sync_thread(self):
+        with self._lock:
+            if self._sync_started:
+                return
+            self._sync_started = True
+        threading.Thread(target=self._sync_forever, name=f"breaker-{self.name}", daemon=True).start()
+
+    def _sync_forever(self):
+        while True:
+            time.sleep(self.sync_seconds)
+            try:
+                self.sync()
+            except redis.RedisError:
+                # Redis is itself guarded; local counting carries on until it is back
+                pass
+
+    def sync(self):
+        """Merge this worker's counts into the cluster window and adopt a cluster-wide trip"""
+        with self._lock:
+            bucket = self._window_bucket
+            calls, failures = self._unsynced_calls, self._unsynced_failures
+            self._unsynced_calls = self._unsynced_failures = 0
+
+        counts_key = f"breaker:{self.name}:{bucket}"
+        open_key = f"breaker:{self.name}:open_until"
+        pipe = self.shared.pipeline(transaction=False)
+        pipe.hincrby(counts_key, 'calls', calls)
+        pipe.hincrby(counts_key, 'failures', failures)
+        pipe.expire(counts_key, self.window_seconds * 2)
+        pipe.get(open_key)
+        try:
+            total_calls, total_failures, _, open_until = pipe.execute()
+        except redis.RedisError:
+            with self._lock:
+                self._unsynced_calls += calls
+                self._unsynced_failures += failures
+            raise
+
+        now = time.time()
+        open_until = float(open_until or 0)
+        with self._lock:
+            if self.state == CLOSED and open_until > now:
+                self._open(now, open_until)
+                return
+            if self.state == CLOSED and self._tripped(total_calls, total_failures):
+                self._open(now)
+            opened_here = self.state == OPEN and self.open_until > open_until
+            until = self.open_until
+        if opened_here:
+            self.shared.set(open_key, until, ex=self.open_seconds)
+
+    def status(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'calls': self.calls,
+                'failures': self.failures,
+                'retry_after': self.retry_after() if self.state == OPEN else 0,
+            }
+
+breakers = {}
+
+def get_breaker(name):
+    """The named breaker, or a default one when init_breakers has not configured it"""
+    breaker = breakers.get(name)
+    if breaker is None:
+        breaker = breakers.setdefault(name, CircuitBreaker(name))
+    return breaker
+
+def init_breakers(app):
+    """Create the configured breakers and apply each dependency's timeout"""
+    timeout = app.config['REDIS_TIMEOUT']
+    shared = redis.Redis.from_url(app.config['REDIS_URL'], socket_timeout=timeout, socket_connect_timeout=timeout,
+                                  retry=no_retry())
+    for name, options in app.config['CIRCUIT_BREAKERS'].items():
+        # Redis cannot coordinate its own breaker
+        breakers[name] = CircuitBreaker(name, shared=None if name == 'redis' else shared, **options)
+
+    stripe.default_http_client = stripe.RequestsClient(timeout=app.config['STRIPE_TIMEOUT'])
+
+class BreakerRedisCache(RedisCache):
+    """RedisCache that degrades to a no-op cache while Redis is failing
+
+    Every operation goes through the 'redis' breaker; when it is open, or a
+    call fails, reads miss and writes are dropped, so pages render uncached
+    instead of waiting on socket timeouts.
+    """
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        options = {'retry': no_retry(), **(config.get('CACHE_OPTIONS') or {})}
+        return super().factory(app, {**config, 'CACHE_OPTIONS': options}, args, kwargs)
+
+    def _guarded(self, method, default, *args, **kwargs):
+        try:
+            return get_breaker('redis').call(method, *args, **kwargs)
+        except CircuitOpenError:
+            return default
+        except redis.RedisError as e:
+            logger.warning(f"Cache {method.__name__} failed: {str(e)}")
+            return default
+
+    def get(self, key):
+        return self._guarded(super().get, None, key)
+
+    def get_many(self, *keys):
+        return self._guarded(super().get_many, [None] * len(keys), *keys)
+
+    def has(self, key):
+        return self._guarded(super().has, False, key)
+
+    def set(self, key, value, timeout=None):
+        return self._guarded(super().set, False, key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        return self._guarded(super().add, False, key, value, timeout)
+
+    def set_many(self, mapping, timeout=None):
+        return self._guarded(super().set_many, [], mapping, timeout)
+
+    def delete(self, key):
+        return self._guarded(super().delete, False, key)
+
+    def delete_many(self, *keys):
+        return self._guarded(super().delete_many, [], *keys)
+
+    def clear(self):
+        return self._guarded(super().clear, False)
+
+    def inc(self, key, delta=1):
+        return self._guarded(super().inc, None, key, delta)
+
+    def dec(self, key, delta=1):
+        return self._guarded(super().dec, None, key, delta)
+
+class _TimeoutConnection(Connection):
+    """Flask-Mail connection that gives up on a slow SMTP server after SMTP_TIMEOUT"""
+
+    def configure_host(self):
+        timeout = current_app.config['SMTP_TIMEOUT']
+        if self.mail.use_ssl:
+            host = smtplib.SMTP_SSL(self.mail.server, self.mail.port, timeout=timeout)
+        else:
+            host = smtplib.SMTP(self.mail.server, self.mail.port, timeout=timeout)
+
+        host.set_debuglevel(int(self.mail.debug))
+        if self.mail.use_tls:
+            host.starttls()
+        if self.mail.username and self.mail.password:
+            host.login(self.mail.username, self.mail.password)
+        return host
+
+class GuardedMail(Mail):
+    """Flask-Mail behind the 'smtp' breaker; mail that cannot go out now is queued in the outbox"""
+
+    def connect(self):
+        app = getattr(self, 'app', None) or current_app
+        return _TimeoutConnection(app.extensions['mail'])
+
+    def send(self, message):
+        # Queued on a separate session: sending mail must not commit or roll back the caller's work
+        from outbox import queue_email_independently
+
+        try:
+            get_breaker('smtp').call(super().send, message)
+        except CircuitOpenError:
+            queue_email_independently(message, last_error='SMTP circuit open')
+        except FAILURES['smtp'] as e:
+            current_app.logger.error(f"SMTP send failed, queued for retry: {str(e)}")
+            queue_email_independently(message, last_error=str(e))
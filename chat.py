@@ -0,0 +1,194 @@
+import os
+import gzip
+import json
+import bisect
+import redis
+from functools import lru_cache
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import text
+from app import db
+from models import LiveChat, ChatMessage
+from utils import get_redis
+
+def chat_channel(session_id):
+    """Get the pub/sub channel name for a chat session"""
+    return f"chat:{session_id}"
+
+def serialize_message(message):
+    """Convert a chat message to a JSON-safe dict"""
+    return {
+        'id': message.id,
+        'sender_type': message.sender_type,
+        'sender_name': message.sender_name,
+        'message': message.message,
+        'created_at': message.created_at.isoformat() if message.created_at else None
+    }
+
+def format_sse(data, event_id=None, event='message'):
+    """Format a payload as a server-sent event"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {data}")
+    return '\n'.join(lines) + '\n\n'
+
+def post_chat_message(chat, sender_type, message, sender_name=None):
+    """Store a chat message and publish it to every listening worker"""
+    chat_message = ChatMessage(
+        chat_id=chat.id,
+        sender_type=sender_type,
+        sender_name=sender_name,
+        message=message
+    )
+    db.session.add(chat_message)
+    db.session.commit()
+
+    payload = serialize_message(chat_message)
+    try:
+        get_redis().publish(chat_channel(chat.session_id), json.dumps(payload))
+    except redis.RedisError as e:
+        # The message is stored; listeners will pick it up on reconnect
+        current_app.logger.error(f"Chat publish error: {e}")
+
+    return chat_message
+
+def stream_chat_events(chat, last_event_id=None):
+    """Yield new messages for a chat as server-sent events"""
+    heartbeat = current_app.config.get('CHAT_HEARTBEAT_SECONDS', 15)
+    pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+    # Subscribe before replaying so nothing published in between is lost
+    pubsub.subscribe(chat_channel(chat.session_id))
+
+    try:
+        last_sent = last_event_id or 0
+
+        # Replay only what the client missed while disconnected
+        if last_event_id:
+            missed = ChatMessage.query.filter(
+                ChatMessage.chat_id == chat.id,
+                ChatMessage.id > last_event_id
+            ).order_by(ChatMessage.id.asc()).limit(
+                current_app.config.get('CHAT_REPLAY_LIMIT', 100)).all()
+            for message in missed:
+                last_sent = message.id
+                yield format_sse(json.dumps(serialize_message(message)), event_id=message.id)
+
+        # Release the DB connection while the stream sits idle
+        db.session.remove()
+
+        yield format_sse('{}', event='ready')
+
+        while True:
+            event = pubsub.get_message(timeout=heartbeat)
+            if event is None:
+                yield ': keep-alive\n\n'
+                continue
+
+            data = event['data']
+            if isinstance(data, bytes):
+                data = data.decode('utf-8')
+            message_id = json.loads(data).get('id', 0)
+            if message_id <= last_sent:
+                continue
+            last_sent = message_id
+            yield format_sse(data, event_id=message_id)
+    finally:
+        pubsub.close()
+
+def get_recent_messages(chat, limit=None, before_id=None):
+    """Get the page of chat history just before before_id, oldest message first"""
+    limit = limit or current_app.config.get('CHAT_PAGE_SIZE', 50)
+
+    if chat.archive_path:
+        return load_archived_messages(chat, limit, before_id)
+
+    query = ChatMessage.query.filter(ChatMessage.chat_id == chat.id)
+    if before_id:
+        query = query.filter(ChatMessage.id < before_id)
+
+    # Walk the (chat_id, id) index backwards so cost depends on page size only
+    messages = query.order_by(ChatMessage.id.desc()).limit(limit).all()
+    return [serialize_message(m) for m in reversed(messages)]
+
+@lru_cache(maxsize=32)
+def _read_archive(archive_path, mtime):
+    """All messages of one archive, oldest first; archives never change once written"""
+    with gzip.open(archive_path, 'rt', encoding='utf-8') as archive:
+        messages = [json.loads(line) for line in archive]
+    return messages, [message['id'] for message in messages]
+
+def load_archived_messages(chat, limit, before_id=None):
+    """Read one page of history from a chat's compressed archive"""
+    try:
+        messages, ids = _read_archive(chat.archive_path, os.path.getmtime(chat.archive_path))
+    except OSError as e:
+        current_app.logger.error(f"Chat archive read error for {chat.session_id}: {e}")
+        return []
+
+    end = bisect.bisect_left(ids, before_id) if before_id else len(ids)
+    return messages[max(0, end - limit):end]
+
+def archive_chat(chat, archive_folder):
+    """Compact a closed chat's messages into a gzipped JSON-lines file"""
+    month_folder = os.path.join(archive_folder, chat.closed_at.strftime('%Y%m'))
+    os.makedirs(month_folder, exist_ok=True)
+
+    archive_path = os.path.join(month_folder, f"chat_{chat.id}_{chat.session_id}.jsonl.gz")
+    tmp_path = archive_path + '.tmp'
+
+    query = ChatMessage.query.filter_by(chat_id=chat.id).order_by(ChatMessage.id.asc())
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as archive:
+        for message in query.yield_per(500):
+            archive.write(json.dumps(serialize_message(message)) + '\n')
+
+    # Only publish the file once it is complete
+    os.replace(tmp_path, archive_path)
+
+    chat.archive_path = archive_path
+    ChatMessage.query.filter_by(chat_id=chat.id).delete(synchronize_session=False)
+    db.session.commit()
+
+    return archive_path
+
+def archive_closed_chats(archive_folder=None, older_than_hours=None):
+    """Move messages of chats closed long enough ago out of the live table"""
+    archive_folder = archive_folder or current_app.config['CHAT_ARCHIVE_FOLDER']
+    if older_than_hours is None:
+        older_than_hours = current_app.config.get('CHAT_ARCHIVE_AFTER_HOURS', 24)
+    cutoff = datetime.utcnow() - timedelta(hours=older_than_hours)
+
+    chats = LiveChat.query.filter(
+        LiveChat.closed_at.isnot(None),
+        LiveChat.closed_at <= cutoff,
+        LiveChat.archive_path.is_(None)
+    ).order_by(LiveChat.id.asc()).all()
+
+    archived = 0
+    for chat in chats:
+        try:
+            archive_chat(chat, archive_folder)
+            archived += 1
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Chat archive error for {chat.session_id}: {e}")
+
+    return archived
+
+def upgrade_chat_schema():
+    """Add the archive column and history index to chat tables created before they existed"""
+    connection = db.session.connection()
+    dialect = connection.dialect.name
+
+    if dialect == 'postgresql':
+        connection.execute(text("ALTER TABLE live_chats ADD COLUMN IF NOT EXISTS archive_path VARCHAR(255)"))
+    elif dialect == 'sqlite':
+        existing = {row[1] for row in connection.execute(text("PRAGMA table_info(live_chats)"))}
+        if 'archive_path' not in existing:
+            connection.execute(text("ALTER TABLE live_chats ADD COLUMN archive_path VARCHAR(255)"))
+    else:
+        return False
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_chat_messages_chat_id_id ON chat_messages (chat_id, id)"))
+    db.session.commit()
+    return True
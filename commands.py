@@ -0,0 +1,257 @@
+import click
+
+def register_commands(app):
+    
+    @app.cli.command('archive-chats')
+    @click.option('--older-than-hours', type=int, default=None,
+                  help='Only archive chats closed at least this many hours ago.')
+    def archive_chats_command(older_than_hours):
+        """Compact closed chats into compressed archives."""
+        from chat import archive_closed_chats
+        
+        archived = archive_closed_chats(older_than_hours=older_than_hours)
+        click.echo(f"Archived {archived} closed chat(s).")
+    
+    @app.cli.command('upgrade-chat-schema')
+    def upgrade_chat_schema_command():
+        """Add the chat archive column and history index to an existing database."""
+        from chat import upgrade_chat_schema
+        
+        if upgrade_chat_schema():
+            click.echo("Chat tables are up to date.")
+        else:
+            click.echo("Unsupported database; add live_chats.archive_path by hand.", err=True)
+    
+    @app.cli.command('rebuild-facets')
+    def rebuild_facets_command():
+        """Recompute filter facet counts from the source tables."""
+        from facets import rebuild_facets
+        
+        rebuild_facets()
+        click.echo("Facet counts rebuilt.")
+    
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Re-index public content and the admin order search index."""
+        from search import rebuild_search_index, rebuild_order_search_index
+        
+        indexed = rebuild_search_index()
+        click.echo(f"Indexed {indexed} document(s).")
+        
+        indexed = rebuild_order_search_index()
+        click.echo(f"Indexed {indexed} order(s) for admin search.")
+    
+    @app.cli.command('enable-order-search')
+    def enable_order_search_command():
+        """Install pg_trgm and build the admin order trigram index (PostgreSQL, run as superuser once)."""
+        from search import enable_order_search
+        
+        if enable_order_search():
+            click.echo("Admin order search index created.")
+        else:
+            click.echo("Nothing to do; SQLite keeps its own order search index.")
+    
+    @app.cli.command('rollup-analytics')
+    @click.option('--batch-size', type=int, default=5000)
+    def rollup_analytics_command(batch_size):
+        """Fold new analytics events into hourly/daily rollups and the funnel."""
+        from rollups import update_rollups
+        
+        processed = update_rollups(batch_size=batch_size)
+        click.echo(f"Rolled up {processed} event(s).")
+    
+    @app.cli.command('partition-analytics')
+    def partition_analytics_command():
+        """Convert the analytics table to monthly partitions (PostgreSQL only)."""
+        from analytics_archive import partition_analytics_table
+        
+        if partition_analytics_table():
+            click.echo("Analytics table converted to monthly partitions.")
+        else:
+            click.echo("Analytics table is already partitioned.")
+    
+    @app.cli.command('analytics-retention')
+    @click.option('--keep-months', type=int, default=None)
+    def analytics_retention_command(keep_months):
+        """Export analytics months past retention to Arrow files and drop them."""
+        from analytics_archive import apply_retention
+        
+        for start, exported, path in apply_retention(keep_months=keep_months):
+            click.echo(f"{start:%Y-%m}: {exported} event(s) -> {path or 'nothing to export'}")
+    
+    @app.cli.command('upgrade-analytics-schema')
+    def upgrade_analytics_schema_command():
+        """Move event_data to native JSON, add sampling columns and backfill projected event columns."""
+        from events import upgrade_event_storage
+        
+        updated = upgrade_event_storage()
+        click.echo(f"Backfilled {updated} analytics event(s).")
+    
+    @app.cli.command('upgrade-orders-schema')
+    def upgrade_orders_schema_command():
+        """Add the assigned writer column used by bulk order actions."""
+        from order_actions import upgrade_order_schema
+        
+        if upgrade_order_schema():
+            click.echo("Orders table is up to date.")
+        else:
+            click.echo("Unsupported database; add orders.assigned_writer_id by hand.", err=True)
+    
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        """Fingerprint static CSS/JS and write precompressed .gz/.br copies."""
+        import os
+        from compression import build_assets
+        
+        output_folder = os.path.join(app.root_path, app.config['ASSETS_BUILD_FOLDER'])
+        manifest = build_assets(app.static_folder, output_folder)
+        click.echo(f"Built {len(manifest)} asset(s) into {output_folder}.")
+    
+    @app.cli.command('benchmark-first-request')
+    @click.option('--runs', type=int, default=5, help='Fresh apps built per path.')
+    @click.option('--no-warmup', is_flag=True, help='Disable template warmup to compare against.')
+    @click.argument('paths', nargs=-1)
+    def benchmark_first_request_command(runs, no_warmup, paths):
+        """Compare first-request latency of a fresh worker with warm requests."""
+        import os
+        from app import create_app
+        from templating import benchmark_first_request
+        
+        os.environ['TEMPLATE_WARMUP'] = '0' if no_warmup else '1'
+        results = benchmark_first_request(create_app, paths=list(paths) or None, runs=runs)
+        
+        click.echo(f"{'path':<30} {'cold p50':>10} {'cold p99':>10} {'warm p50':>10} {'warm p99':>10}")
+        for path, timings in results.items():
+            click.echo(f"{path:<30} {timings['cold_p50']:>8.1f}ms {timings['cold_p99']:>8.1f}ms "
+                       f"{timings['warm_p50']:>8.1f}ms {timings['warm_p99']:>8.1f}ms")
+    
+    @app.cli.command('seed-load-data')
+    @click.option('--orders', type=int, default=1000, help='Orders to generate; other tables scale with it.')
+    @click.option('--seed', type=int, default=42, help='Random seed, the same seed gives the same rows.')
+    @click.option('--days', type=int, default=180, help='Days of history to spread the data over.')
+    def seed_load_data_command(orders, seed, days):
+        """Bulk insert a deterministic synthetic dataset for load testing."""
+        from seed_data import generate_dataset
+        
+        counts = generate_dataset(orders=orders, seed=seed, days=days)
+        for table, count in counts.items():
+            click.echo(f"{table}: {count}")
+    
+    @app.cli.command('load-test')
+    @click.option('--base-url', default=None, help='Drive a running server over HTTP instead of in-process.')
+    @click.option('--flow', 'flows', multiple=True, type=click.Choice(['customer', 'browse', 'admin']),
+                  help='Flows to run (default: all).')
+    @click.option('--users', type=int, default=4, help='Concurrent virtual users.')
+    @click.option('--iterations', type=int, default=10, help='Times each user runs the flows.')
+    @click.option('--seed', type=int, default=42)
+    @click.option('--admin-username', default='admin')
+    @click.option('--admin-password', default='admin123')
+    def load_test_command(base_url, flows, users, iterations, seed, admin_username, admin_password):
+        """Run the customer, browse and admin flows and report latency per endpoint."""
+        from app import limiter
+        from loadtest import InProcessClient, HttpClient, RouteNotFound, build_context, run_load_test
+        
+        if base_url:
+            # The server needs RATELIMIT_ENABLED=0 or the order endpoints will answer 429
+            client_factory = lambda: HttpClient(base_url)
+        else:
+            app.config['WTF_CSRF_ENABLED'] = False
+            limiter.enabled = False
+            client_factory = lambda: InProcessClient(app)
+        
+        context = build_context(app, admin_username, admin_password)
+        try:
+            summary = run_load_test(client_factory, context, flows=flows or ('customer', 'browse', 'admin'),
+                                    users=users, iterations=iterations, seed=seed)
+        except RouteNotFound as e:
+            raise click.ClickException(f"Load test aborted: {e}")
+        
+        click.echo(f"{'endpoint':<24} {'reqs':>6} {'errs':>5} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+        for name, stats in summary.items():
+            click.echo(f"{name:<24} {stats['requests']:>6} {stats['errors']:>5} {stats['rps']:>8.1f} "
+                       f"{stats['p50_ms']:>7.1f}ms {stats['p95_ms']:>7.1f}ms {stats['p99_ms']:>7.1f}ms")
+    
+    @app.cli.command('benchmark-async')
+    @click.option('--order-id', type=int, default=None, help='Order to check out (default: the newest).')
+    @click.option('--latency-ms', type=int, default=200, help='Simulated Stripe API latency.')
+    @click.option('--users', type=int, default=20, help='Concurrent clients.')
+    @click.option('--requests', 'requests_per_user', type=int, default=5, help='Requests per client.')
+    def benchmark_async_command(order_id, latency_ms, users, requests_per_user):
+        """Compare checkout requests per worker under the sync app and the ASGI app."""
+        from models import Order
+        from loadtest import run_io_benchmark
+        
+        if order_id is None:
+            order = Order.query.order_by(Order.id.desc()).first()
+            if order is None:
+                raise click.ClickException('No orders to check out; run seed-load-data first.')
+            order_id = order.id
+        
+        results = run_io_benchmark(app, order_id, latency=latency_ms / 1000.0, users=users,
+                                   requests_per_user=requests_per_user)
+        
+        click.echo(f"{'mode':<6} {'reqs':>6} {'errs':>5} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+        for mode, stats in results.items():
+            click.echo(f"{mode:<6} {stats['requests']:>6} {stats['errors']:>5} {stats['rps']:>8.1f} "
+                       f"{stats['p50_ms']:>7.1f}ms {stats['p95_ms']:>7.1f}ms {stats['p99_ms']:>7.1f}ms")
+        if results['wsgi']['rps']:
+            click.echo(f"ASGI serves {results['asgi']['rps'] / results['wsgi']['rps']:.1f}x the requests per worker")
+    
+    @app.cli.command('bench-helpers')
+    @click.argument('names', nargs=-1)
+    @click.option('--save-baseline', 'store_baseline', is_flag=True, help='Store these timings as the new baseline.')
+    @click.option('--baseline', 'baseline_path', default=None,
+                  help='Baseline file, recorded on this machine from the base revision.')
+    @click.option('--max-regression', type=float, default=25.0,
+                  help='Fail when a helper is this many percent slower than its baseline.')
+    @click.option('--profile', 'profile_folder', default=None, help='Write a profile per benchmark to this folder.')
+    @click.option('--profiler', type=click.Choice(['cprofile', 'pyinstrument']), default='cprofile')
+    def bench_helpers_command(names, store_baseline, baseline_path, max_regression, profile_folder, profiler):
+        """Microbenchmark request-path helpers and gate on regressions."""
+        import os
+        from microbench import (BASELINE_FILE, BENCHMARKS, run_benchmarks, load_baseline, save_baseline,
+                                find_regressions)
+        
+        unknown = set(names) - set(BENCHMARKS)
+        if unknown:
+            raise click.BadParameter(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+        
+        baseline_path = baseline_path or os.path.join(app.root_path, BASELINE_FILE)
+        baseline = load_baseline(baseline_path)
+        results = run_benchmarks(app, names=list(names) or None, profile_folder=profile_folder, profiler=profiler)
+        
+        click.echo(f"{'helper':<32} {'median':>10} {'best':>10} {'baseline':>10}")
+        for name, timing in results.items():
+            before = baseline.get(name, {}).get('median_us')
+            before_text = f"{before:>8.2f}us" if before else f"{'-':>10}"
+            click.echo(f"{name:<32} {timing['median_us']:>8.2f}us {timing['min_us']:>8.2f}us {before_text}")
+        
+        if store_baseline:
+            save_baseline(baseline_path, {**baseline, **results})
+            click.echo(f"Baseline saved to {baseline_path}.")
+            return
+        
+        if not baseline:
+            # Passing with nothing to compare against would hide regressions
+            raise click.ClickException(
+                f"No baseline at {baseline_path}; record one on this machine with --save-baseline "
+                f"from the base revision first")
+        
+        regressions = find_regressions(results, baseline, max_regression)
+        for name, before, after, change in regressions:
+            click.echo(f"REGRESSION {name}: {before:.2f}us -> {after:.2f}us (+{change:.0f}%)", err=True)
+        if regressions:
+            raise SystemExit(1)
+    
+    @app.cli.command('send-outbox')
+    @click.option('--limit', type=int, default=100, help='Most emails to send in this run.')
+    def send_outbox_command(limit):
+        """Send emails queued while SMTP was failing; run from cron."""
+        from outbox import deliver_outbox
+        from breakers import get_breaker
+        
+        result = deliver_outbox(limit=limit)
+        click.echo(f"Sent {result['sent']} emails, {result['pending']} still pending "
+                   f"(smtp circuit {get_breaker('smtp').state}).")
+    
+    return app
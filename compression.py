@@ -0,0 +1,151 @@
+import os
+import gzip
+import json
+import hashlib
+import mimetypes
+from flask import request, current_app, send_from_directory, url_for, abort
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+MANIFEST_NAME = 'manifest.json'
+
+# Static file types worth fingerprinting and precompressing
+BUILD_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map'}
+
+def _negotiate_encoding():
+    """Pick the best encoding the client accepts that we can produce"""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+def _compress(data, encoding, level=None):
+    """Compress a body with gzip or brotli"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=level if level is not None else 5)
+    return gzip.compress(data, compresslevel=level if level is not None else 6, mtime=0)
+
+def compress_response(response):
+    """Compress dynamic HTML/JSON responses above the size threshold"""
+    config = current_app.config
+
+    if (response.status_code < 200 or response.status_code in (204, 206, 304)
+            or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in config['COMPRESS_MIMETYPES']):
+        return response
+
+    response.vary.add('Accept-Encoding')
+
+    data = response.get_data()
+    if len(data) < config['COMPRESS_MIN_SIZE']:
+        return response
+
+    encoding = _negotiate_encoding()
+    if not encoding:
+        return response
+
+    response.set_data(_compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+
+    # Each encoding is a different representation and needs its own strong ETag
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak=weak)
+
+    return response
+
+def build_assets(static_folder, output_folder):
+    """Write content-hashed copies of static files plus .gz/.br siblings"""
+    manifest = {}
+
+    for root, dirs, files in os.walk(static_folder):
+        # Never rebuild our own output
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != output_folder]
+
+        for filename in files:
+            name, ext = os.path.splitext(filename)
+            if ext not in BUILD_EXTENSIONS:
+                continue
+
+            source_path = os.path.join(root, filename)
+            relative_path = os.path.relpath(source_path, static_folder).replace(os.sep, '/')
+            with open(source_path, 'rb') as f:
+                data = f.read()
+
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            hashed_path = os.path.join(os.path.dirname(relative_path), f"{name}.{digest}{ext}").replace(os.sep, '/')
+            target_path = os.path.join(output_folder, hashed_path)
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+
+            with open(target_path, 'wb') as f:
+                f.write(data)
+            with open(target_path + '.gz', 'wb') as f:
+                f.write(_compress(data, 'gzip', level=9))
+            if brotli is not None:
+                with open(target_path + '.br', 'wb') as f:
+                    f.write(_compress(data, 'br', level=11))
+
+            manifest[relative_path] = hashed_path
+
+    os.makedirs(output_folder, exist_ok=True)
+    with open(os.path.join(output_folder, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return manifest
+
+def load_manifest(output_folder):
+    """Load the asset manifest written by build_assets, if any"""
+    try:
+        with open(os.path.join(output_folder, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def init_compression(app):
+    """Register response compression and fingerprinted static asset serving"""
+    output_folder = os.path.join(app.root_path, app.config['ASSETS_BUILD_FOLDER'])
+    app.extensions['asset_manifest'] = load_manifest(output_folder)
+
+    app.after_request(compress_response)
+
+    @app.context_processor
+    def asset_helpers():
+        def asset_url(filename):
+            """URL of the fingerprinted build of a static file, falling back to /static"""
+            hashed = current_app.extensions['asset_manifest'].get(filename)
+            if hashed:
+                return url_for('built_asset', filename=hashed)
+            return url_for('static', filename=filename)
+        return {'asset_url': asset_url}
+
+    @app.route('/assets/<path:filename>')
+    def built_asset(filename):
+        if filename.endswith(('.gz', '.br')) or filename == MANIFEST_NAME:
+            abort(404)
+
+        encoding = _negotiate_encoding()
+        served = filename
+        if encoding == 'br' and os.path.exists(os.path.join(output_folder, filename + '.br')):
+            served = filename + '.br'
+        elif encoding and os.path.exists(os.path.join(output_folder, filename + '.gz')):
+            encoding, served = 'gzip', filename + '.gz'
+        else:
+            encoding = None
+
+        response = send_from_directory(output_folder, served, max_age=31536000)
+        if encoding:
+            # Content type of the original file, not of the .gz/.br sibling
+            response.headers['Content-Encoding'] = encoding
+            response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response.vary.add('Accept-Encoding')
+        # The file name changes whenever its content does
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
+
+    return app
@@ -0,0 +1,210 @@
+import re
+import time
+import zlib
+import threading
+from sqlalchemy import func, literal_column, text
+from flask import current_app, request
+from app import db
+from models import Analytics
+
+class EventSchemaError(ValueError):
+    """Raised when an analytics payload does not match its registered schema"""
+
+# event type -> {field: type}; every field is optional
+EVENT_SCHEMAS = {
+    'page_view': {'page': str},
+    'order_started': {'service_id': int, 'service_tier': str},
+    'order_created': {'order_id': int},
+    'order_tracked': {'order_id': int},
+    'discount_applied': {'code': str},
+    'referral_sent': {'referral_code': str},
+    'newsletter_signup': {'email': str},
+    'templates_viewed': {},
+    'template_downloaded': {'template_id': int},
+    'user_action': {'action': str, 'details': object, 'timestamp': str},
+}
+
+# Fields copied into real, indexed Analytics columns
+PROJECTED_FIELDS = ('page', 'order_id', 'template_id')
+
+# JSON keys covered by an expression index (see models.Analytics)
+INDEXED_KEYS = ('code',)
+
+BOT_USER_AGENT_RE = re.compile(r'bot|crawl|spider|slurp|preview|monitor|headless|curl|wget|python-requests', re.I)
+
+class TTLSet:
+    """In-memory set whose members expire after a fixed number of seconds"""
+
+    def __init__(self, ttl, max_size=100000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._expiry = {}
+        self._lock = threading.Lock()
+
+    def add(self, key):
+        """Add a key, returning False if it was already present and unexpired"""
+        now = time.monotonic()
+        with self._lock:
+            expires = self._expiry.get(key)
+            if expires is not None and expires > now:
+                return False
+            if len(self._expiry) >= self.max_size:
+                self._purge(now)
+            self._expiry[key] = now + self.ttl
+            return True
+
+    def _purge(self, now):
+        """Drop expired keys, or the oldest half if everything is still live"""
+        self._expiry = {k: v for k, v in self._expiry.items() if v > now}
+        if len(self._expiry) >= self.max_size:
+            keep = sorted(self._expiry.items(), key=lambda item: item[1])[self.max_size // 2:]
+            self._expiry = dict(keep)
+
+_recent_page_views = None
+
+def _page_view_dedupe():
+    """Get the per-worker set of recently recorded page views"""
+    global _recent_page_views
+    ttl = current_app.config.get('ANALYTICS_DEDUPE_SECONDS', 30)
+    if _recent_page_views is None or _recent_page_views.ttl != ttl:
+        _recent_page_views = TTLSet(ttl)
+    return _recent_page_views
+
+def sample_weight(event_type, event_data, user_id):
+    """Decide whether to record an event, returning its weight or None to drop it
+
+    Sampling is keyed on the visitor id so a sampled visitor keeps a complete
+    trail. The weight (1 / rate) keeps rollups unbiased.
+    """
+    if current_app.config.get('ANALYTICS_SKIP_BOTS', True):
+        if BOT_USER_AGENT_RE.search(request.headers.get('User-Agent', '')):
+            return None
+
+    if event_type == 'page_view' and current_app.config.get('ANALYTICS_DEDUPE_SECONDS'):
+        if not _page_view_dedupe().add((user_id, event_data.get('page'))):
+            return None
+
+    rate = current_app.config.get('ANALYTICS_SAMPLE_RATES', {}).get(event_type, 1.0)
+    if rate >= 1.0:
+        return 1.0
+    if rate <= 0.0:
+        return None
+
+    bucket = zlib.crc32(f"{event_type}:{user_id}".encode('utf-8')) / 0xFFFFFFFF
+    if bucket >= rate:
+        return None
+    return 1.0 / rate
+
+def register_event_schema(event_type, fields):
+    """Register or replace the schema for an event type"""
+    EVENT_SCHEMAS[event_type] = dict(fields)
+
+def validate_event(event_type, event_data):
+    """Check and coerce an event payload against its schema"""
+    if event_type not in EVENT_SCHEMAS:
+        raise EventSchemaError(f"Unknown analytics event type: {event_type}")
+
+    if not event_data:
+        return {}
+    if not isinstance(event_data, dict):
+        raise EventSchemaError(f"{event_type} payload must be a dict")
+
+    schema = EVENT_SCHEMAS[event_type]
+    validated = {}
+    for key, value in event_data.items():
+        if key not in schema:
+            raise EventSchemaError(f"Unexpected field '{key}' for {event_type}")
+        expected = schema[key]
+        if value is None or expected is object or isinstance(value, expected):
+            validated[key] = value
+            continue
+        try:
+            validated[key] = expected(value)
+        except (TypeError, ValueError):
+            raise EventSchemaError(f"Field '{key}' for {event_type} must be {expected.__name__}")
+
+    return validated
+
+def project_event_fields(event_data):
+    """Pick the projected column values out of a validated payload"""
+    return {field: event_data.get(field) for field in PROJECTED_FIELDS if field in event_data}
+
+def event_key(key):
+    """SQL expression for a JSON key that matches its expression index"""
+    if key not in INDEXED_KEYS:
+        raise ValueError(f"'{key}' is not an indexed event key")
+    if db.engine.dialect.name == 'postgresql':
+        return Analytics.event_data.op('->>')(literal_column(f"'{key}'"))
+    return func.json_extract(Analytics.event_data, literal_column(f"'$.{key}'"))
+
+def upgrade_event_storage(batch_size=5000):
+    """Convert legacy JSON-string event rows, add sampling columns and backfill projected columns"""
+    connection = db.session.connection()
+    dialect = connection.dialect.name
+
+    if dialect == 'postgresql':
+        for table, column in (('analytics', 'event_data'), ('newsletter_subscribers', 'preferences')):
+            column_type = connection.execute(text(
+                "SELECT data_type FROM information_schema.columns "
+                "WHERE table_name = :table AND column_name = :column"
+            ), {'table': table, 'column': column}).scalar()
+            if column_type != 'jsonb':
+                connection.execute(text(
+                    f"ALTER TABLE {table} ALTER COLUMN {column} TYPE JSONB "
+                    f"USING CASE WHEN {column} IS NULL OR {column}::text = '' THEN NULL ELSE {column}::text::jsonb END"
+                ))
+        rollup_columns = {row[0] for row in connection.execute(text(
+            "SELECT column_name FROM information_schema.columns WHERE table_name = 'analytics_rollups'"
+        ))}
+        connection.execute(text(
+            "ALTER TABLE analytics ADD COLUMN IF NOT EXISTS sample_weight DOUBLE PRECISION NOT NULL DEFAULT 1.0"
+        ))
+        if 'weighted_count' not in rollup_columns:
+            connection.execute(text(
+                "ALTER TABLE analytics_rollups ADD COLUMN weighted_count DOUBLE PRECISION NOT NULL DEFAULT 0"
+            ))
+            connection.execute(text("UPDATE analytics_rollups SET weighted_count = count"))
+        for column, column_type in (('page', 'VARCHAR(50)'), ('order_id', 'INTEGER'), ('template_id', 'INTEGER')):
+            connection.execute(text(f"ALTER TABLE analytics ADD COLUMN IF NOT EXISTS {column} {column_type}"))
+            connection.execute(text(f"CREATE INDEX IF NOT EXISTS ix_analytics_{column} ON analytics ({column})"))
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_analytics_event_data_code ON analytics ((event_data ->> 'code'))"
+        ))
+        extract = {
+            'page': "event_data ->> 'page'",
+            'order_id': "(event_data ->> 'order_id')::integer",
+            'template_id': "(event_data ->> 'template_id')::integer",
+        }
+    elif dialect == 'sqlite':
+        existing = {row[1] for row in connection.execute(text("PRAGMA table_info(analytics)"))}
+        if 'sample_weight' not in existing:
+            connection.execute(text("ALTER TABLE analytics ADD COLUMN sample_weight FLOAT NOT NULL DEFAULT 1.0"))
+        rollup_columns = {row[1] for row in connection.execute(text("PRAGMA table_info(analytics_rollups)"))}
+        if 'weighted_count' not in rollup_columns:
+            connection.execute(text("ALTER TABLE analytics_rollups ADD COLUMN weighted_count FLOAT NOT NULL DEFAULT 0"))
+            # Rollups written before sampling counted every event at weight 1
+            connection.execute(text("UPDATE analytics_rollups SET weighted_count = count"))
+        for column, column_type in (('page', 'VARCHAR(50)'), ('order_id', 'INTEGER'), ('template_id', 'INTEGER')):
+            if column not in existing:
+                connection.execute(text(f"ALTER TABLE analytics ADD COLUMN {column} {column_type}"))
+            connection.execute(text(f"CREATE INDEX IF NOT EXISTS ix_analytics_{column} ON analytics ({column})"))
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_analytics_event_data_code ON analytics (json_extract(event_data, '$.code'))"
+        ))
+        extract = {field: f"json_extract(event_data, '$.{field}')" for field in PROJECTED_FIELDS}
+    else:
+        return 0
+
+    # Backfill in id ranges to keep each transaction short
+    max_id = connection.execute(text("SELECT max(id) FROM analytics")).scalar() or 0
+    assignments = ', '.join(f"{field} = {expression}" for field, expression in extract.items())
+    updated = 0
+    for start in range(0, max_id, batch_size):
+        result = db.session.execute(text(
+            f"UPDATE analytics SET {assignments} "
+            f"WHERE id > :start AND id <= :end AND event_data IS NOT NULL"
+        ), {'start': start, 'end': start + batch_size})
+        updated += result.rowcount
+        db.session.commit()
+
+    return updated
@@ -0,0 +1,146 @@
+from sqlalchemy import event, func, inspect, exists
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db
+from models import Testimonial, Portfolio, Template, FAQ, FacetCount
+
+# model name -> (model class, facet fields, visibility flag)
+# Only rows that are visible on the public pages are counted.
+FACETS = {
+    'testimonial': (Testimonial, ('industry', 'rating'), 'approved'),
+    'portfolio': (Portfolio, ('industry', 'job_level'), 'active'),
+    'template': (Template, ('category', 'industry', 'job_level'), 'active'),
+    'faq': (FAQ, ('category',), 'active'),
+}
+
+def _facet_key(value):
+    """Normalize a facet value for storage, None means not counted"""
+    if value is None or value == '':
+        return None
+    return str(value)
+
+def _previous_value(state, attr):
+    """Get an attribute's value as it was before the current flush"""
+    history = state.attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(state.object, attr)
+
+def _adjust_count(connection, model_name, field, value, delta):
+    """Add delta to a single facet counter, creating it when needed
+
+    Uses a single INSERT ... ON CONFLICT DO UPDATE so two writers creating
+    the same counter at once both succeed instead of one hitting the
+    unique constraint and aborting the surrounding flush.
+    """
+    table = FacetCount.__table__
+    if delta > 0 and connection.dialect.name in ('postgresql', 'sqlite'):
+        insert = pg_insert if connection.dialect.name == 'postgresql' else sqlite_insert
+        statement = insert(table).values(model=model_name, field=field, value=value, count=delta)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.model, table.c.field, table.c.value],
+            set_={'count': table.c.count + statement.excluded.count}
+        ))
+        return
+
+    result = connection.execute(
+        table.update()
+        .where(table.c.model == model_name, table.c.field == field, table.c.value == value)
+        .values(count=table.c.count + delta)
+    )
+    if result.rowcount == 0 and delta > 0:
+        connection.execute(table.insert().values(model=model_name, field=field, value=value, count=delta))
+
+def _make_listeners(model_name, fields, visible_attr):
+    """Build insert/update/delete listeners for one faceted model"""
+
+    def after_insert(mapper, connection, target):
+        if not getattr(target, visible_attr):
+            return
+        for field in fields:
+            value = _facet_key(getattr(target, field))
+            if value is not None:
+                _adjust_count(connection, model_name, field, value, 1)
+
+    def after_update(mapper, connection, target):
+        state = inspect(target)
+        was_visible = bool(_previous_value(state, visible_attr))
+        is_visible = bool(getattr(target, visible_attr))
+
+        for field in fields:
+            old_value = _facet_key(_previous_value(state, field)) if was_visible else None
+            new_value = _facet_key(getattr(target, field)) if is_visible else None
+            if old_value == new_value:
+                continue
+            if old_value is not None:
+                _adjust_count(connection, model_name, field, old_value, -1)
+            if new_value is not None:
+                _adjust_count(connection, model_name, field, new_value, 1)
+
+    def after_delete(mapper, connection, target):
+        state = inspect(target)
+        if not _previous_value(state, visible_attr):
+            return
+        for field in fields:
+            value = _facet_key(_previous_value(state, field))
+            if value is not None:
+                _adjust_count(connection, model_name, field, value, -1)
+
+    return after_insert, after_update, after_delete
+
+_listeners_registered = False
+
+def register_facet_listeners():
+    """Keep facet counts in sync with ORM inserts, updates and deletes"""
+    global _listeners_registered
+    if _listeners_registered:
+        return
+    _listeners_registered = True
+
+    for model_name, (model, fields, visible_attr) in FACETS.items():
+        after_insert, after_update, after_delete = _make_listeners(model_name, fields, visible_attr)
+        event.listen(model, 'after_insert', after_insert)
+        event.listen(model, 'after_update', after_update)
+        event.listen(model, 'after_delete', after_delete)
+
+def get_facet_counts(model_name, field):
+    """Get (value, count) pairs for a facet, most common first"""
+    rows = db.session.query(FacetCount.value, FacetCount.count).filter(
+        FacetCount.model == model_name,
+        FacetCount.field == field,
+        FacetCount.count > 0
+    ).order_by(FacetCount.count.desc(), FacetCount.value.asc()).all()
+    return [(row.value, row.count) for row in rows]
+
+def rebuild_facets():
+    """Recompute every facet counter from the source tables"""
+    FacetCount.query.delete()
+
+    for model_name, (model, fields, visible_attr) in FACETS.items():
+        for field in fields:
+            column = getattr(model, field)
+            rows = db.session.query(column, func.count(model.id)).filter(
+                getattr(model, visible_attr) == True,
+                column.isnot(None)
+            ).group_by(column).all()
+
+            for value, count in rows:
+                value = _facet_key(value)
+                if value is not None:
+                    db.session.add(FacetCount(model=model_name, field=field, value=value, count=count))
+
+    db.session.commit()
+
+def backfill_facets():
+    """Build the facet counters once on databases that predate them
+
+    Returns True when a rebuild ran. Counters are only missing when the
+    table is empty while some faceted row is visible.
+    """
+    if db.session.query(exists().where(FacetCount.id.isnot(None))).scalar():
+        return False
+    for model, _, visible_attr in FACETS.values():
+        if db.session.query(exists().where(getattr(model, visible_attr) == True)).scalar():
+            rebuild_facets()
+            return True
+    return False
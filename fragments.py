@@ -0,0 +1,62 @@
+from jinja2 import nodes
+from jinja2.ext import Extension
+from flask import current_app
+from app import db, cache
+from versions import get_table_versions, bump_version
+
+class FragmentCacheExtension(Extension):
+    """Cache a rendered template region until one of its tags changes
+
+        {% cache 'home-faqs', ['faqs'] %} ... {% endcache %}
+
+    Tags are table names (or custom tags bumped with invalidate_tag); the
+    cache key embeds their current versions, so any write to a tagged
+    table makes every fragment tagged with it miss on the next render.
+    """
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(()))
+
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render_fragment', args), [], [], body).set_lineno(lineno)
+
+    def _render_fragment(self, key, tags, caller):
+        if not current_app.config.get('FRAGMENT_CACHE_ENABLED', True):
+            return caller()
+
+        try:
+            cache_key = fragment_cache_key(key, tags)
+            fragment = cache.get(cache_key)
+        except Exception as e:
+            current_app.logger.error(f"Fragment cache lookup failed for {key}: {str(e)}")
+            return caller()
+
+        if fragment is None:
+            fragment = caller()
+            try:
+                cache.set(cache_key, fragment, timeout=current_app.config['FRAGMENT_CACHE_TIMEOUT'])
+            except Exception as e:
+                current_app.logger.error(f"Fragment cache store failed for {key}: {str(e)}")
+
+        return fragment
+
+def fragment_cache_key(key, tags):
+    """Build a fragment cache key from its name and the versions of its tags"""
+    if isinstance(key, (list, tuple)):
+        key = '/'.join(str(part) for part in key)
+    tags = (tags,) if isinstance(tags, str) else tuple(sorted(tags or ()))
+
+    versions = get_table_versions(tags) if tags else {}
+    stamp = '.'.join(f"{tag}{versions.get(tag, (0, None))[0]}" for tag in tags)
+    return f"fragment/{key}/{stamp}"
+
+def invalidate_tag(tag):
+    """Expire every fragment carrying a custom tag"""
+    bump_version(db.session.connection(), tag)
+    db.session.commit()
@@ -0,0 +1,8 @@
+# Loaded automatically by gunicorn from the working directory
+
+def post_worker_init(worker):
+    """Start per-worker services once the app is loaded in the worker's main thread"""
+    from profiler import start_profiler_listener
+    # Under uvicorn workers (asgi:app) the Flask app sits behind the ASGI wrapper
+    app = getattr(getattr(worker.wsgi, 'state', None), 'flask_app', worker.wsgi)
+    start_profiler_listener(app)
@@ -0,0 +1,302 @@
+import re
+import json
+import time
+import uuid
+import socket
+import random
+import statistics
+import threading
+import http.server
+import http.cookiejar
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import make_server, WSGIRequestHandler
+
+CSRF_TOKEN_RE = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+CHECKOUT_RE = re.compile(r'/create-checkout-session/(\d+)')
+
+class RouteNotFound(Exception):
+    """A flow requested a path the app does not serve"""
+
+class InProcessClient:
+    """Drive the app through the Flask test client"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data, follow_redirects=False)
+        return response.status_code, response.get_data(as_text=True), response.headers.get('Location', '')
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+class HttpClient:
+    """Drive a running server (e.g. gunicorn) over HTTP with its own cookie jar"""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect()
+        )
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode('utf-8') if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(req, timeout=self.timeout) as response:
+                return response.status, response.read().decode('utf-8', 'replace'), response.headers.get('Location', '')
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode('utf-8', 'replace'), e.headers.get('Location', '')
+
+class Recorder:
+    """Collect latency samples per endpoint across virtual users"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def timed(self, client, name, method, path, data=None, expect=(200,)):
+        started = time.perf_counter()
+        try:
+            status, body, location = client.request(method, path, data)
+        except OSError:
+            status, body, location = 0, '', ''
+        elapsed = (time.perf_counter() - started) * 1000
+
+        # A missing route means the flow is out of date, not that the app is
+        # slow; stop the run instead of timing 404 pages
+        if status == 404 and 404 not in expect:
+            raise RouteNotFound(f"{method} {path} ({name}) returned 404")
+
+        with self._lock:
+            self.samples[name].append(elapsed)
+            if status not in expect:
+                self.errors[name] += 1
+        return status, body, location
+
+def _percentile(samples, percentile):
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(percentile / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def _csrf_token(body):
+    match = CSRF_TOKEN_RE.search(body)
+    return match.group(1) if match else ''
+
+def customer_flow(client, recorder, rng, context):
+    """index -> order -> submit_order -> payment_success -> track_order"""
+    recorder.timed(client, 'index', 'GET', '/')
+    _, body, _ = recorder.timed(client, 'order', 'GET', '/order')
+
+    email = f"load{rng.randrange(10 ** 9)}@example.com"
+    _, _, location = recorder.timed(client, 'submit_order', 'POST', '/submit-order', data={
+        'csrf_token': _csrf_token(body),
+        'first_name': 'Load',
+        'last_name': 'Tester',
+        'email': email,
+        'service_id': rng.choice(context['service_ids']),
+        'service_tier': rng.choice(('basic', 'standard', 'premium')),
+        'target_position': 'Software Engineer',
+        'industry': 'Technology',
+        'experience_years': rng.randrange(1, 20),
+        'career_goals': 'Land a senior role at a product company.',
+    }, expect=(302, 303))
+
+    match = CHECKOUT_RE.search(location)
+    if not match:
+        return
+    order_id = int(match.group(1))
+
+    # Stand-in for the Stripe checkout redirect
+    session_id = context['mark_checkout'](order_id)
+    recorder.timed(client, 'payment_success', 'GET', f"/payment-success?session_id={session_id}")
+    recorder.timed(client, 'track_order', 'GET', f"/track-order?order_id={order_id}&email={urllib.parse.quote(email)}")
+
+def browse_flow(client, recorder, rng, context):
+    """Content pages a visitor reads before ordering"""
+    for name, path in (('testimonials', '/testimonials'), ('faq', '/faq'),
+                       ('search', f"/search?q={rng.choice(('resume', 'cover letter', 'interview'))}")):
+        recorder.timed(client, name, 'GET', urllib.parse.quote(path, safe='/?=&'))
+
+def admin_flow(client, recorder, rng, context):
+    """Log in, then page through the dashboard, an order, search and reports"""
+    _, body, _ = recorder.timed(client, 'admin_login_form', 'GET', '/admin/login', expect=(200, 302))
+    recorder.timed(client, 'admin_login', 'POST', '/admin/login', data={
+        'csrf_token': _csrf_token(body),
+        'username': context['admin_username'],
+        'password': context['admin_password'],
+    }, expect=(302, 303))
+
+    recorder.timed(client, 'admin_dashboard', 'GET', f"/admin?page={rng.randrange(1, 5)}")
+    if context['order_ids']:
+        recorder.timed(client, 'admin_order_detail', 'GET', f"/admin/order/{rng.choice(context['order_ids'])}")
+    recorder.timed(client, 'admin_order_search', 'GET', f"/admin/orders/search?q={rng.choice(('smi', 'eng', 'tech'))}")
+    recorder.timed(client, 'admin_analytics_funnel', 'GET', '/admin/analytics/funnel?days=30')
+
+def build_context(app, admin_username, admin_password, sample_size=200):
+    """Ids and credentials the flows need, read once before the run"""
+    from app import db
+    from models import Service, Order
+
+    with app.app_context():
+        service_ids = [row.id for row in db.session.query(Service.id).filter_by(active=True)]
+        order_ids = [row.id for row in db.session.query(Order.id).order_by(Order.id.desc()).limit(sample_size)]
+
+    def mark_checkout(order_id):
+        # Record the checkout session Stripe would have created, so payment_success finds the order
+        session_id = f"cs_load_{order_id}"
+        with app.app_context():
+            db.session.query(Order).filter_by(id=order_id).update({'stripe_session_id': session_id})
+            db.session.commit()
+        return session_id
+
+    return {
+        'service_ids': service_ids,
+        'order_ids': order_ids,
+        'admin_username': admin_username,
+        'admin_password': admin_password,
+        'mark_checkout': mark_checkout,
+    }
+
+FLOWS = {
+    'customer': customer_flow,
+    'browse': browse_flow,
+    'admin': admin_flow,
+}
+
+def run_load_test(client_factory, context, flows=('customer', 'browse', 'admin'), users=4, iterations=10, seed=42):
+    """Run each virtual user through the flows and summarize per endpoint
+
+    Every user gets its own client (and so its own cookies) and its own
+    seeded random generator, so a run is repeatable for a given seed.
+    """
+    recorder = Recorder()
+
+    def virtual_user(number):
+        rng = random.Random(seed * 1000 + number)
+        client = client_factory()
+        for _ in range(iterations):
+            for flow in flows:
+                FLOWS[flow](client, recorder, rng, context)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        for future in [pool.submit(virtual_user, number) for number in range(users)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    return summarize(recorder, elapsed)
+
+def summarize(recorder, elapsed):
+    """Latency percentiles and throughput for every endpoint"""
+    summary = {}
+    for name, samples in sorted(recorder.samples.items()):
+        summary[name] = {
+            'requests': len(samples),
+            'errors': recorder.errors[name],
+            'rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+            'p50_ms': round(statistics.median(samples), 2),
+            'p95_ms': round(_percentile(samples, 95), 2),
+            'p99_ms': round(_percentile(samples, 99), 2),
+            'max_ms': round(max(samples), 2),
+        }
+    return summary
+
+class _FakeStripeHandler(http.server.BaseHTTPRequestHandler):
+    """Answers checkout session creates like the Stripe API, after a fixed delay"""
+
+    latency = 0.2
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.latency)
+        session_id = f"cs_bench_{uuid.uuid4().hex[:16]}"
+        body = json.dumps({
+            'id': session_id,
+            'object': 'checkout.session',
+            'url': f"https://checkout.stripe.test/{session_id}",
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class _QuietWSGIHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+def _start_thread(target, **kwargs):
+    thread = threading.Thread(target=target, kwargs=kwargs, daemon=True)
+    thread.start()
+    return thread
+
+def _hammer(base_url, path, users, requests_per_user):
+    recorder = Recorder()
+
+    def virtual_user(number):
+        client = HttpClient(base_url)
+        for _ in range(requests_per_user):
+            recorder.timed(client, 'checkout', 'GET', path, expect=(303,))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        for future in [pool.submit(virtual_user, number) for number in range(users)]:
+            future.result()
+    return summarize(recorder, time.perf_counter() - started)['checkout']
+
+def run_io_benchmark(flask_app, order_id, latency=0.2, users=20, requests_per_user=5):
+    """Checkout throughput of one sync worker vs one ASGI worker against a slow Stripe
+
+    A local stand-in for the Stripe API answers after `latency` seconds.
+    The sync app is served by a single-threaded WSGI server (one sync
+    gunicorn worker); the ASGI app by a single uvicorn event loop.
+    """
+    import stripe
+    import uvicorn
+    from asgi import create_asgi_app
+
+    _FakeStripeHandler.latency = latency
+    fake_stripe = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _FakeStripeHandler)
+    _start_thread(fake_stripe.serve_forever)
+    original_api_base, original_key = stripe.api_base, flask_app.config.get('STRIPE_SECRET_KEY')
+    stripe.api_base = f"http://127.0.0.1:{fake_stripe.server_address[1]}"
+    flask_app.config['STRIPE_SECRET_KEY'] = 'sk_test_benchmark'
+    path = f"/create-checkout-session/{order_id}"
+    results = {}
+
+    try:
+        wsgi_server = make_server('127.0.0.1', 0, flask_app, handler_class=_QuietWSGIHandler)
+        _start_thread(wsgi_server.serve_forever)
+        try:
+            results['wsgi'] = _hammer(f"http://127.0.0.1:{wsgi_server.server_port}", path, users, requests_per_user)
+        finally:
+            wsgi_server.shutdown()
+
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        asgi_server = uvicorn.Server(uvicorn.Config(create_asgi_app(flask_app), log_level='warning'))
+        thread = _start_thread(asgi_server.run, sockets=[sock])
+        while not asgi_server.started:
+            time.sleep(0.05)
+        try:
+            results['asgi'] = _hammer(f"http://127.0.0.1:{sock.getsockname()[1]}", path, users, requests_per_user)
+        finally:
+            asgi_server.should_exit = True
+            thread.join()
+    finally:
+        fake_stripe.shutdown()
+        stripe.api_base = original_api_base
+        flask_app.config['STRIPE_SECRET_KEY'] = original_key
+
+    return results
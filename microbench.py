@@ -0,0 +1,152 @@
+import os
+import io
+import json
+import time
+import pstats
+import cProfile
+import statistics
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from models import DiscountCode
+from utils import (validate_discount_code, calculate_estimated_delivery, get_service_features_list,
+                   generate_seo_friendly_slug, is_mobile_device, generate_order_tracking_code, format_price)
+
+# Timings only compare on the machine that recorded them, so the baseline is
+# not committed. The CI job that enforces the gate records it first from the
+# base revision on the same runner:
+#   git worktree add /tmp/bench-base $BASE_SHA
+#   (cd /tmp/bench-base && flask bench-helpers --save-baseline --baseline /tmp/baseline.json)
+#   flask bench-helpers --baseline /tmp/baseline.json
+BASELINE_FILE = 'microbench_baseline.json'
+
+MOBILE_USER_AGENT = ('Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15 '
+                     '(KHTML, like Gecko) Version/17.5 Mobile/15E148 Safari/604.1')
+
+BENCHMARK_DISCOUNT_CODE = 'BENCHMARK10'
+
+# name -> zero-argument callable; all run inside a request context
+BENCHMARKS = {
+    'validate_discount_code': lambda: validate_discount_code(BENCHMARK_DISCOUNT_CODE, 199.0),
+    'calculate_estimated_delivery': lambda: calculate_estimated_delivery('standard'),
+    'get_service_features_list': lambda: get_service_features_list(
+        'Professional Resume, ATS-Optimized Format, Cover Letter, LinkedIn Profile, 2 Revision Rounds'),
+    'generate_seo_friendly_slug': lambda: generate_seo_friendly_slug(
+        'Senior Software Engineer -- Resume & Cover Letter (2025 Edition)!'),
+    'is_mobile_device': is_mobile_device,
+    'generate_order_tracking_code': generate_order_tracking_code,
+    'format_price': lambda: format_price(1234.5),
+}
+
+def _add_benchmark_discount():
+    """Flush (never commit) the discount code validate_discount_code looks up"""
+    now = datetime.utcnow()
+    db.session.add(DiscountCode(
+        code=BENCHMARK_DISCOUNT_CODE,
+        description='Microbenchmark discount',
+        discount_type='percentage',
+        discount_value=10,
+        minimum_order=0,
+        valid_from=now - timedelta(days=1),
+        valid_until=now + timedelta(days=1),
+        active=True
+    ))
+    db.session.flush()
+
+def _time_function(function, min_time=0.2, repeat=5):
+    """Best-of and median seconds per call, calibrated like timeit.autorange"""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            function()
+        if time.perf_counter() - started >= min_time / repeat:
+            break
+        number *= 2
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - started) / number)
+
+    return {'min_us': min(timings) * 1e6, 'median_us': statistics.median(timings) * 1e6, 'calls': number * repeat}
+
+def run_benchmarks(app, names=None, profile_folder=None, profiler='cprofile'):
+    """Time each helper, optionally writing a profile per benchmark
+
+    Everything runs in one request context with a mobile User-Agent; the
+    benchmark discount code is rolled back afterwards.
+    """
+    names = names or sorted(BENCHMARKS)
+    results = {}
+
+    with app.test_request_context('/', headers={'User-Agent': MOBILE_USER_AGENT}):
+        _add_benchmark_discount()
+        try:
+            for name in names:
+                function = BENCHMARKS[name]
+                if profile_folder:
+                    profile_benchmark(name, function, profile_folder, profiler)
+                results[name] = _time_function(function)
+        finally:
+            db.session.rollback()
+
+    return results
+
+def profile_benchmark(name, function, profile_folder, profiler='cprofile', calls=2000):
+    """Dump a cProfile (.prof) or pyinstrument (.html) profile of one benchmark"""
+    os.makedirs(profile_folder, exist_ok=True)
+
+    if profiler == 'pyinstrument':
+        from pyinstrument import Profiler
+
+        profile = Profiler()
+        profile.start()
+        for _ in range(calls):
+            function()
+        profile.stop()
+        path = os.path.join(profile_folder, f"{name}.html")
+        with open(path, 'w') as f:
+            f.write(profile.output_html())
+        return path
+
+    profile = cProfile.Profile()
+    profile.enable()
+    for _ in range(calls):
+        function()
+    profile.disable()
+    path = os.path.join(profile_folder, f"{name}.prof")
+    profile.dump_stats(path)
+
+    summary = io.StringIO()
+    pstats.Stats(profile, stream=summary).sort_stats('cumulative').print_stats(15)
+    current_app.logger.info(f"Profile for {name} written to {path}\n{summary.getvalue()}")
+    return path
+
+def load_baseline(path):
+    """Load saved baseline timings, empty when none were saved yet"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_baseline(path, results):
+    with open(path, 'w') as f:
+        json.dump({name: {'median_us': round(timing['median_us'], 3)} for name, timing in results.items()},
+                  f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def find_regressions(results, baseline, max_regression_pct):
+    """List (name, baseline us, current us, % slower) for helpers over the threshold"""
+    regressions = []
+    for name, timing in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]['median_us']
+        change = (timing['median_us'] - before) / before * 100 if before else 0.0
+        if change > max_regression_pct:
+            regressions.append((name, before, timing['median_us'], change))
+    return regressions
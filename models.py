@@ -126,10 +126,13 @@ class ContactMessage(db.Model):
 from datetime import datetime
 from app import db
 from flask_login import UserMixin
-from sqlalchemy import func, Index
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import func, Index, UniqueConstraint, DDL, event
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 import uuid
 
+# Native JSON storage (JSONB on PostgreSQL, JSON text on SQLite)
+JSONType = db.JSON().with_variant(JSONB(), 'postgresql')
+
 class Admin(UserMixin, db.Model):
     __tablename__ = 'admins'
     
@@ -208,9 +211,11 @@ class Order(db.Model):
     
     # Admin notes
     admin_notes = db.Column(db.Text)
+    assigned_writer_id = db.Column(db.Integer, db.ForeignKey('admins.id'), index=True)
     
     # New relationships
     tracking_updates = db.relationship('OrderTracking', backref='order', lazy=True, cascade='all, delete-orphan')
+    assigned_writer = db.relationship('Admin', foreign_keys=[assigned_writer_id])
     discount_applied = db.relationship('OrderDiscount', backref='order', uselist=False, cascade='all, delete-orphan')
     
     def __repr__(self):
@@ -419,7 +424,7 @@ class NewsletterSubscriber(db.Model):
     name = db.Column(db.String(100))
     subscribed_at = db.Column(db.DateTime, default=func.now())
     active = db.Column(db.Boolean, default=True)
-    preferences = db.Column(db.String(200))  # JSON string of preferences
+    preferences = db.Column(JSONType)  # dict of newsletter preferences
     
     def __repr__(self):
         return f'<NewsletterSubscriber {self.email}>'
@@ -435,6 +440,7 @@ class LiveChat(db.Model):
     admin_id = db.Column(db.Integer, db.ForeignKey('admins.id'))
     created_at = db.Column(db.DateTime, default=func.now())
     closed_at = db.Column(db.DateTime)
+    archive_path = db.Column(db.String(255))  # compressed history once closed and archived
     
     # Relationship to messages
     messages = db.relationship('ChatMessage', backref='chat', lazy=True, cascade='all, delete-orphan')
@@ -444,6 +450,9 @@ class LiveChat(db.Model):
 
 class ChatMessage(db.Model):
     __tablename__ = 'chat_messages'
+    __table_args__ = (
+        Index('ix_chat_messages_chat_id_id', 'chat_id', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     chat_id = db.Column(db.Integer, db.ForeignKey('live_chats.id'), nullable=False)
@@ -473,14 +482,119 @@ class Analytics(db.Model):
     __tablename__ = 'analytics'
     
     id = db.Column(db.Integer, primary_key=True)
-    event_type = db.Column(db.String(50), nullable=False)  # page_view, order_started, etc.
-    event_data = db.Column(db.Text)  # JSON string
+    event_type = db.Column(db.String(50), nullable=False, index=True)  # page_view, order_started, etc.
+    event_data = db.Column(JSONType)  # validated against events.EVENT_SCHEMAS
     user_id = db.Column(db.String(100))  # session ID or user identifier
     ip_address = db.Column(db.String(45))
     user_agent = db.Column(db.String(255))
     referrer = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=func.now())
+    sample_weight = db.Column(db.Float, nullable=False, default=1.0)  # 1 / sampling rate
+    
+    # Known event fields projected out of event_data at write time
+    page = db.Column(db.String(50), index=True)
+    order_id = db.Column(db.Integer, index=True)
+    template_id = db.Column(db.Integer, index=True)
     
     def __repr__(self):
         return f'<Analytics {self.event_type} at {self.created_at}>'
+
+# Expression indexes on JSON keys that are filtered on but not projected
+event.listen(Analytics.__table__, 'after_create', DDL(
+    "CREATE INDEX IF NOT EXISTS ix_analytics_event_data_code ON analytics ((event_data ->> 'code'))"
+).execute_if(dialect='postgresql'))
+event.listen(Analytics.__table__, 'after_create', DDL(
+    "CREATE INDEX IF NOT EXISTS ix_analytics_event_data_code ON analytics (json_extract(event_data, '$.code'))"
+).execute_if(dialect='sqlite'))
+
+class AnalyticsRollup(db.Model):
+    __tablename__ = 'analytics_rollups'
+    __table_args__ = (
+        UniqueConstraint('granularity', 'bucket_start', 'event_type', 'page', name='uq_analytics_rollups_bucket'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False)  # hour, day
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    event_type = db.Column(db.String(50), nullable=False)
+    page = db.Column(db.String(50), nullable=False, default='')  # '' for events without a page
+    count = db.Column(db.Integer, nullable=False, default=0)  # events actually stored
+    weighted_count = db.Column(db.Float, nullable=False, default=0)  # estimated events, sampling undone
+    
+    def __repr__(self):
+        return f'<AnalyticsRollup {self.granularity} {self.bucket_start} {self.event_type}: {self.count}>'
+
+class RollupCheckpoint(db.Model):
+    __tablename__ = 'rollup_checkpoints'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)  # highest Analytics.id rolled up
+    updated_at = db.Column(db.DateTime, default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f'<RollupCheckpoint {self.name} at {self.last_id}>'
+
+class FunnelDaily(db.Model):
+    __tablename__ = 'funnel_daily'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, unique=True, nullable=False)
+    order_page_views = db.Column(db.Integer, nullable=False, default=0)
+    orders_started = db.Column(db.Integer, nullable=False, default=0)
+    orders_created = db.Column(db.Integer, nullable=False, default=0)
+    orders_paid = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f'<FunnelDaily {self.day}>'
+
+class FacetCount(db.Model):
+    __tablename__ = 'facet_counts'
+    __table_args__ = (
+        UniqueConstraint('model', 'field', 'value', name='uq_facet_counts_model_field_value'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    model = db.Column(db.String(50), nullable=False)  # testimonial, portfolio, template, faq
+    field = db.Column(db.String(50), nullable=False)  # industry, rating, category, job_level
+    value = db.Column(db.String(100), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<FacetCount {self.model}.{self.field}={self.value}: {self.count}>'
+
+class TableVersion(db.Model):
+    __tablename__ = 'table_versions'
+    
+    table_name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)  # bumped on every write to the table
+    updated_at = db.Column(db.DateTime, nullable=False, default=func.now())
+    
+    def __repr__(self):
+        return f'<TableVersion {self.table_name} v{self.version}>'
+
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(255), nullable=False)
+    sender = db.Column(db.String(255))
+    recipients = db.Column(JSONType, nullable=False)  # list of addresses
+    cc = db.Column(JSONType)
+    bcc = db.Column(JSONType)
+    reply_to = db.Column(db.String(255))
+    body = db.Column(db.Text)
+    html = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # compared with utcnow()
+    created_at = db.Column(db.DateTime, default=func.now())
+    sent_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<EmailOutbox {self.id} {self.status}: {self.subject}>'
 >>>>>>> ded7f2e4447248a018f7dd7d09de9c43eb09fa0d
@@ -0,0 +1,158 @@
+from datetime import datetime
+from flask_mail import Message
+from sqlalchemy import case, insert, text, update
+from sqlalchemy.orm import joinedload
+from app import db
+from models import Admin, Order, OrderTracking
+from outbox import queue_emails
+
+ORDER_STATUSES = ('pending', 'in_progress', 'completed', 'cancelled')
+BULK_ACTIONS = ('set_status', 'assign_writer', 'add_note')
+MAX_BULK_ORDERS = 500
+MAX_NOTE_LENGTH = 1000
+
+STATUS_MESSAGES = {
+    'in_progress': 'Our team has started working on your order.',
+    'completed': 'Your order has been completed! Please check your email for the final documents.',
+    'cancelled': 'Your order has been cancelled. If you have any questions, please contact us.'
+}
+
+class BulkActionError(ValueError):
+    """A bulk request that cannot be applied as given"""
+
+def status_update_message(order, status):
+    """The customer email announcing an order's new status"""
+    msg = Message(
+        subject=f'Order Update - #{order.id} Status Changed',
+        recipients=[order.email]
+    )
+
+    msg.body = f"""
+Dear {order.full_name},
+
+Your order status has been updated.
+
+Order Details:
+- Order ID: #{order.id}
+- Service: {order.service.name} - {order.service_tier.title()}
+- New Status: {status.replace('_', ' ').title()}
+
+{STATUS_MESSAGES.get(status, 'Your order status has been updated.')}
+
+Best regards,
+The CreateProResume Team
+"""
+    return msg
+
+def _tracking_row(order, status, description, admin, notified=False):
+    return {
+        'order_id': order.id,
+        'status': status,
+        'description': description[:255],
+        'created_by': admin.username,
+        'customer_notified': notified,
+    }
+
+def bulk_update_orders(order_ids, action, value, admin):
+    """Apply one admin action to many orders in a single transaction
+
+    The orders are locked and read once, changed with one UPDATE ... WHERE
+    id IN (...), and get their OrderTracking rows in one multi-row INSERT.
+    Status changes queue their customer emails in the outbox in the same
+    transaction, so an email exists exactly when its change was committed.
+    Orders already in the requested state are skipped.
+
+    Returns (updated order ids, skipped order ids, queued outbox entry ids).
+    """
+    order_ids = sorted({int(order_id) for order_id in order_ids})
+    if not order_ids:
+        raise BulkActionError('Select at least one order.')
+    if len(order_ids) > MAX_BULK_ORDERS:
+        raise BulkActionError(f'At most {MAX_BULK_ORDERS} orders can be updated at once.')
+    if action not in BULK_ACTIONS:
+        raise BulkActionError(f'Unknown action: {action}')
+
+    writer = None
+    if action == 'set_status' and value not in ORDER_STATUSES:
+        raise BulkActionError(f'Unknown status: {value}')
+    if action == 'assign_writer':
+        writer = db.session.get(Admin, int(value)) if str(value).isdigit() else None
+        if writer is None:
+            raise BulkActionError('Unknown writer.')
+    if action == 'add_note':
+        value = (value or '').strip()
+        if not value or len(value) > MAX_NOTE_LENGTH:
+            raise BulkActionError(f'Notes must be 1 to {MAX_NOTE_LENGTH} characters.')
+
+    orders = Order.query.options(joinedload(Order.service, innerjoin=True)).filter(
+        Order.id.in_(order_ids)
+    ).with_for_update(of=Order).all()
+
+    now = datetime.utcnow()
+    if action == 'set_status':
+        targets = [order for order in orders if order.status != value]
+        values = {'status': value, 'updated_at': now}
+        if value == 'completed':
+            values['completed_at'] = now
+        tracking = [_tracking_row(order, value, f"Status changed from {order.status} to {value}", admin, True)
+                    for order in targets]
+        messages = [status_update_message(order, value) for order in targets]
+    elif action == 'assign_writer':
+        targets = [order for order in orders if order.assigned_writer_id != writer.id]
+        values = {'assigned_writer_id': writer.id, 'updated_at': now}
+        tracking = [_tracking_row(order, order.status, f"Assigned to {writer.username}", admin)
+                    for order in targets]
+        messages = []
+    else:
+        targets = orders
+        note = f"[{now:%Y-%m-%d %H:%M} {admin.username}] {value}"
+        values = {
+            'admin_notes': case(
+                (Order.admin_notes.is_(None) | (Order.admin_notes == ''), note),
+                else_=Order.admin_notes + '\n' + note
+            ),
+            'updated_at': now,
+        }
+        tracking = [_tracking_row(order, order.status, f"Note: {value}", admin) for order in targets]
+        messages = []
+
+    updated_ids = [order.id for order in targets]
+    skipped_ids = sorted(set(order_ids) - set(updated_ids))
+    if not updated_ids:
+        db.session.rollback()
+        return updated_ids, skipped_ids, []
+
+    try:
+        db.session.execute(
+            update(Order).where(Order.id.in_(updated_ids)).values(**values),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.execute(insert(OrderTracking), tracking)
+        entries = queue_emails(messages, commit=False)
+        db.session.flush()
+        queued_ids = [entry.id for entry in entries]
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return updated_ids, skipped_ids, queued_ids
+
+def upgrade_order_schema():
+    """Add the assigned writer column to an orders table created before it existed"""
+    connection = db.session.connection()
+    dialect = connection.dialect.name
+
+    if dialect == 'postgresql':
+        connection.execute(text(
+            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS assigned_writer_id INTEGER REFERENCES admins (id)"
+        ))
+    elif dialect == 'sqlite':
+        existing = {row[1] for row in connection.execute(text("PRAGMA table_info(orders)"))}
+        if 'assigned_writer_id' not in existing:
+            connection.execute(text("ALTER TABLE orders ADD COLUMN assigned_writer_id INTEGER REFERENCES admins (id)"))
+    else:
+        return False
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_assigned_writer_id ON orders (assigned_writer_id)"))
+    db.session.commit()
+    return True
@@ -0,0 +1,153 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from flask_mail import Message
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from app import db, mail
+from models import EmailOutbox
+from breakers import get_breaker, FAILURES
+
+MAX_ATTEMPTS = 8
+MAX_BACKOFF_SECONDS = 3600
+# How long a sender owns the entries it claimed; a crashed sender's entries are retried after this
+CLAIM_SECONDS = 600
+
+def _address(value):
+    # Flask-Mail accepts (name, address) pairs wherever it takes an address
+    if isinstance(value, (tuple, list)):
+        return f"{value[0]} <{value[1]}>"
+    return value
+
+def _outbox_entry(message, last_error=None):
+    return EmailOutbox(
+        subject=message.subject or '',
+        sender=_address(message.sender),
+        recipients=[_address(r) for r in message.recipients],
+        cc=[_address(r) for r in message.cc] or None,
+        bcc=[_address(r) for r in message.bcc] or None,
+        reply_to=_address(message.reply_to),
+        body=message.body,
+        html=message.html,
+        last_error=last_error
+    )
+
+def queue_emails(messages, last_error=None, commit=True, session=None):
+    """Store messages in the outbox for deliver_outbox to send; attachments are not kept
+
+    Entries go on db.session unless another session is given.
+    """
+    session = session or db.session
+    entries = [_outbox_entry(message, last_error) for message in messages]
+    session.add_all(entries)
+    if commit:
+        try:
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            current_app.logger.error(f"Failed to queue {len(entries)} emails: {str(e)}")
+            return []
+    return entries
+
+def queue_email(message, last_error=None, commit=True, session=None):
+    entries = queue_emails([message], last_error, commit, session)
+    return entries[0] if entries else None
+
+def queue_email_independently(message, last_error=None):
+    """Queue a message on its own session, leaving the caller's transaction untouched"""
+    with Session(db.engine, expire_on_commit=False) as session:
+        return queue_email(message, last_error, session=session)
+
+def outbox_message(entry):
+    return Message(
+        subject=entry.subject,
+        recipients=entry.recipients,
+        body=entry.body,
+        html=entry.html,
+        sender=entry.sender,
+        cc=entry.cc,
+        bcc=entry.bcc,
+        reply_to=entry.reply_to
+    )
+
+def _retry_later(entry, error, now):
+    entry.attempts += 1
+    entry.last_error = str(error)
+    if entry.attempts >= MAX_ATTEMPTS:
+        entry.status = 'failed'
+    else:
+        entry.status = 'pending'
+        entry.next_attempt_at = now + timedelta(seconds=min(60 * 2 ** entry.attempts, MAX_BACKOFF_SECONDS))
+
+def claim_outbox(limit=100, ids=None):
+    """Atomically mark due entries as 'sending' and return them, oldest first
+
+    A claim is a lease: next_attempt_at moves to the end of it, so no other
+    sender (the cron, another bulk action) picks the entries up meanwhile,
+    and the entries of a sender that died mid-batch fall due again once it
+    runs out. ids restricts the claim to those entries.
+    """
+    now = datetime.utcnow()
+    due = [EmailOutbox.status.in_(('pending', 'sending')), EmailOutbox.next_attempt_at <= now]
+    candidates = select(EmailOutbox.id).where(*due).order_by(EmailOutbox.id.asc()).limit(limit)
+    if ids is not None:
+        candidates = candidates.where(EmailOutbox.id.in_(ids))
+
+    # SKIP LOCKED lets concurrent senders claim disjoint batches on PostgreSQL; the repeated
+    # due check makes a sender that waited on a row skip it once another one claimed it
+    claimed = db.session.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.id.in_(candidates.with_for_update(skip_locked=True).scalar_subquery()), *due)
+        .values(status='sending', next_attempt_at=now + timedelta(seconds=CLAIM_SECONDS))
+        .returning(EmailOutbox.id),
+        execution_options={'synchronize_session': False}
+    ).scalars().all()
+    db.session.commit()
+
+    if not claimed:
+        return []
+    return EmailOutbox.query.filter(EmailOutbox.id.in_(claimed)).order_by(EmailOutbox.id.asc()).all()
+
+def deliver_outbox(limit=100, ids=None):
+    """Send due outbox messages over one SMTP connection, stopping at the first SMTP failure
+
+    Only entries this call claimed are sent, so concurrent deliveries never
+    send the same email twice. Pass ids to deliver a specific batch.
+    """
+    breaker = get_breaker('smtp')
+    entries = claim_outbox(limit, ids)
+    now = datetime.utcnow()
+
+    sent = 0
+    if entries and breaker.allow():
+        current = None
+        try:
+            with mail.connect() as connection:
+                for current in entries:
+                    try:
+                        connection.send(outbox_message(current))
+                    except FAILURES['smtp']:
+                        raise
+                    except Exception as e:
+                        # The message itself is bad (no recipients, header injection); retrying won't help
+                        current.status = 'failed'
+                        current.last_error = str(e)
+                        continue
+                    current.status = 'sent'
+                    current.sent_at = datetime.utcnow()
+                    sent += 1
+            breaker.record_success()
+        except FAILURES['smtp'] as e:
+            breaker.record_failure()
+            current_app.logger.error(f"Outbox delivery stopped after {sent} emails: {str(e)}")
+            if current is not None and current.status == 'sending':
+                _retry_later(current, e, now)
+
+    # Hand back whatever was claimed but not attempted
+    for entry in entries:
+        if entry.status == 'sending':
+            entry.status = 'pending'
+            entry.next_attempt_at = now
+
+    db.session.commit()
+    pending = EmailOutbox.query.filter(EmailOutbox.status.in_(('pending', 'sending'))).count()
+    return {'sent': sent, 'pending': pending}
@@ -0,0 +1,139 @@
+import os
+import time
+import threading
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool, NullPool
+
+# Connections held by a gevent worker; its other greenlets queue for them
+GEVENT_POOL_SIZE = 10
+
+class PoolStats:
+    """Checkout counters for one worker's connection pools"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.overflow_peak = 0
+
+    def record_checkout(self, wait, overflow):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.overflow_peak = max(self.overflow_peak, overflow)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_avg_ms': round(self.wait_total / self.checkouts * 1000, 2) if self.checkouts else 0.0,
+                'wait_max_ms': round(self.wait_max * 1000, 2),
+                'overflow_peak': self.overflow_peak,
+            }
+
+pool_stats = PoolStats()
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long requests wait for a connection"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_stats.record_timeout()
+            raise
+        pool_stats.record_checkout(time.perf_counter() - started, max(self.overflow(), 0))
+        return connection
+
+def _env_int(environ, name, default):
+    value = environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+def _env_flag(environ, name, default):
+    return environ.get(name, '1' if default else '0').lower() in ('1', 'true', 'yes')
+
+def pool_size_for_workers(environ=None):
+    """Size (pool_size, max_overflow) from the gunicorn worker model
+
+    sync workers handle one request at a time, gthread one per thread and
+    gevent up to worker_connections, of which only a few should hold a DB
+    connection at once. DB_CONNECTION_BUDGET, the connections this node may
+    open, caps the per-worker total across WEB_CONCURRENCY workers.
+    """
+    environ = os.environ if environ is None else environ
+    worker_class = environ.get('WEB_WORKER_CLASS', 'gevent').lower()
+
+    if worker_class == 'sync':
+        pool_size, max_overflow = 1, 1
+    elif worker_class == 'gthread':
+        threads = _env_int(environ, 'WEB_THREADS', 4)
+        pool_size, max_overflow = threads, max(1, threads // 2)
+    else:
+        pool_size, max_overflow = GEVENT_POOL_SIZE, GEVENT_POOL_SIZE // 2
+
+    pool_size = _env_int(environ, 'DB_POOL_SIZE', pool_size)
+    max_overflow = _env_int(environ, 'DB_MAX_OVERFLOW', max_overflow)
+
+    budget = _env_int(environ, 'DB_CONNECTION_BUDGET', 0)
+    if budget:
+        per_worker = max(1, budget // _env_int(environ, 'WEB_CONCURRENCY', 1))
+        pool_size = min(pool_size, per_worker)
+        max_overflow = min(max_overflow, per_worker - pool_size)
+
+    return pool_size, max_overflow
+
+def engine_options(database_uri, environ=None):
+    """Build SQLALCHEMY_ENGINE_OPTIONS for the configured database and worker model"""
+    environ = os.environ if environ is None else environ
+    options = {
+        'pool_recycle': _env_int(environ, 'DB_POOL_RECYCLE', 300),
+        # Off by default: pre-ping costs a round trip on every checkout
+        'pool_pre_ping': _env_flag(environ, 'DB_POOL_PRE_PING', False),
+    }
+
+    if database_uri.startswith('sqlite'):
+        return options
+
+    if _env_flag(environ, 'DB_PGBOUNCER', False):
+        # PgBouncer owns pooling; never hold server connections between requests
+        options = {'poolclass': NullPool}
+        if database_uri.startswith('postgresql+psycopg:'):
+            # psycopg 3 prepares repeated statements server-side, which transaction pooling breaks
+            options['connect_args'] = {'prepare_threshold': None}
+        return options
+
+    pool_size, max_overflow = pool_size_for_workers(environ)
+    options.update({
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': _env_int(environ, 'DB_POOL_TIMEOUT', 10),
+        'pool_use_lifo': True,  # lets idle surplus connections age out via pool_recycle
+    })
+    return options
+
+def pool_status(engines):
+    """Snapshot of every engine's pool plus this worker's checkout stats"""
+    pools = {}
+    for key, engine in engines.items():
+        pool = engine.pool
+        status = {'class': type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            status.update({
+                'size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'checked_in': pool.checkedin(),
+                'overflow': pool.overflow(),
+            })
+        pools[key or 'primary'] = status
+
+    return {'pid': os.getpid(), 'pools': pools, 'stats': pool_stats.as_dict()}
@@ -0,0 +1,194 @@
+import os
+import sys
+import json
+import uuid
+import html
+import time
+import signal
+import zlib
+import threading
+from collections import Counter
+import redis
+
+CONTROL_CHANNEL = 'profiler:control'
+RESULT_TTL = 3600
+MAX_STACK_DEPTH = 128
+
+# Sampling clock: 'cpu' only ticks while the process runs, 'wall' also while it waits on I/O
+TIMERS = {
+    'cpu': (signal.ITIMER_PROF, signal.SIGPROF),
+    'wall': (signal.ITIMER_REAL, signal.SIGALRM),
+}
+
+def result_key(session_id):
+    return f"profiler:{session_id}"
+
+class StackSampler:
+    """Signal-driven sampler that counts collapsed stacks of every thread
+
+    The signal handler is installed once in the worker's main thread; the
+    interval timer only runs while a session is active, so an idle sampler
+    costs nothing.
+    """
+
+    def __init__(self):
+        self.stacks = Counter()
+        self.samples = 0
+        self.active = False
+        self._ignored_threads = set()
+        self._installed = set()
+
+    def install(self):
+        """Install the signal handlers; must run in the main thread"""
+        for _, signum in TIMERS.values():
+            signal.signal(signum, self._handle)
+            self._installed.add(signum)
+
+    def ignore_current_thread(self):
+        self._ignored_threads.add(threading.get_ident())
+
+    def _handle(self, signum, frame):
+        if not self.active:
+            return
+        self.samples += 1
+        for thread_id, thread_frame in sys._current_frames().items():
+            if thread_id in self._ignored_threads:
+                continue
+            # The main thread is currently running this handler; sample what it interrupted
+            if thread_frame.f_code is self._handle.__func__.__code__:
+                thread_frame = frame
+            self.stacks[self._collapse(thread_frame)] += 1
+
+    @staticmethod
+    def _collapse(frame):
+        names = []
+        while frame is not None and len(names) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def run(self, seconds, interval, mode='cpu'):
+        """Sample for a number of seconds and return the collapsed stack counts"""
+        which, signum = TIMERS[mode]
+        if signum not in self._installed or self.active:
+            return None
+
+        self.stacks = Counter()
+        self.samples = 0
+        self.active = True
+        signal.setitimer(which, interval, interval)
+        try:
+            time.sleep(seconds)
+        finally:
+            signal.setitimer(which, 0, 0)
+            self.active = False
+        return self.stacks
+
+def collapsed_text(stacks):
+    """Render stack counts in the collapsed format used by flamegraph.pl and speedscope"""
+    return '\n'.join(f"{stack} {count}" for stack, count in stacks.most_common()) + '\n'
+
+def parse_collapsed(text):
+    stacks = Counter()
+    for line in text.splitlines():
+        stack, _, count = line.rpartition(' ')
+        if stack and count.isdigit():
+            stacks[stack] += int(count)
+    return stacks
+
+def flamegraph_svg(stacks, width=1200, row_height=16, min_width=0.5):
+    """Render collapsed stacks as a self-contained SVG flame graph"""
+    root = {'count': 0, 'children': {}}
+    for stack, count in stacks.items():
+        root['count'] += count
+        node = root
+        for name in stack.split(';'):
+            node = node['children'].setdefault(name, {'count': 0, 'children': {}})
+            node['count'] += count
+
+    total = root['count'] or 1
+    rects = []
+    max_depth = 0
+
+    def layout(node, x, depth):
+        nonlocal max_depth
+        for name, child in sorted(node['children'].items()):
+            child_width = child['count'] / total * width
+            if child_width >= min_width:
+                max_depth = max(max_depth, depth)
+                rects.append((name, child['count'], x, depth, child_width))
+                layout(child, x, depth + 1)
+            x += child_width
+
+    layout(root, 0.0, 0)
+    height = (max_depth + 1) * row_height
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" font-size="11">']
+    for name, count, x, depth, rect_width in rects:
+        y = height - (depth + 1) * row_height
+        hue = 20 + zlib.crc32(name.encode('utf-8')) % 40
+        label = html.escape(name)
+        parts.append(
+            f'<g><title>{label} ({count} samples, {count / total:.1%})</title>'
+            f'<rect x="{x:.2f}" y="{y}" width="{rect_width:.2f}" height="{row_height - 1}" fill="hsl({hue},90%,60%)"/>'
+        )
+        if rect_width > 40:
+            visible = label[:int(rect_width / 7)]
+            parts.append(f'<text x="{x + 2:.2f}" y="{y + row_height - 4}">{visible}</text>')
+        parts.append('</g>')
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+sampler = StackSampler()
+
+def _listen(app):
+    """Wait for profiling commands and publish this worker's results"""
+    sampler.ignore_current_thread()
+    client = redis.Redis.from_url(app.config['REDIS_URL'])
+
+    while True:
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CONTROL_CHANNEL)
+            for message in pubsub.listen():
+                command = json.loads(message['data'])
+                stacks = sampler.run(command['seconds'], command['interval'], command.get('mode', 'cpu'))
+                if stacks is None:
+                    continue
+                key = result_key(command['session_id'])
+                client.hset(key, str(os.getpid()), json.dumps({
+                    'samples': sampler.samples,
+                    'collapsed': collapsed_text(stacks),
+                }))
+                client.expire(key, RESULT_TTL)
+        except redis.RedisError as e:
+            app.logger.error(f"Profiler listener error: {str(e)}")
+            time.sleep(5)
+
+def start_profiler_listener(app):
+    """Install the sampler and start the control listener in a gunicorn worker"""
+    if not app.config.get('PROFILER_ENABLED'):
+        return
+    sampler.install()
+    threading.Thread(target=_listen, args=(app,), name='profiler-listener', daemon=True).start()
+
+def start_profiling(client, seconds, interval, mode='cpu'):
+    """Ask every listening worker to sample for a number of seconds"""
+    session_id = uuid.uuid4().hex[:12]
+    workers = client.publish(CONTROL_CHANNEL, json.dumps({
+        'session_id': session_id,
+        'seconds': seconds,
+        'interval': interval,
+        'mode': mode,
+    }))
+    return session_id, workers
+
+def get_profile(client, session_id):
+    """Merge the stacks every worker reported for a session"""
+    stacks = Counter()
+    workers = {}
+    for pid, payload in client.hgetall(result_key(session_id)).items():
+        result = json.loads(payload)
+        workers[pid.decode('utf-8')] = result['samples']
+        stacks.update(parse_collapsed(result['collapsed']))
+    return stacks, workers
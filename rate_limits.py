@@ -0,0 +1,180 @@
+import os
+import time
+import logging
+import threading
+import redis
+from limits.storage import Storage
+from breakers import no_retry
+
+logger = logging.getLogger(__name__)
+
+class _Window:
+    """One fixed window: the cluster-wide count at the last sync plus local hits since"""
+
+    __slots__ = ('expires_at', 'expiry', 'remote', 'pending')
+
+    def __init__(self, expires_at, expiry):
+        self.expires_at = expires_at
+        self.expiry = expiry
+        self.remote = 0
+        self.pending = 0
+
+class HybridStorage(Storage):
+    """Rate limit storage that counts in process and reconciles with Redis in the background
+
+    Limit checks only touch a dict under a lock. Every `sync_interval`
+    seconds a background thread pushes each window's local hits to Redis
+    with INCRBY and adopts the cluster-wide count and TTL it gets back, so
+    workers converge on shared windows. While Redis is unreachable, every
+    worker keeps enforcing limits on its own hits plus the last known
+    cluster count: at worst a client gets the limit once per worker, never
+    an unlimited pass or an error.
+
+    Registered for hybrid+redis:// (and hybrid+rediss://) URLs.
+    """
+
+    STORAGE_SCHEME = ['hybrid+redis', 'hybrid+rediss']
+
+    def __init__(self, uri, wrap_exceptions=False, sync_interval=1.0, redis_timeout=0.25, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions)
+        self.remote = redis.Redis.from_url(uri.split('+', 1)[1], socket_timeout=float(redis_timeout),
+                                           socket_connect_timeout=float(redis_timeout), retry=no_retry())
+        self.sync_interval = float(sync_interval)
+        self.healthy = True
+        self._windows = {}
+        self._lock = threading.Lock()
+        self._sync_started = False
+        # Forked gunicorn workers start their own sync thread on first use
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._sync_started = False
+
+    @property
+    def base_exceptions(self):
+        return redis.RedisError
+
+    def _window(self, key, now):
+        window = self._windows.get(key)
+        if window is not None and window.expires_at <= now:
+            del self._windows[key]
+            window = None
+        return window
+
+    def incr(self, key, expiry, amount=1):
+        now = time.time()
+        with self._lock:
+            window = self._windows.get(key)
+            created = window is None or window.expires_at <= now
+            if created:
+                window = self._windows[key] = _Window(now + expiry, expiry)
+            window.pending += amount
+            count = window.remote + window.pending
+
+        if not self._sync_started:
+            self._start_sync_thread()
+        if created and self.healthy:
+            # One round trip per key and window, so a new window starts from the cluster count
+            count = self._seed(key, window)
+        return count
+
+    def _seed(self, key, window):
+        pipe = self.remote.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.pttl(key)
+        try:
+            value, ttl_ms = pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Rate limit lookup failed, enforcing local limits only: {str(e)}")
+            self.healthy = False
+            return window.remote + window.pending
+
+        with self._lock:
+            window.remote = int(value or 0)
+            if ttl_ms > 0:
+                window.expires_at = time.time() + ttl_ms / 1000.0
+            return window.remote + window.pending
+
+    def get(self, key):
+        with self._lock:
+            window = self._window(key, time.time())
+            return window.remote + window.pending if window else 0
+
+    def get_expiry(self, key):
+        with self._lock:
+            window = self._window(key, time.time())
+            return window.expires_at if window else time.time()
+
+    def check(self):
+        # Local counting always works; Redis health is reported separately
+        return True
+
+    def reset(self):
+        with self._lock:
+            cleared = len(self._windows)
+            self._windows.clear()
+        try:
+            keys = list(self.remote.scan_iter('LIMITER*'))
+            if keys:
+                self.remote.delete(*keys)
+        except redis.RedisError as e:
+            logger.warning(f"Rate limit reset could not reach Redis: {str(e)}")
+        return cleared
+
+    def clear(self, key):
+        with self._lock:
+            self._windows.pop(key, None)
+        try:
+            self.remote.delete(key)
+        except redis.RedisError as e:
+            logger.warning(f"Rate limit clear could not reach Redis: {str(e)}")
+
+    def _start_sync_thread(self):
+        with self._lock:
+            if self._sync_started:
+                return
+            self._sync_started = True
+        threading.Thread(target=self._sync_forever, name='rate-limit-sync', daemon=True).start()
+
+    def _sync_forever(self):
+        while True:
+            time.sleep(self.sync_interval)
+            self.sync()
+
+    def sync(self):
+        """Push local hits to Redis and pull back cluster-wide counts and TTLs"""
+        with self._lock:
+            now = time.time()
+            for key in [key for key, window in self._windows.items() if window.expires_at <= now]:
+                del self._windows[key]
+            batch = [(key, window, window.pending) for key, window in self._windows.items()]
+        if not batch:
+            return
+
+        pipe = self.remote.pipeline(transaction=False)
+        for key, window, pushed in batch:
+            pipe.incrby(key, pushed)
+            pipe.expire(key, window.expiry, nx=True)
+            pipe.pttl(key)
+        try:
+            results = pipe.execute()
+        except redis.RedisError as e:
+            if self.healthy:
+                logger.warning(f"Rate limit sync failed, enforcing local limits only: {str(e)}")
+            self.healthy = False
+            return
+
+        if not self.healthy:
+            logger.info("Rate limit sync recovered")
+        self.healthy = True
+
+        now = time.time()
+        with self._lock:
+            for index, (key, window, pushed) in enumerate(batch):
+                total, _, ttl_ms = results[index * 3:index * 3 + 3]
+                # Hits that arrived during the round trip stay pending for the next sync
+                window.pending -= pushed
+                window.remote = total
+                if ttl_ms > 0:
+                    window.expires_at = now + ttl_ms / 1000.0
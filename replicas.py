@@ -0,0 +1,123 @@
+import time
+import itertools
+import threading
+from functools import wraps
+from sqlalchemy import text
+from sqlalchemy.sql import Select
+from flask import current_app, g, has_request_context, session
+from flask_sqlalchemy.session import Session
+
+# Tables whose writes do not make a visitor read from the primary afterwards
+STICKY_EXEMPT_TABLES = {'analytics'}
+
+STICKY_SESSION_KEY = 'db_primary_until'
+
+def replica_lag(connection):
+    """Seconds a replica is behind its primary, 0 for databases without replication"""
+    if connection.dialect.name != 'postgresql':
+        return 0.0
+    lag = connection.execute(text(
+        "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+        "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+    )).scalar()
+    return float(lag or 0)
+
+class ReplicaRouter:
+    """Round-robin over replicas, skipping any that lag or fail their health check"""
+
+    def __init__(self, bind_keys, max_lag, check_interval):
+        self.bind_keys = list(bind_keys)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._health = {}  # bind key -> (checked at, healthy)
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def _is_healthy(self, db, key):
+        now = time.monotonic()
+        checked_at, healthy = self._health.get(key, (None, True))
+        if checked_at is not None and now - checked_at < self.check_interval:
+            return healthy
+
+        with self._lock:
+            # Another thread may have refreshed it while we waited
+            checked_at, healthy = self._health.get(key, (None, True))
+            if checked_at is not None and now - checked_at < self.check_interval:
+                return healthy
+
+            try:
+                with db.engines[key].connect() as connection:
+                    lag = replica_lag(connection)
+                healthy = lag <= self.max_lag
+                if not healthy:
+                    current_app.logger.warning(f"Replica {key} is {lag:.1f}s behind, reading from primary")
+            except Exception as e:
+                current_app.logger.error(f"Replica {key} health check failed: {str(e)}")
+                healthy = False
+
+            self._health[key] = (now, healthy)
+            return healthy
+
+    def pick(self, db):
+        """Get the next healthy replica engine, or None to use the primary"""
+        healthy = [key for key in self.bind_keys if self._is_healthy(db, key)]
+        if not healthy:
+            return None
+        return db.engines[healthy[next(self._counter) % len(healthy)]]
+
+def _reads_from_replica(clause):
+    """Check whether a statement may be sent to a replica in this request"""
+    if not has_request_context() or not g.get('db_read_only') or g.get('db_wrote'):
+        return False
+    if not isinstance(clause, Select) or clause._for_update_arg is not None:
+        return False
+    return session.get(STICKY_SESSION_KEY, 0) < time.time()
+
+class RoutingSession(Session):
+    """Session that sends SELECTs from read-only views to a replica
+
+    Flushes, DML, raw SQL and SELECT ... FOR UPDATE always use the primary,
+    as does everything after the current visitor's last write for
+    READ_YOUR_WRITES_SECONDS.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _reads_from_replica(clause):
+            router = current_app.extensions.get('replica_router')
+            engine = router.pick(self._db) if router else None
+            if engine is not None:
+                return engine
+
+        if self._flushing and mapper is not None and has_request_context():
+            if mapper.local_table.name not in STICKY_EXEMPT_TABLES:
+                g.db_wrote = True
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def read_only(view):
+    """Mark a view whose queries may be served by a read replica"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+def init_replicas(app):
+    """Set up replica routing and read-your-writes stickiness"""
+    bind_keys = app.config['REPLICA_BIND_KEYS']
+    if bind_keys:
+        app.extensions['replica_router'] = ReplicaRouter(
+            bind_keys,
+            max_lag=app.config['REPLICA_MAX_LAG_SECONDS'],
+            check_interval=app.config['REPLICA_CHECK_SECONDS']
+        )
+
+    @app.after_request
+    def stick_to_primary(response):
+        # Keep this visitor on the primary until replicas have caught up with the write
+        if g.get('db_wrote') and bind_keys:
+            session[STICKY_SESSION_KEY] = time.time() + app.config['READ_YOUR_WRITES_SECONDS']
+        return response
+
+    return app
@@ -0,0 +1,179 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from flask import current_app
+from app import db
+from models import Analytics, AnalyticsRollup, RollupCheckpoint, FunnelDaily, Order
+
+CHECKPOINT_NAME = 'analytics'
+
+GRANULARITIES = ('hour', 'day')
+
+# Funnel stages in order: (column, event type, page or None)
+FUNNEL_STAGES = (
+    ('order_page_views', 'page_view', 'order'),
+    ('orders_started', 'order_started', None),
+    ('orders_created', 'order_created', None),
+)
+
+def bucket_start(timestamp, granularity):
+    """Truncate a timestamp to the start of its hour or day"""
+    if granularity == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _apply_counts(counts):
+    """Add aggregated counts to the rollup table in one pass"""
+    if not counts:
+        return
+
+    buckets = [key[1] for key in counts]
+    existing = AnalyticsRollup.query.filter(
+        AnalyticsRollup.bucket_start >= min(buckets),
+        AnalyticsRollup.bucket_start <= max(buckets)
+    ).all()
+    by_key = {(r.granularity, r.bucket_start, r.event_type, r.page): r for r in existing}
+
+    for key, (count, weighted_count) in counts.items():
+        rollup = by_key.get(key)
+        if rollup:
+            rollup.count += count
+            rollup.weighted_count += weighted_count
+        else:
+            granularity, start, event_type, page = key
+            db.session.add(AnalyticsRollup(
+                granularity=granularity,
+                bucket_start=start,
+                event_type=event_type,
+                page=page,
+                count=count,
+                weighted_count=weighted_count
+            ))
+
+def update_rollups(batch_size=5000, settle_seconds=60):
+    """Fold new analytics events into hourly and daily rollups
+
+    Events are read past the stored high-water mark on Analytics.id. The
+    newest settle_seconds of events are left for the next run so rows from
+    transactions still in flight are not skipped.
+    """
+    if not db.session.get(RollupCheckpoint, CHECKPOINT_NAME):
+        db.session.add(RollupCheckpoint(name=CHECKPOINT_NAME, last_id=0))
+        db.session.commit()
+
+    cutoff = datetime.utcnow() - timedelta(seconds=settle_seconds)
+    processed = 0
+    first_day = None
+
+    while True:
+        # Hold the checkpoint row until this batch commits so an overlapping
+        # run waits and then starts from the advanced high-water mark
+        checkpoint = db.session.get(
+            RollupCheckpoint, CHECKPOINT_NAME, with_for_update=True, populate_existing=True
+        )
+        rows = db.session.query(
+            Analytics.id, Analytics.event_type, Analytics.page, Analytics.sample_weight, Analytics.created_at
+        ).filter(
+            Analytics.id > checkpoint.last_id,
+            Analytics.created_at <= cutoff
+        ).order_by(Analytics.id.asc()).limit(batch_size).all()
+
+        if not rows:
+            break
+
+        # key -> [stored events, sum of sample weights]
+        counts = defaultdict(lambda: [0, 0.0])
+        for row in rows:
+            page = row.page or ''
+            weight = row.sample_weight or 1.0
+            for granularity in GRANULARITIES:
+                totals = counts[(granularity, bucket_start(row.created_at, granularity), row.event_type, page)]
+                totals[0] += 1
+                totals[1] += weight
+
+        _apply_counts(counts)
+
+        batch_first_day = bucket_start(rows[0].created_at, 'day').date()
+        first_day = min(first_day, batch_first_day) if first_day else batch_first_day
+
+        # Counts and checkpoint commit together so a crash never double counts
+        checkpoint.last_id = rows[-1].id
+        db.session.commit()
+        processed += len(rows)
+
+    db.session.commit()
+
+    if first_day:
+        update_funnel(since=first_day)
+
+    return processed
+
+def update_funnel(since):
+    """Recompute the daily order funnel from rollups and paid orders"""
+    since_start = datetime.combine(since, datetime.min.time())
+    days = {}
+
+    def day_row(day):
+        if day not in days:
+            days[day] = {column: 0 for column, _, _ in FUNNEL_STAGES}
+            days[day]['orders_paid'] = 0
+        return days[day]
+
+    for column, event_type, page in FUNNEL_STAGES:
+        query = db.session.query(AnalyticsRollup.bucket_start, db.func.sum(AnalyticsRollup.weighted_count)).filter(
+            AnalyticsRollup.granularity == 'day',
+            AnalyticsRollup.event_type == event_type,
+            AnalyticsRollup.bucket_start >= since_start
+        )
+        if page is not None:
+            query = query.filter(AnalyticsRollup.page == page)
+
+        for start, total in query.group_by(AnalyticsRollup.bucket_start).all():
+            day_row(start.date())[column] = int(round(total or 0))
+
+    # Payment is recorded on the order itself, not as an analytics event
+    paid_day = db.func.date(Order.created_at)
+    paid_orders = db.session.query(paid_day, db.func.count(Order.id)).filter(
+        Order.payment_status == 'paid',
+        Order.created_at >= since_start
+    ).group_by(paid_day)
+    for day, total in paid_orders.all():
+        # SQLite's date() returns an ISO string
+        if isinstance(day, str):
+            day = date.fromisoformat(day)
+        day_row(day)['orders_paid'] = total
+
+    existing = {f.day: f for f in FunnelDaily.query.filter(FunnelDaily.day >= since).all()}
+    for day, values in days.items():
+        funnel = existing.get(day)
+        if not funnel:
+            funnel = FunnelDaily(day=day)
+            db.session.add(funnel)
+        for column, value in values.items():
+            setattr(funnel, column, value)
+
+    db.session.commit()
+    current_app.logger.info(f"Order funnel updated for {len(days)} day(s) since {since}")
+
+def get_funnel(days=30):
+    """Get the stored daily funnel for the last N days, oldest first"""
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    rows = FunnelDaily.query.filter(FunnelDaily.day >= since).order_by(FunnelDaily.day.asc()).all()
+    return [{
+        'day': row.day.isoformat(),
+        'order_page_views': row.order_page_views,
+        'orders_started': row.orders_started,
+        'orders_created': row.orders_created,
+        'orders_paid': row.orders_paid
+    } for row in rows]
+
+def get_rollups(granularity='day', event_type=None, page=None, since=None):
+    """Get rollup rows (stored and sampling-weighted counts) for a time range"""
+    query = AnalyticsRollup.query.filter(AnalyticsRollup.granularity == granularity)
+    if event_type:
+        query = query.filter(AnalyticsRollup.event_type == event_type)
+    if page is not None:
+        query = query.filter(AnalyticsRollup.page == page)
+    if since:
+        query = query.filter(AnalyticsRollup.bucket_start >= since)
+
+    return query.order_by(AnalyticsRollup.bucket_start.asc(), AnalyticsRollup.event_type.asc()).all()
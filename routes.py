@@ -223,11 +223,12 @@ def submit_order():
             domain = get_domain()
             checkout_session = stripe.checkout.Session.create(
 =======
+import redis
 import stripe
 import json
-import uuid
 from datetime import datetime, timedelta
-from flask import render_template, request, redirect, url_for, flash, send_file, jsonify, current_app, session
+from flask import (render_template, request, redirect, url_for, flash, send_file, jsonify, current_app, session, abort,
+                   Response, stream_with_context)
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash
 from werkzeug.utils import secure_filename
@@ -236,14 +237,26 @@ from sqlalchemy import func, desc
 from app import db, mail, cache, limiter
 from models import (Admin, Service, Order, ContactMessage, Testimonial, FAQ, 
                    Portfolio, DiscountCode, Referral, OrderTracking, Template,
-                   NewsletterSubscriber, LiveChat, ChatMessage, Analytics, OrderDiscount)
+                   NewsletterSubscriber, LiveChat, ChatMessage, Analytics, OrderDiscount, EmailOutbox)
 from forms import (OrderForm, ContactForm, AdminLoginForm, OrderStatusForm,
                   TestimonialForm, FAQForm, DiscountCodeForm, ReferralForm,
                   NewsletterForm, LiveChatForm, AdminResponseForm, DiscountApplicationForm)
 from utils import (track_event, validate_discount_code, apply_discount_to_order,
                   save_uploaded_file, calculate_estimated_delivery, generate_referral_code,
                   generate_session_id, format_price, get_service_features_list,
-                  log_user_action, send_admin_notification_email)
+                  log_user_action, send_admin_notification_email, get_redis)
+from chat import post_chat_message, serialize_message, stream_chat_events, get_recent_messages
+from facets import get_facet_counts
+from search import search, search_orders, SearchUnavailable, SEARCH_SOURCES
+from rollups import get_funnel, get_rollups
+from versions import conditional, versioned_cache_key
+from replicas import read_only
+from pooling import pool_status
+from profiler import TIMERS, start_profiling, get_profile, collapsed_text, flamegraph_svg
+from slow_queries import get_slow_queries, reset_slow_queries
+from breakers import breakers, get_breaker, CircuitOpenError
+from admission import admission
+from order_actions import status_update_message, bulk_update_orders, BulkActionError
 
 def register_routes(app):
     
@@ -251,12 +264,13 @@ def register_routes(app):
     @app.before_request
     def set_stripe_key():
         stripe.api_key = current_app.config.get('STRIPE_SECRET_KEY')
-        # Set user session for analytics
-        if 'user_id' not in session:
-            session['user_id'] = str(uuid.uuid4())
+        # The analytics id is created lazily by track_event, not here, so asset
+        # and other publicly cached responses never touch the session
     
     @app.route('/')
-    @cache.cached(timeout=300)  # Cache for 5 minutes
+    @read_only
+    @conditional(Service, Testimonial, Portfolio, FAQ)
+    @cache.cached(timeout=300, key_prefix=versioned_cache_key)  # Cache for 5 minutes
     def index():
         track_event('page_view', {'page': 'home'})
         services = Service.query.filter_by(active=True).all()
@@ -268,7 +282,9 @@ def register_routes(app):
 
     # New Enhanced Routes
     @app.route('/testimonials')
-    @cache.cached(timeout=600)
+    @read_only
+    @conditional(Testimonial)
+    @cache.cached(timeout=600, key_prefix=versioned_cache_key)
     def testimonials():
         track_event('page_view', {'page': 'testimonials'})
         page = request.args.get('page', 1, type=int)
@@ -285,17 +301,18 @@ def register_routes(app):
             page=page, per_page=12, error_out=False
         )
         
-        industries = db.session.query(Testimonial.industry).distinct().filter(
-            Testimonial.industry.isnot(None), Testimonial.approved == True
-        ).all()
-        industries = [i[0] for i in industries if i[0]]
+        # Filter options come from the precomputed facet index
+        industry_counts = get_facet_counts('testimonial', 'industry')
+        industries = sorted(value for value, _ in industry_counts)
         
         return render_template('testimonials.html', testimonials=testimonials,
-                             industries=industries, current_industry=industry_filter,
-                             current_rating=rating_filter)
+                             industries=industries, industry_counts=dict(industry_counts),
+                             current_industry=industry_filter, current_rating=rating_filter)
     
     @app.route('/faq')
-    @cache.cached(timeout=600)
+    @read_only
+    @conditional(FAQ)
+    @cache.cached(timeout=600, key_prefix=versioned_cache_key)
     def faq():
         track_event('page_view', {'page': 'faq'})
         category_filter = request.args.get('category', 'all')
@@ -308,16 +325,41 @@ def register_routes(app):
         
         faq_categories = {}
         for faq_item in faqs:
-            if faq_item.category not in faq_categories:
-                faq_categories[faq_item.category] = []
-            faq_categories[faq_item.category].append(faq_item)
+            faq_categories.setdefault(faq_item.category, []).append(faq_item)
         
-        categories = ['general', 'pricing', 'process', 'delivery', 'revisions']
+        # Only categories with visible FAQs, most populated first, from the facet index
+        category_counts = get_facet_counts('faq', 'category')
+        categories = [value for value, _ in category_counts]
         
         return render_template('faq.html', faq_categories=faq_categories,
-                             categories=categories, current_category=category_filter)
-
+                             categories=categories, category_counts=dict(category_counts),
+                             current_category=category_filter)
+
+    # Site Search (FAQ, testimonials, portfolio, templates)
+    @app.route('/search')
+    @limiter.limit("60 per minute")
+    def site_search():
+        query = request.args.get('q', '').strip()
+        doc_types = request.args.getlist('type') or None
+        limit = max(1, min(request.args.get('limit', 20, type=int), 50))
+        
+        if len(query) < 2:
+            return jsonify({'query': query, 'results': []})
+        
+        try:
+            results = search(query, doc_types=doc_types, limit=limit)
+        except Exception as e:
+            current_app.logger.error(f"Search error: {e}")
+            return jsonify({'query': query, 'results': [], 'error': 'Search is temporarily unavailable'}), 503
+        
+        return jsonify({
+            'query': query,
+            'types': sorted(SEARCH_SOURCES),
+            'results': results
+        })
+    
     @app.route('/track-order')
+    @read_only
     def track_order():
         order_id = request.args.get('order_id')
         email = request.args.get('email')
@@ -409,6 +451,90 @@ def register_routes(app):
         
         return redirect(request.referrer or url_for('index'))
     
+    # Live Chat System
+    @app.route('/chat')
+    def live_chat():
+        if not current_app.config.get('ENABLE_LIVE_CHAT', False):
+            flash('Live chat is currently unavailable.', 'info')
+            return redirect(url_for('contact'))
+        
+        session_id = session.get('chat_session_id')
+        chat = LiveChat.query.filter_by(session_id=session_id).first() if session_id else None
+        if chat is None:
+            session_id = generate_session_id()
+            session['chat_session_id'] = session_id
+            
+            # Create new chat session
+            chat = LiveChat(session_id=session_id)
+            db.session.add(chat)
+            db.session.commit()
+        
+        messages = get_recent_messages(chat)
+        
+        return render_template('live_chat.html', chat=chat, messages=messages, form=LiveChatForm())
+    
+    def get_authorized_chat(session_id):
+        """Load a chat the current visitor or admin is allowed to access"""
+        if not current_app.config.get('ENABLE_LIVE_CHAT', False):
+            abort(404)
+        
+        if not current_user.is_authenticated and session.get('chat_session_id') != session_id:
+            abort(403)
+        
+        return LiveChat.query.filter_by(session_id=session_id).first_or_404()
+    
+    # Live Chat event stream (pushes only new messages)
+    @app.route('/chat/<session_id>/stream')
+    def chat_stream(session_id):
+        chat = get_authorized_chat(session_id)
+        last_event_id = request.headers.get('Last-Event-ID', type=int) or request.args.get('after', type=int)
+        
+        response = Response(stream_with_context(stream_chat_events(chat, last_event_id)),
+                            mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+    
+    # Live Chat history paging (older messages, newest page first)
+    @app.route('/chat/<session_id>/messages')
+    def chat_history(session_id):
+        chat = get_authorized_chat(session_id)
+        before_id = request.args.get('before', type=int)
+        limit = max(1, min(request.args.get('limit', current_app.config['CHAT_PAGE_SIZE'], type=int), 200))
+        
+        messages = get_recent_messages(chat, limit=limit, before_id=before_id)
+        
+        return jsonify({
+            'messages': messages,
+            'next_before': messages[0]['id'] if len(messages) == limit else None
+        })
+    
+    # Live Chat message posting
+    @app.route('/chat/<session_id>/messages', methods=['POST'])
+    @limiter.limit("30 per minute")
+    def chat_post_message(session_id):
+        chat = get_authorized_chat(session_id)
+        
+        if chat.status == 'closed':
+            return jsonify({'success': False, 'message': 'This chat has been closed.'}), 409
+        
+        form = LiveChatForm()
+        if not form.validate_on_submit():
+            return jsonify({'success': False, 'errors': form.errors}), 400
+        
+        if current_user.is_authenticated:
+            sender_type, sender_name = 'admin', current_user.username
+        else:
+            sender_type, sender_name = 'customer', form.customer_name.data or chat.customer_name
+            if form.customer_name.data and not chat.customer_name:
+                chat.customer_name = form.customer_name.data
+            if form.customer_email.data and not chat.customer_email:
+                chat.customer_email = form.customer_email.data
+        
+        message = post_chat_message(chat, sender_type, form.message.data, sender_name=sender_name)
+        
+        return jsonify({'success': True, 'message': serialize_message(message)}), 201
+    
     @app.route('/order')
     def order():
         form = OrderForm()
@@ -508,8 +634,9 @@ def register_routes(app):
             # Get domain for success/cancel URLs
             domain = request.host_url.rstrip('/')
             
-            # Create Stripe checkout session
-            checkout_session = stripe.checkout.Session.create(
+            # Create Stripe checkout session; fails fast while the Stripe circuit is open
+            checkout_session = get_breaker('stripe').call(
+                stripe.checkout.Session.create,
                 payment_method_types=['card'],
 >>>>>>> ded7f2e4447248a018f7dd7d09de9c43eb09fa0d
                 line_items=[{
@@ -753,26 +880,37 @@ def dashboard():
             
             return redirect(checkout_session.url or url_for('order'), code=303)
             
+        except CircuitOpenError as e:
+            return render_template('payment_unavailable.html', order=order, retry_after=e.retry_after), 503, \
+                {'Retry-After': str(e.retry_after)}
         except Exception as e:
             current_app.logger.error(f"Stripe error: {e}")
             flash('Payment processing error. Please try again or contact support.', 'error')
             return redirect(url_for('order'))
     
+    # Where the async checkout view (asgi.py) sends customers when Stripe fails
+    @app.route('/checkout-failed/<int:order_id>')
+    def checkout_failed(order_id):
+        flash('Payment processing error. Please try again or contact support.', 'error')
+        return redirect(url_for('order'))
+    
     @app.route('/payment-success')
     def payment_success():
         session_id = request.args.get('session_id')
         if session_id:
             order = Order.query.filter_by(stripe_session_id=session_id).first()
             if order:
-                order.payment_status = 'paid'
-                order.status = 'in_progress'
-                db.session.commit()
-                
-                # Send payment confirmation email
-                try:
-                    send_payment_confirmation_email(order)
-                except Exception as e:
-                    current_app.logger.error(f"Failed to send payment confirmation email: {e}")
+                # The Stripe webhook (asgi.py) may have recorded the payment already
+                if order.payment_status != 'paid':
+                    order.payment_status = 'paid'
+                    order.status = 'in_progress'
+                    db.session.commit()
+                    
+                    # Send payment confirmation email
+                    try:
+                        send_payment_confirmation_email(order)
+                    except Exception as e:
+                        current_app.logger.error(f"Failed to send payment confirmation email: {e}")
                 
                 return render_template('success.html', order=order)
         
@@ -898,6 +1036,36 @@ def dashboard():
         
         return redirect(url_for('admin_order_detail', order_id=order_id))
     
+    @app.route('/admin/orders/bulk', methods=['POST'])
+    @login_required
+    def admin_bulk_update_orders():
+        """Set status, assign a writer or add a note on many orders at once"""
+        data = request.get_json(silent=True) or {
+            'order_ids': request.form.getlist('order_ids'),
+            'action': request.form.get('action'),
+            'value': request.form.get('value'),
+        }
+        if not isinstance(data, dict) or not isinstance(data.get('order_ids') or [], list):
+            return jsonify({'success': False, 'message': 'Expected an object with a list of order_ids.'}), 400
+        
+        try:
+            updated, skipped, queued = bulk_update_orders(data.get('order_ids') or [], data.get('action'),
+                                                          data.get('value'), current_user)
+        except (BulkActionError, TypeError, ValueError) as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        response = jsonify({'success': True, 'updated': updated, 'skipped': skipped, 'emails_queued': len(queued)})
+        if queued:
+            # Deliver this batch over one SMTP connection once the admin has their response
+            flask_app = current_app._get_current_object()
+            
+            def deliver():
+                from outbox import deliver_outbox
+                with flask_app.app_context():
+                    deliver_outbox(limit=len(queued), ids=queued)
+            response.call_on_close(deliver)
+        return response
+    
     @app.route('/admin/download/<int:order_id>/<file_type>')
     @login_required
     def admin_download_file(order_id, file_type):
@@ -923,6 +1091,7 @@ def dashboard():
     
     # API endpoint for service pricing
     @app.route('/api/service-pricing/<int:service_id>')
+    @conditional(Service)
     def api_service_pricing(service_id):
         service = Service.query.get_or_404(service_id)
         return jsonify({
@@ -930,6 +1099,164 @@ def dashboard():
             'standard': service.price_standard,
             'premium': service.price_premium
         })
+    
+    # Admin order search (typeahead by email, name, position, industry or Stripe id)
+    @app.route('/admin/orders/search')
+    @login_required
+    @read_only
+    def admin_order_search():
+        query = request.args.get('q', '').strip()
+        limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+        
+        try:
+            orders = search_orders(query, limit=limit)
+        except SearchUnavailable as e:
+            return jsonify({'error': str(e)}), 503
+        
+        return jsonify({
+            'query': query,
+            'results': [{
+                'id': order.id,
+                'name': order.full_name,
+                'email': order.email,
+                'target_position': order.target_position,
+                'industry': order.industry,
+                'status': order.status,
+                'payment_status': order.payment_status,
+                'created_at': order.created_at.isoformat() if order.created_at else None,
+                'url': url_for('admin_order_detail', order_id=order.id)
+            } for order in orders]
+        })
+    
+    # Admin analytics reports (read from pre-aggregated rollups)
+    @app.route('/admin/analytics/funnel')
+    @login_required
+    @read_only
+    def admin_analytics_funnel():
+        days = min(request.args.get('days', 30, type=int), 366)
+        return jsonify({'days': days, 'funnel': get_funnel(days)})
+    
+    @app.route('/admin/analytics/rollups')
+    @login_required
+    @read_only
+    def admin_analytics_rollups():
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in ('hour', 'day'):
+            abort(400)
+        
+        days = min(request.args.get('days', 7, type=int), 366)
+        since = datetime.utcnow() - timedelta(days=days)
+        rollups = get_rollups(granularity=granularity,
+                              event_type=request.args.get('event_type'),
+                              page=request.args.get('page'),
+                              since=since)
+        
+        return jsonify({
+            'granularity': granularity,
+            'rollups': [{
+                'bucket_start': r.bucket_start.isoformat(),
+                'event_type': r.event_type,
+                'page': r.page,
+                'count': r.count,
+                'estimated_count': round(r.weighted_count)
+            } for r in rollups]
+        })
+    
+    # Database connection pool status for this worker
+    @app.route('/admin/db/pool')
+    @login_required
+    def admin_db_pool():
+        return jsonify(pool_status(db.engines))
+    
+    # On-demand sampling profiler across all gunicorn workers
+    @app.route('/admin/profiler', methods=['POST'])
+    @login_required
+    def admin_profiler_start():
+        seconds = min(request.form.get('seconds', 10, type=int), current_app.config['PROFILER_MAX_SECONDS'])
+        interval = max(request.form.get('interval_ms', 10, type=int), 1) / 1000.0
+        mode = request.form.get('mode', 'cpu')
+        if mode not in TIMERS or seconds < 1:
+            abort(400)
+        
+        try:
+            session_id, workers = start_profiling(get_redis(), seconds, interval, mode)
+        except redis.RedisError as e:
+            current_app.logger.error(f"Profiler unavailable: {str(e)}")
+            return jsonify({'error': 'The profiler needs Redis, which is unavailable right now.'}), 503
+        return jsonify({
+            'session_id': session_id,
+            'workers': workers,
+            'ready_after_seconds': seconds,
+            'collapsed_url': url_for('admin_profiler_result', session_id=session_id, fmt='collapsed'),
+            'flamegraph_url': url_for('admin_profiler_result', session_id=session_id, fmt='svg')
+        }), 202
+    
+    @app.route('/admin/profiler/<session_id>.<fmt>')
+    @login_required
+    def admin_profiler_result(session_id, fmt):
+        try:
+            stacks, workers = get_profile(get_redis(), session_id)
+        except redis.RedisError as e:
+            current_app.logger.error(f"Profiler unavailable: {str(e)}")
+            abort(503)
+        if not workers:
+            abort(404)
+        
+        if fmt == 'collapsed':
+            response = Response(collapsed_text(stacks), mimetype='text/plain')
+        elif fmt == 'svg':
+            response = Response(flamegraph_svg(stacks), mimetype='image/svg+xml')
+        else:
+            abort(404)
+        
+        response.headers['Content-Disposition'] = f'attachment; filename=profile-{session_id}.{fmt}'
+        response.headers['X-Profiled-Workers'] = ','.join(sorted(workers))
+        return response
+    
+    # Slow query log: top statement fingerprints by total time
+    @app.route('/admin/slow-queries')
+    @login_required
+    def admin_slow_queries():
+        limit = min(request.args.get('limit', 50, type=int), 500)
+        try:
+            queries = get_slow_queries(get_redis(), limit)
+        except Exception as e:
+            current_app.logger.error(f"Slow query log unavailable: {str(e)}")
+            queries = []
+            flash('The slow query log is unavailable right now.', 'warning')
+        
+        if request.args.get('format') == 'json':
+            return jsonify({'threshold_ms': current_app.config['SLOW_QUERY_THRESHOLD_MS'], 'queries': queries})
+        return render_template('admin/slow_queries.html', queries=queries,
+                               threshold_ms=current_app.config['SLOW_QUERY_THRESHOLD_MS'])
+    
+    @app.route('/admin/slow-queries/reset', methods=['POST'])
+    @login_required
+    def admin_slow_queries_reset():
+        try:
+            cleared = reset_slow_queries(get_redis())
+            flash(f'Cleared {cleared} slow query fingerprints.', 'success')
+        except redis.RedisError as e:
+            current_app.logger.error(f"Slow query log unavailable: {str(e)}")
+            flash('The slow query log is unavailable right now.', 'warning')
+        return redirect(url_for('admin_slow_queries'))
+    
+    # Circuit breaker states and the email outbox backlog
+    @app.route('/admin/breakers')
+    @login_required
+    def admin_breakers():
+        outbox_counts = dict(db.session.query(EmailOutbox.status, func.count(EmailOutbox.id))
+                             .group_by(EmailOutbox.status).all())
+        return jsonify({
+            'breakers': {name: breaker.status() for name, breaker in breakers.items()},
+            'outbox': outbox_counts,
+        })
+    
+    # This worker's admission control: in-flight requests, latency and shed counts per endpoint class
+    @app.route('/admin/admission')
+    @login_required
+    def admin_admission():
+        return jsonify(admission.status())
 
 def send_order_confirmation_email(order):
     """Send order confirmation email to customer"""
@@ -998,34 +1325,7 @@ def send_status_update_email(order, old_status):
     if not mail or old_status == order.status:
         return
     
-    msg = Message(
-        subject=f'Order Update - #{order.id} Status Changed',
-        recipients=[order.email]
-    )
-    
-    status_messages = {
-        'in_progress': 'Our team has started working on your order.',
-        'completed': 'Your order has been completed! Please check your email for the final documents.',
-        'cancelled': 'Your order has been cancelled. If you have any questions, please contact us.'
-    }
-    
-    msg.body = f"""
-Dear {order.full_name},
-
-Your order status has been updated.
-
-Order Details:
-- Order ID: #{order.id}
-- Service: {order.service.name} - {order.service_tier.title()}
-- New Status: {order.status.replace('_', ' ').title()}
-
-{status_messages.get(order.status, 'Your order status has been updated.')}
-
-Best regards,
-The CreateProResume Team
-"""
-    
-    mail.send(msg)
+    mail.send(status_update_message(order, order.status))
 
 def send_contact_notification_email(contact_message):
     """Send notification email to admin when contact form is submitted"""
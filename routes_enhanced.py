@@ -1,7 +1,6 @@
 import os
 import stripe
 import json
-import uuid
 from datetime import datetime, timedelta
 from flask import render_template, request, redirect, url_for, flash, send_file, jsonify, current_app, session, abort
 from flask_login import login_user, logout_user, login_required, current_user
@@ -23,6 +22,9 @@ from utils import (track_event, validate_discount_code, apply_discount_to_order,
                   save_uploaded_file, calculate_estimated_delivery, generate_referral_code,
                   generate_session_id, format_price, get_service_features_list,
                   log_user_action, send_admin_notification_email)
+from facets import get_facet_counts
+from versions import conditional, versioned_cache_key
+from replicas import read_only
 
 def register_enhanced_routes(app):
     
@@ -31,13 +33,13 @@ def register_enhanced_routes(app):
     def set_stripe_key():
         stripe.api_key = current_app.config.get('STRIPE_SECRET_KEY')
         
-        # Set user session for analytics
-        if 'user_id' not in session:
-            session['user_id'] = str(uuid.uuid4())
+        # The analytics id is created lazily by track_event, not here, so asset
+        # and other publicly cached responses never touch the session
     
     # Enhanced Home Page with testimonials, portfolio, and features
     @app.route('/')
-    @cache.cached(timeout=300)  # Cache for 5 minutes
+    @conditional(Service, Testimonial, Portfolio, FAQ)
+    @cache.cached(timeout=300, key_prefix=versioned_cache_key)  # Cache for 5 minutes
     def index():
         track_event('page_view', {'page': 'home'})
         
@@ -54,7 +56,9 @@ def register_enhanced_routes(app):
     
     # Testimonials Page
     @app.route('/testimonials')
-    @cache.cached(timeout=600)  # Cache for 10 minutes
+    @read_only
+    @conditional(Testimonial)
+    @cache.cached(timeout=600, key_prefix=versioned_cache_key)  # Cache for 10 minutes
     def testimonials():
         track_event('page_view', {'page': 'testimonials'})
         
@@ -73,21 +77,23 @@ def register_enhanced_routes(app):
             page=page, per_page=12, error_out=False
         )
         
-        # Get unique industries for filter
-        industries = db.session.query(Testimonial.industry).distinct().filter(
-            Testimonial.industry.isnot(None), Testimonial.approved == True
-        ).all()
-        industries = [i[0] for i in industries if i[0]]
+        # Filter options come from the precomputed facet index
+        industry_counts = get_facet_counts('testimonial', 'industry')
+        industries = sorted(value for value, _ in industry_counts)
         
         return render_template('testimonials.html', 
                              testimonials=testimonials,
                              industries=industries,
+                             industry_counts=dict(industry_counts),
+                             rating_counts=dict(get_facet_counts('testimonial', 'rating')),
                              current_industry=industry_filter,
                              current_rating=rating_filter)
     
     # Portfolio Showcase
     @app.route('/portfolio')
-    @cache.cached(timeout=600)
+    @read_only
+    @conditional(Portfolio)
+    @cache.cached(timeout=600, key_prefix=versioned_cache_key)
     def portfolio():
         track_event('page_view', {'page': 'portfolio'})
         
@@ -106,24 +112,26 @@ def register_enhanced_routes(app):
             page=page, per_page=9, error_out=False
         )
         
-        # Get filter options
-        industries = db.session.query(Portfolio.industry).distinct().filter(
-            Portfolio.industry.isnot(None), Portfolio.active == True
-        ).all()
-        industries = [i[0] for i in industries if i[0]]
+        # Get filter options from the facet index
+        industry_counts = get_facet_counts('portfolio', 'industry')
+        industries = sorted(value for value, _ in industry_counts)
         
         levels = ['entry', 'mid', 'senior', 'executive']
         
         return render_template('portfolio.html',
                              portfolio_items=portfolio_items,
                              industries=industries,
+                             industry_counts=dict(industry_counts),
                              levels=levels,
+                             level_counts=dict(get_facet_counts('portfolio', 'job_level')),
                              current_industry=industry_filter,
                              current_level=level_filter)
     
     # FAQ Page
     @app.route('/faq')
-    @cache.cached(timeout=600)
+    @read_only
+    @conditional(FAQ)
+    @cache.cached(timeout=600, key_prefix=versioned_cache_key)
     def faq():
         track_event('page_view', {'page': 'faq'})
         
@@ -147,6 +155,7 @@ def register_enhanced_routes(app):
         return render_template('faq.html',
                              faq_categories=faq_categories,
                              categories=categories,
+                             category_counts=dict(get_facet_counts('faq', 'category')),
                              current_category=category_filter)
     
     # Enhanced Order Form with discount codes
@@ -319,6 +328,7 @@ def register_enhanced_routes(app):
     
     # Order Tracking for Customers
     @app.route('/track-order')
+    @read_only
     def track_order():
         order_id = request.args.get('order_id')
         email = request.args.get('email')
@@ -416,32 +426,11 @@ def register_enhanced_routes(app):
         
         return redirect(request.referrer or url_for('index'))
     
-    # Live Chat System
-    @app.route('/chat')
-    def live_chat():
-        if not current_app.config.get('ENABLE_LIVE_CHAT', False):
-            flash('Live chat is currently unavailable.', 'info')
-            return redirect(url_for('contact'))
-        
-        session_id = session.get('chat_session_id')
-        if not session_id:
-            session_id = generate_session_id()
-            session['chat_session_id'] = session_id
-            
-            # Create new chat session
-            chat = LiveChat(session_id=session_id)
-            db.session.add(chat)
-            db.session.commit()
-        
-        chat = LiveChat.query.filter_by(session_id=session_id).first()
-        messages = ChatMessage.query.filter_by(chat_id=chat.id).order_by(
-            ChatMessage.created_at.asc()).all() if chat else []
-        
-        return render_template('live_chat.html', chat=chat, messages=messages)
-    
     # Templates Download
     @app.route('/templates')
-    @cache.cached(timeout=600)
+    @read_only
+    @conditional(Template)
+    @cache.cached(timeout=600, key_prefix=versioned_cache_key)
     def templates():
         category_filter = request.args.get('category', 'all')
         industry_filter = request.args.get('industry', 'all')
@@ -457,17 +446,17 @@ def register_enhanced_routes(app):
         
         # Get filter options
         categories = ['resume', 'cover_letter', 'linkedin']
-        industries = db.session.query(Template.industry).distinct().filter(
-            Template.industry.isnot(None), Template.active == True
-        ).all()
-        industries = [i[0] for i in industries if i[0]]
+        industry_counts = get_facet_counts('template', 'industry')
+        industries = sorted(value for value, _ in industry_counts)
         
         track_event('templates_viewed')
         
         return render_template('templates.html',
                              templates=templates,
                              categories=categories,
+                             category_counts=dict(get_facet_counts('template', 'category')),
                              industries=industries,
+                             industry_counts=dict(industry_counts),
                              current_category=category_filter,
                              current_industry=industry_filter)
     
@@ -0,0 +1,382 @@
+import re
+from sqlalchemy import event, inspect, text
+from flask import current_app
+from markupsafe import escape
+from app import db
+from models import FAQ, Testimonial, Portfolio, Template, Order
+
+# doc type -> (type code, model class, title column, body columns, visibility flag)
+# The type code is folded into the index row key so a document can be
+# replaced or removed with a primary-key lookup.
+SEARCH_SOURCES = {
+    'faq': (1, FAQ, 'question', ('question', 'answer'), 'active'),
+    'testimonial': (2, Testimonial, 'customer_name', ('testimonial_text',), 'approved'),
+    'portfolio': (3, Portfolio, 'title', ('description', 'results_achieved'), 'active'),
+    'template': (4, Template, 'name', ('description',), 'active'),
+}
+
+TYPE_CODE_BITS = 3
+
+# Order columns admins search by (typeahead on the admin dashboard)
+ORDER_SEARCH_FIELDS = ('email', 'first_name', 'last_name', 'target_position', 'industry', 'stripe_session_id')
+
+ORDER_SEARCH_EXPR = (
+    "lower(coalesce(email, '') || ' ' || coalesce(first_name, '') || ' ' || coalesce(last_name, '') || ' ' || "
+    "coalesce(target_position, '') || ' ' || coalesce(industry, '') || ' ' || coalesce(stripe_session_id, ''))"
+)
+
+# Trigram indexes cannot narrow down shorter queries
+MIN_ORDER_QUERY_LENGTH = 3
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+class SearchUnavailable(Exception):
+    """The search index needed for this query has not been set up"""
+
+# The database marks matches with these control characters; the snippet is
+# HTML-escaped afterwards and only then are they turned into <mark> tags
+MARK_START, MARK_END = '\x02', '\x03'
+
+def _doc_key(doc_type, doc_id):
+    """Pack a document type and id into a single integer key"""
+    return (doc_id << TYPE_CODE_BITS) | SEARCH_SOURCES[doc_type][0]
+
+def _document_for(doc_type, target):
+    """Build the indexed title and body for a model instance"""
+    _, _, title_attr, body_attrs, _ = SEARCH_SOURCES[doc_type]
+    title = getattr(target, title_attr) or ''
+    body = '\n'.join(getattr(target, attr) or '' for attr in body_attrs)
+    # Stored text must not be able to forge highlight markers
+    return _strip_marks(title), _strip_marks(body)
+
+def _strip_marks(value):
+    return value.replace(MARK_START, '').replace(MARK_END, '')
+
+def init_search_index(engine):
+    """Create the dialect-specific search index if it does not exist"""
+    with engine.begin() as connection:
+        if connection.dialect.name == 'postgresql':
+            connection.execute(text("""
+                CREATE TABLE IF NOT EXISTS search_documents (
+                    doc_key BIGINT PRIMARY KEY,
+                    doc_type VARCHAR(20) NOT NULL,
+                    doc_id INTEGER NOT NULL,
+                    title TEXT,
+                    body TEXT,
+                    document TSVECTOR GENERATED ALWAYS AS (
+                        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+                        setweight(to_tsvector('english', coalesce(body, '')), 'B')
+                    ) STORED
+                )
+            """))
+            connection.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_search_documents_document "
+                "ON search_documents USING GIN (document)"
+            ))
+
+            # Trigram index for admin order typeahead, when pg_trgm is installed
+            if _has_pg_trgm(connection):
+                _create_order_trigram_index(connection)
+            else:
+                current_app.logger.warning(
+                    "pg_trgm is not installed; admin order search is unavailable until "
+                    "`flask enable-order-search` is run by a database superuser")
+        elif connection.dialect.name == 'sqlite':
+            connection.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+                "doc_type UNINDEXED, doc_id UNINDEXED, title, body, "
+                "tokenize='porter unicode61')"
+            ))
+
+            # Prefix-indexed mirror of the searchable order columns
+            connection.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS order_search_index USING fts5("
+                f"{', '.join(ORDER_SEARCH_FIELDS)}, prefix='2 3 4')"
+            ))
+        else:
+            current_app.logger.warning(f"Full-text search is not supported on {connection.dialect.name}")
+
+def _has_pg_trgm(connection):
+    return connection.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first() is not None
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _create_order_trigram_index(connection):
+    # GiST rather than GIN: GiST can return rows in distance order, so the
+    # typeahead's ORDER BY ... LIMIT stops after the first few index hits
+    connection.execute(text("DROP INDEX IF EXISTS ix_orders_search_trgm"))
+    connection.execute(text(
+        f"CREATE INDEX IF NOT EXISTS ix_orders_search_trgm_gist "
+        f"ON orders USING GIST (({ORDER_SEARCH_EXPR}) gist_trgm_ops)"
+    ))
+
+def enable_order_search():
+    """Install pg_trgm and build the order trigram index (needs a superuser once)"""
+    connection = db.session.connection()
+    if connection.dialect.name != 'postgresql':
+        return False
+    connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    _create_order_trigram_index(connection)
+    db.session.commit()
+    return True
+
+def index_document(connection, doc_type, doc_id, title, body):
+    """Insert or replace one document in the search index"""
+    doc_key = _doc_key(doc_type, doc_id)
+    params = {'doc_key': doc_key, 'doc_type': doc_type, 'doc_id': doc_id, 'title': title, 'body': body}
+
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("""
+            INSERT INTO search_documents (doc_key, doc_type, doc_id, title, body)
+            VALUES (:doc_key, :doc_type, :doc_id, :title, :body)
+            ON CONFLICT (doc_key) DO UPDATE SET title = excluded.title, body = excluded.body
+        """), params)
+    elif connection.dialect.name == 'sqlite':
+        connection.execute(text("DELETE FROM search_index WHERE rowid = :doc_key"), params)
+        connection.execute(text(
+            "INSERT INTO search_index (rowid, doc_type, doc_id, title, body) "
+            "VALUES (:doc_key, :doc_type, :doc_id, :title, :body)"
+        ), params)
+
+def remove_document(connection, doc_type, doc_id):
+    """Remove one document from the search index"""
+    params = {'doc_key': _doc_key(doc_type, doc_id)}
+
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("DELETE FROM search_documents WHERE doc_key = :doc_key"), params)
+    elif connection.dialect.name == 'sqlite':
+        connection.execute(text("DELETE FROM search_index WHERE rowid = :doc_key"), params)
+
+def _make_listeners(doc_type, visible_attr):
+    """Build insert/update/delete listeners for one searchable model"""
+
+    def after_save(mapper, connection, target):
+        if getattr(target, visible_attr):
+            title, body = _document_for(doc_type, target)
+            index_document(connection, doc_type, target.id, title, body)
+        else:
+            remove_document(connection, doc_type, target.id)
+
+    def after_delete(mapper, connection, target):
+        remove_document(connection, doc_type, target.id)
+
+    return after_save, after_delete
+
+def index_order(connection, order):
+    """Mirror an order's searchable columns into the SQLite prefix index"""
+    if connection.dialect.name != 'sqlite':
+        # PostgreSQL searches the orders table directly through the trigram index
+        return
+
+    params = {field: getattr(order, field) or '' for field in ORDER_SEARCH_FIELDS}
+    params['order_id'] = order.id
+    connection.execute(text("DELETE FROM order_search_index WHERE rowid = :order_id"), params)
+    connection.execute(text(
+        f"INSERT INTO order_search_index (rowid, {', '.join(ORDER_SEARCH_FIELDS)}) "
+        f"VALUES (:order_id, {', '.join(':' + field for field in ORDER_SEARCH_FIELDS)})"
+    ), params)
+
+def _order_after_insert(mapper, connection, target):
+    index_order(connection, target)
+
+def _order_after_update(mapper, connection, target):
+    # Status and note updates are by far the most common; skip those
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in ORDER_SEARCH_FIELDS):
+        index_order(connection, target)
+
+def _order_after_delete(mapper, connection, target):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text("DELETE FROM order_search_index WHERE rowid = :order_id"), {'order_id': target.id})
+
+_listeners_registered = False
+
+def register_search_listeners():
+    """Keep the search index in sync with ORM inserts, updates and deletes"""
+    global _listeners_registered
+    if _listeners_registered:
+        return
+    _listeners_registered = True
+
+    for doc_type, (_, model, _, _, visible_attr) in SEARCH_SOURCES.items():
+        after_save, after_delete = _make_listeners(doc_type, visible_attr)
+        event.listen(model, 'after_insert', after_save)
+        event.listen(model, 'after_update', after_save)
+        event.listen(model, 'after_delete', after_delete)
+
+    event.listen(Order, 'after_insert', _order_after_insert)
+    event.listen(Order, 'after_update', _order_after_update)
+    event.listen(Order, 'after_delete', _order_after_delete)
+
+def rebuild_search_index(batch_size=1000):
+    """Re-index every searchable document from the source tables"""
+    connection = db.session.connection()
+
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("DELETE FROM search_documents"))
+    elif connection.dialect.name == 'sqlite':
+        connection.execute(text("DELETE FROM search_index"))
+    else:
+        return 0
+
+    indexed = 0
+    for doc_type, (_, model, _, _, visible_attr) in SEARCH_SOURCES.items():
+        query = model.query.filter(getattr(model, visible_attr) == True).order_by(model.id)
+        for target in query.yield_per(batch_size):
+            title, body = _document_for(doc_type, target)
+            index_document(connection, doc_type, target.id, title, body)
+            indexed += 1
+
+    db.session.commit()
+    return indexed
+
+def rebuild_order_search_index(batch_size=1000):
+    """Re-populate the SQLite order prefix index from the orders table"""
+    connection = db.session.connection()
+    if connection.dialect.name != 'sqlite':
+        return 0
+
+    connection.execute(text("DELETE FROM order_search_index"))
+
+    indexed = 0
+    for order in Order.query.order_by(Order.id).yield_per(batch_size):
+        index_order(connection, order)
+        indexed += 1
+
+    db.session.commit()
+    return indexed
+
+def backfill_search_index():
+    """Build the search indexes once on databases that predate them
+
+    Returns the number of documents indexed, 0 when the indexes already
+    had content or there was nothing to index.
+    """
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        table = 'search_documents'
+    elif connection.dialect.name == 'sqlite':
+        table = 'search_index'
+    else:
+        return 0
+
+    indexed = 0
+    if connection.execute(text(f"SELECT 1 FROM {table} LIMIT 1")).first() is None:
+        indexed += rebuild_search_index()
+    if connection.dialect.name == 'sqlite':
+        connection = db.session.connection()
+        if connection.execute(text("SELECT 1 FROM order_search_index LIMIT 1")).first() is None:
+            indexed += rebuild_order_search_index()
+    db.session.commit()
+    return indexed
+
+def _query_terms(query):
+    """Split user input into safe search terms"""
+    return TOKEN_RE.findall(query.lower())[:10]
+
+def _highlight(snippet):
+    """HTML-escape a snippet and wrap its marked matches in <mark> tags"""
+    return str(escape(snippet or '')).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+def search(query, doc_types=None, limit=20):
+    """Run a ranked full-text search, best matches first"""
+    terms = _query_terms(query or '')
+    if not terms:
+        return []
+
+    doc_types = [t for t in (doc_types or SEARCH_SOURCES) if t in SEARCH_SOURCES]
+    if not doc_types:
+        return []
+
+    connection = db.session.connection()
+    params = {'limit': limit}
+    type_params = ', '.join(f':type_{i}' for i in range(len(doc_types)))
+    params.update({f'type_{i}': doc_type for i, doc_type in enumerate(doc_types)})
+
+    if connection.dialect.name == 'postgresql':
+        # Every term must match; the last one may be a prefix (search-as-you-type)
+        params['headline_options'] = f'StartSel={MARK_START}, StopSel={MARK_END}, MaxWords=25, MinWords=10'
+        params['tsquery'] = ' & '.join(terms[:-1] + [terms[-1] + ':*'])
+        rows = connection.execute(text(f"""
+            SELECT hits.doc_type, hits.doc_id, hits.title, hits.rank,
+                   ts_headline('english', hits.body, hits.query, :headline_options) AS snippet
+            FROM (
+                SELECT doc_type, doc_id, title, body, query, ts_rank(document, query) AS rank
+                FROM search_documents, to_tsquery('english', :tsquery) AS query
+                WHERE document @@ query AND doc_type IN ({type_params})
+                ORDER BY rank DESC
+                LIMIT :limit
+            ) AS hits
+            ORDER BY hits.rank DESC
+        """), params)
+    elif connection.dialect.name == 'sqlite':
+        params.update(mark_start=MARK_START, mark_end=MARK_END)
+        params['match'] = ' '.join(f'"{term}"' for term in terms[:-1]) + f' "{terms[-1]}"*'
+        rows = connection.execute(text(f"""
+            SELECT doc_type, doc_id, title, -bm25(search_index, 0.0, 0.0, 4.0, 1.0) AS rank,
+                   snippet(search_index, 3, :mark_start, :mark_end, '...', 20) AS snippet
+            FROM search_index
+            WHERE search_index MATCH :match AND doc_type IN ({type_params})
+            ORDER BY bm25(search_index, 0.0, 0.0, 4.0, 1.0)
+            LIMIT :limit
+        """), params)
+    else:
+        return []
+
+    return [{
+        'type': row.doc_type,
+        'id': row.doc_id,
+        'title': row.title,
+        'snippet': _highlight(row.snippet),
+        'rank': round(float(row.rank), 4)
+    } for row in rows]
+
+def search_orders(query, limit=10):
+    """Find orders by email, name, target position, industry or Stripe session id"""
+    query = (query or '').strip().lower()
+    if len(query) < MIN_ORDER_QUERY_LENGTH:
+        return []
+
+    connection = db.session.connection()
+
+    if connection.dialect.name == 'postgresql':
+        # Without pg_trgm the operators below do not exist, and the failed
+        # statement would abort the rest of the request's transaction
+        if not _has_pg_trgm(connection):
+            raise SearchUnavailable("pg_trgm is not installed; run `flask enable-order-search`")
+
+        # %> and <->> compare the query with the best-matching stretch of the
+        # row text (word similarity), so an exact Stripe id or email is at
+        # distance 0 and comes first. Word similarity misses fragments from the
+        # middle of a word ("mith" in "smith"), so the substring LIKE the search
+        # used to run is kept as a second condition; gist_trgm_ops serves both,
+        # and the GiST index returns ORDER BY ... LIMIT as a nearest-neighbour
+        # scan instead of sorting every match.
+        rows = connection.execute(text(f"""
+            SELECT id FROM orders
+            WHERE {ORDER_SEARCH_EXPR} %> :query
+               OR {ORDER_SEARCH_EXPR} LIKE :pattern ESCAPE '\\'
+            ORDER BY {ORDER_SEARCH_EXPR} <->> :query
+            LIMIT :limit
+        """), {'query': query, 'pattern': f'%{_escape_like(query)}%', 'limit': limit})
+    elif connection.dialect.name == 'sqlite':
+        terms = _query_terms(query)
+        if not terms:
+            return []
+        match = ' '.join(f'"{term}"*' for term in terms)
+        rows = connection.execute(text("""
+            SELECT rowid AS id FROM order_search_index
+            WHERE order_search_index MATCH :match
+            ORDER BY rank, rowid DESC
+            LIMIT :limit
+        """), {'match': match, 'limit': limit})
+    else:
+        return []
+
+    order_ids = [row.id for row in rows]
+    if not order_ids:
+        return []
+
+    orders = {order.id: order for order in Order.query.filter(Order.id.in_(order_ids)).all()}
+    return [orders[order_id] for order_id in order_ids if order_id in orders]
@@ -0,0 +1,241 @@
+import io
+import csv
+import json
+import random
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from flask import current_app
+from app import db
+from models import (Service, Order, OrderTracking, Testimonial, LiveChat, ChatMessage, Analytics,
+                    DiscountCode)
+
+FIRST_NAMES = ('James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David',
+               'Elizabeth', 'Wei', 'Priya', 'Carlos', 'Fatima', 'Olga', 'Kenji', 'Amara', 'Liam')
+LAST_NAMES = ('Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Chen',
+              'Patel', 'Nguyen', 'Kim', 'Okafor', 'Silva', 'Kowalski', 'Hassan', 'Tanaka', "O'Brien")
+POSITIONS = ('Software Engineer', 'Product Manager', 'Data Analyst', 'Marketing Manager', 'Registered Nurse',
+             'Accountant', 'Sales Director', 'UX Designer', 'Operations Lead', 'Teacher', 'Project Manager')
+# (industry, relative weight): a few industries dominate, like real traffic
+INDUSTRIES = (('Technology', 30), ('Healthcare', 15), ('Finance', 15), ('Marketing', 10), ('Education', 8),
+              ('Retail', 7), ('Manufacturing', 6), ('Government', 5), ('Hospitality', 4))
+TIERS = (('basic', 50), ('standard', 35), ('premium', 15))
+ORDER_STATUSES = (('completed', 55), ('in_progress', 20), ('pending', 20), ('cancelled', 5))
+TRACKING_STEPS = ('pending', 'payment_received', 'in_progress', 'draft_ready', 'completed')
+RATINGS = ((5, 60), (4, 25), (3, 10), (2, 3), (1, 2))
+PAGES = (('home', 40), ('order', 20), ('testimonials', 12), ('portfolio', 10), ('faq', 10), ('templates', 8))
+USER_AGENTS = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 14_5) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 Safari/605.1.15',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148',
+    'Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Mobile Safari/537.36',
+)
+CHAT_LINES = ('Hi, how long does a premium resume take?', 'Can I add a cover letter later?',
+              'Thanks, that helps!', 'Our writers usually deliver within 3-5 business days.',
+              'Yes, you can upgrade at any time from your order page.', 'Is there a discount for students?')
+
+class Weighted:
+    """Deterministic weighted choice over (value, weight) pairs"""
+
+    def __init__(self, rng, pairs):
+        self.rng = rng
+        self.values = [value for value, _ in pairs]
+        self.weights = [weight for _, weight in pairs]
+
+    def __call__(self):
+        return self.rng.choices(self.values, self.weights)[0]
+
+def _recent_timestamp(rng, now, days):
+    """Random timestamp in the last N days, skewed towards recent ones"""
+    age = min(rng.expovariate(3.0 / days), days)
+    return now - timedelta(days=age, seconds=rng.randrange(86400))
+
+def _next_id(connection, table):
+    return (connection.execute(text(f"SELECT max(id) FROM {table.name}")).scalar() or 0) + 1
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, dict):
+        return json.dumps(value)
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return value
+
+def bulk_insert(connection, table, rows):
+    """Insert many rows with COPY on PostgreSQL and executemany elsewhere"""
+    if not rows:
+        return 0
+
+    if connection.dialect.name == 'postgresql':
+        columns = list(rows[0])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([_copy_value(row[column]) for column in columns])
+        buffer.seek(0)
+
+        cursor = connection.connection.cursor()
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer
+        )
+        # Explicit ids were copied in, so move the sequence past them
+        connection.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), (SELECT max(id) FROM {table.name}))"
+        ))
+    else:
+        connection.execute(table.insert(), rows)
+
+    return len(rows)
+
+def generate_dataset(orders=1000, seed=42, days=180):
+    """Seed a deterministic, realistically skewed dataset for load testing
+
+    The same orders/seed/days always produce the same rows, so runs are
+    comparable across machines and databases. Rows are bulk inserted, which
+    bypasses the ORM listeners; derived indexes are rebuilt at the end.
+    """
+    rng = random.Random(seed)
+    now = datetime(2025, 1, 1) + timedelta(days=days)
+    industry = Weighted(rng, INDUSTRIES)
+    tier = Weighted(rng, TIERS)
+    order_status = Weighted(rng, ORDER_STATUSES)
+    rating = Weighted(rng, RATINGS)
+    page = Weighted(rng, PAGES)
+
+    services = Service.query.filter_by(active=True).order_by(Service.id).all()
+    if not services:
+        raise RuntimeError("Seed the default services before generating load data")
+
+    connection = db.session.connection()
+    ids = {table: _next_id(connection, table.__table__)
+           for table in (Order, OrderTracking, Testimonial, LiveChat, ChatMessage, Analytics, DiscountCode)}
+    rows = {table: [] for table in ids}
+
+    def add(model, **values):
+        values['id'] = ids[model]
+        ids[model] += 1
+        rows[model].append(values)
+        return values['id']
+
+    for _ in range(max(1, orders // 50)):
+        valid_from = now - timedelta(days=rng.randrange(days))
+        add(DiscountCode,
+            code=f"LOAD{seed}X{ids[DiscountCode]}",
+            description='Load test discount',
+            discount_type=rng.choice(('percentage', 'fixed')),
+            discount_value=rng.choice((5, 10, 15, 20, 25)),
+            minimum_order=rng.choice((0, 0, 50, 100)),
+            maximum_uses=rng.choice((None, 50, 100, 500)),
+            current_uses=rng.randrange(50),
+            valid_from=valid_from,
+            valid_until=valid_from + timedelta(days=rng.choice((7, 30, 90, 365))),
+            active=rng.random() < 0.8,
+            created_at=valid_from)
+
+    for _ in range(orders):
+        service = rng.choice(services)
+        service_tier = tier()
+        status = order_status()
+        paid = status in ('completed', 'in_progress') or (status == 'pending' and rng.random() < 0.2)
+        created_at = _recent_timestamp(rng, now, days)
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        user_id = str(uuid.UUID(int=rng.getrandbits(128)))
+
+        order_id = add(Order,
+            first_name=first_name,
+            last_name=last_name,
+            email=f"{first_name}.{last_name}.{ids[Order]}@example.com".lower().replace("'", ''),
+            phone=f"555-{rng.randrange(1000):03d}-{rng.randrange(10000):04d}",
+            service_id=service.id,
+            service_tier=service_tier,
+            total_amount=getattr(service, f"price_{service_tier}"),
+            current_position=rng.choice(POSITIONS),
+            target_position=rng.choice(POSITIONS),
+            industry=industry(),
+            experience_years=min(int(rng.expovariate(1 / 7.0)), 40),
+            career_goals='Move into a senior role with more ownership.',
+            status=status,
+            payment_status='paid' if paid else rng.choice(('pending', 'pending', 'failed')),
+            stripe_session_id=f"cs_load_{seed}_{ids[Order]}" if paid else None,
+            created_at=created_at,
+            updated_at=created_at,
+            completed_at=created_at + timedelta(days=rng.randrange(2, 8)) if status == 'completed' else None)
+
+        steps = TRACKING_STEPS if status == 'completed' else TRACKING_STEPS[:rng.randrange(1, 4)]
+        for offset, step in enumerate(steps):
+            add(OrderTracking,
+                order_id=order_id,
+                status=step,
+                description=f"Order {step.replace('_', ' ')}",
+                created_by='system' if offset == 0 else 'admin',
+                created_at=created_at + timedelta(hours=offset * rng.randrange(4, 30)),
+                customer_notified=offset > 0)
+
+        # Funnel leading up to the order, plus some browsing afterwards
+        events = [('page_view', {'page': page()}) for _ in range(rng.randrange(1, 6))]
+        events += [('page_view', {'page': 'order'}),
+                   ('order_started', {'service_id': service.id, 'service_tier': service_tier}),
+                   ('order_created', {'order_id': order_id})]
+        if rng.random() < 0.3:
+            events.append(('order_tracked', {'order_id': order_id}))
+        user_agent = rng.choice(USER_AGENTS)
+        for position, (event_type, event_data) in enumerate(events):
+            add(Analytics,
+                event_type=event_type,
+                event_data=event_data,
+                user_id=user_id,
+                ip_address=f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+                user_agent=user_agent,
+                referrer=rng.choice((None, 'https://www.google.com/', 'https://www.linkedin.com/')),
+                created_at=created_at - timedelta(minutes=(len(events) - position) * rng.randrange(1, 5)),
+                sample_weight=1.0,
+                page=event_data.get('page'),
+                order_id=event_data.get('order_id'),
+                template_id=None)
+
+        if status == 'completed' and rng.random() < 0.15:
+            add(Testimonial,
+                customer_name=f"{first_name} {last_name[0]}.",
+                customer_title=rng.choice(POSITIONS),
+                rating=rating(),
+                testimonial_text='The new resume got me three interviews in the first two weeks.',
+                industry=rows[Order][-1]['industry'],
+                service_used=service.name,
+                featured=rng.random() < 0.1,
+                approved=rng.random() < 0.8,
+                created_at=created_at + timedelta(days=10))
+
+        if rng.random() < 0.1:
+            chat_id = add(LiveChat,
+                session_id=f"load-{seed}-{ids[LiveChat]}",
+                customer_email=rows[Order][-1]['email'],
+                customer_name=f"{first_name} {last_name}",
+                status='closed' if created_at < now - timedelta(days=1) else 'active',
+                created_at=created_at,
+                closed_at=created_at + timedelta(minutes=30) if created_at < now - timedelta(days=1) else None)
+            for position in range(1 + int(rng.expovariate(1 / 6.0))):
+                add(ChatMessage,
+                    chat_id=chat_id,
+                    sender_type='customer' if position % 2 == 0 else 'admin',
+                    sender_name=first_name if position % 2 == 0 else 'Support',
+                    message=rng.choice(CHAT_LINES),
+                    created_at=created_at + timedelta(minutes=position))
+
+    counts = {}
+    for model in (DiscountCode, Order, OrderTracking, Testimonial, LiveChat, ChatMessage, Analytics):
+        counts[model.__tablename__] = bulk_insert(connection, model.__table__, rows[model])
+    db.session.commit()
+
+    # Bulk inserts skip the ORM listeners that maintain derived data
+    from facets import rebuild_facets
+    from search import rebuild_search_index, rebuild_order_search_index
+    from versions import bump_version
+    rebuild_facets()
+    rebuild_search_index()
+    rebuild_order_search_index()
+    bump_version(db.session.connection(), Testimonial.__tablename__)
+    db.session.commit()
+
+    current_app.logger.info(f"Generated load test data: {counts}")
+    return counts
@@ -0,0 +1,279 @@
+import os
+import re
+import time
+import logging
+import secrets
+import sqlite3
+import threading
+from datetime import datetime
+import msgpack
+import redis
+from flask import request
+from flask.sessions import SessionInterface, SessionMixin
+from breakers import get_breaker, no_retry, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+SID_RE = re.compile(r'[A-Za-z0-9_-]{43}')
+DATETIME_EXT = 1
+# A session's expiry is only pushed back once it has slid this far, so most reads don't write
+SQLITE_TOUCH_SECONDS = 60
+SQLITE_PURGE_SECONDS = 600
+# Publicly cacheable file responses; extensions (Flask-Login) still peek at the session on
+# these, which must neither hit the backend nor add Set-Cookie / Vary: Cookie
+SESSIONLESS_ENDPOINTS = ('static', 'built_asset')
+
+def new_session_id():
+    return secrets.token_urlsafe(32)
+
+def _encode_extra(value):
+    if isinstance(value, datetime):
+        return msgpack.ExtType(DATETIME_EXT, value.isoformat().encode('ascii'))
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    # UUIDs, Decimals and the like come back as strings
+    return str(value)
+
+def _decode_extra(code, data):
+    if code == DATETIME_EXT:
+        return datetime.fromisoformat(data.decode('ascii'))
+    return msgpack.ExtType(code, data)
+
+def encode_session(data):
+    """msgpack bytes for a session dict; tuples come back as lists, datetimes as datetimes"""
+    return msgpack.packb(data, use_bin_type=True, default=_encode_extra)
+
+def decode_session(blob):
+    return msgpack.unpackb(blob, raw=False, ext_hook=_decode_extra, strict_map_key=False)
+
+class SessionUnavailable(Exception):
+    """The backend could not be reached; the stored session is unknown, not missing"""
+
+class RedisSessionBackend:
+    """Sessions as Redis strings whose TTL is reset by every read (GETEX)"""
+
+    def __init__(self, client, prefix='session:'):
+        self.client = client
+        self.prefix = prefix
+
+    def _call(self, method, *args, **kwargs):
+        try:
+            return get_breaker('redis').call(method, *args, **kwargs)
+        except (CircuitOpenError, redis.RedisError) as e:
+            raise SessionUnavailable(str(e)) from e
+
+    def load(self, sid, ttl):
+        return self._call(self.client.getex, self.prefix + sid, ex=ttl)
+
+    def save(self, sid, blob, ttl):
+        self._call(self.client.set, self.prefix + sid, blob, ex=ttl)
+
+    def delete(self, sid):
+        self._call(self.client.delete, self.prefix + sid)
+
+class SQLiteSessionBackend:
+    """Sessions in a local SQLite file, for deployments without Redis
+
+    Every worker on the host shares the file; each thread keeps its own
+    connection. Expired rows are purged every SQLITE_PURGE_SECONDS.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._purged_at = 0.0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data BLOB NOT NULL, expires_at REAL NOT NULL)'
+        )
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def load(self, sid, ttl):
+        now = time.time()
+        connection = self._connection()
+        row = connection.execute('SELECT data, expires_at FROM sessions WHERE id = ?', (sid,)).fetchone()
+        if row is None or row[1] <= now:
+            return None
+        if row[1] < now + ttl - SQLITE_TOUCH_SECONDS:
+            connection.execute('UPDATE sessions SET expires_at = ? WHERE id = ?', (now + ttl, sid))
+        return row[0]
+
+    def save(self, sid, blob, ttl):
+        now = time.time()
+        connection = self._connection()
+        connection.execute('INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)',
+                           (sid, blob, now + ttl))
+        if now - self._purged_at > SQLITE_PURGE_SECONDS:
+            self._purged_at = now
+            connection.execute('DELETE FROM sessions WHERE expires_at <= ?', (now,))
+
+    def delete(self, sid):
+        self._connection().execute('DELETE FROM sessions WHERE id = ?', (sid,))
+
+class ServerSession(SessionMixin):
+    """Session whose data is fetched from the backend on first access
+
+    Requests that never touch `session` (static files, most API calls)
+    cost no backend round trip.
+    """
+
+    def __init__(self, sid, loader=None, new=False):
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.accessed = False
+        self.unavailable = False
+        self._loader = loader
+        self._data = None if loader else {}
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    @property
+    def data(self):
+        self.accessed = True
+        if self._data is None:
+            self._data = self._loader(self)
+        return self._data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __repr__(self):
+        return f'<ServerSession {self.sid[:8]}... {self._data if self.loaded else "(not loaded)"}>'
+
+class ServerSessionInterface(SessionInterface):
+    """Keeps session data in a backend; the cookie holds only a random session id
+
+    The session's TTL is PERMANENT_SESSION_LIFETIME and slides: every
+    request that reads the session extends it. Unknown or expired ids get
+    a fresh id rather than being reused. While the backend is unreachable
+    the session reads as empty and nothing is written, so the stored
+    session survives the outage.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _ttl(self, app):
+        return int(app.permanent_session_lifetime.total_seconds())
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid or not SID_RE.fullmatch(sid):
+            return ServerSession(new_session_id(), new=True)
+
+        ttl = self._ttl(app)
+
+        def load(session):
+            # Loaded lazily, so the URL has been matched by now
+            if request.endpoint in SESSIONLESS_ENDPOINTS:
+                return {}
+            try:
+                blob = self.backend.load(session.sid, ttl)
+            except SessionUnavailable as e:
+                logger.warning(f"Session store unavailable, serving an empty session: {str(e)}")
+                session.unavailable = True
+                return {}
+            if blob is None:
+                session.sid = new_session_id()
+                session.new = True
+                return {}
+            try:
+                return decode_session(blob)
+            except (ValueError, msgpack.UnpackException) as e:
+                logger.warning(f"Discarding undecodable session: {str(e)}")
+                session.sid = new_session_id()
+                session.new = True
+                return {}
+
+        return ServerSession(sid, loader=load)
+
+    def save_session(self, app, session, response):
+        if not session.loaded or session.unavailable or request.endpoint in SESSIONLESS_ENDPOINTS:
+            return
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and not session.new:
+                try:
+                    self.backend.delete(session.sid)
+                except SessionUnavailable as e:
+                    logger.warning(f"Could not delete session: {str(e)}")
+                response.delete_cookie(name, domain=domain, path=path, secure=self.get_cookie_secure(app),
+                                       httponly=self.get_cookie_httponly(app),
+                                       samesite=self.get_cookie_samesite(app))
+            return
+
+        if session.modified:
+            try:
+                self.backend.save(session.sid, encode_session(dict(session._data)), self._ttl(app))
+            except SessionUnavailable as e:
+                logger.warning(f"Could not save session: {str(e)}")
+                return
+
+        if session.new or self.should_set_cookie(app, session):
+            response.set_cookie(
+                name,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+                partitioned=self.get_cookie_partitioned(app),
+            )
+
+def init_sessions(app):
+    """Replace the signed-cookie session with the configured server-side store"""
+    backend_name = app.config['SESSION_BACKEND']
+    if backend_name == 'redis':
+        timeout = app.config['REDIS_TIMEOUT']
+        client = redis.Redis.from_url(app.config['REDIS_URL'], socket_timeout=timeout,
+                                      socket_connect_timeout=timeout, retry=no_retry())
+        backend = RedisSessionBackend(client)
+    elif backend_name == 'sqlite':
+        backend = SQLiteSessionBackend(os.path.join(app.root_path, app.config['SESSION_SQLITE_PATH']))
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND {backend_name!r}, expected 'redis' or 'sqlite'")
+
+    app.session_interface = ServerSessionInterface(backend)
+    return app
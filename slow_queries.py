@@ -0,0 +1,223 @@
+import os
+import re
+import json
+import time
+import hashlib
+import traceback
+from datetime import datetime
+from flask import current_app, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import redis
+
+TOTALS_KEY = 'slowq:by_total'
+RECENT_KEY = 'slowq:recent'
+RECENT_LIMIT = 200
+MAX_PARAM_LENGTH = 64
+
+EXPLAINABLE_RE = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b', re.I)
+# Quoted strings and bare numbers; digits inside identifiers like anon_1 are left alone
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+# Expanded IN lists vary in length per call but are the same statement
+IN_LIST_RE = re.compile(r'\bIN\s*\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)', re.I)
+WHITESPACE_RE = re.compile(r'\s+')
+SENSITIVE_PARAM_RE = re.compile(r'pass|secret|token|key|email|phone|card|stripe|session|ip_address', re.I)
+EMAIL_RE = re.compile(r'[^@\s]+@[^@\s]+')
+
+_listeners_registered = False
+_threshold_ms = None
+
+def stats_key(fingerprint):
+    return f"slowq:{fingerprint}"
+
+def fingerprint_statement(statement):
+    """Normalize literals and IN lists away; returns (normalized SQL, fingerprint)"""
+    normalized = LITERAL_RE.sub('?', statement)
+    normalized = IN_LIST_RE.sub('IN (...)', normalized)
+    normalized = WHITESPACE_RE.sub(' ', normalized).strip()
+    return normalized, hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+def _redact_value(name, value):
+    if name and SENSITIVE_PARAM_RE.search(name):
+        return '[redacted]'
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, str):
+        if EMAIL_RE.fullmatch(value):
+            return '[redacted]'
+        if len(value) > MAX_PARAM_LENGTH:
+            return value[:MAX_PARAM_LENGTH] + '...'
+        return value
+    if value is None or isinstance(value, (int, float, bool)):
+        return value
+    return str(value)
+
+def redact_parameters(parameters, context=None):
+    """Bound parameters safe to log: sensitive names and email-like values are masked
+
+    Positional parameters (qmark/format drivers) are named from the compiled
+    statement when the counts line up, otherwise only values are checked.
+    """
+    if isinstance(parameters, dict):
+        return {name: _redact_value(name, value) for name, value in parameters.items()}
+
+    parameters = list(parameters or ())
+    names = getattr(getattr(context, 'compiled', None), 'positiontup', None) or []
+    if len(names) != len(parameters):
+        names = [None] * len(parameters)
+    return [_redact_value(name, value) for name, value in zip(names, parameters)]
+
+def calling_frame(root_path):
+    """file:line in function of the innermost application frame that issued the query"""
+    this_file = os.path.abspath(__file__)
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename.startswith('<'):
+            continue
+        filename = os.path.abspath(frame.filename)
+        if filename == this_file or not filename.startswith(root_path + os.sep) or 'site-packages' in filename:
+            continue
+        return f"{os.path.relpath(filename, root_path)}:{frame.lineno} in {frame.name}"
+    return None
+
+def explain_statement(conn, statement, parameters):
+    """Plan for a statement, run on a fresh cursor of the same DBAPI connection
+
+    The statement's own cursor still holds its results, so it is left
+    alone. On PostgreSQL a savepoint keeps a failed EXPLAIN from aborting
+    the request's transaction.
+    """
+    dialect = conn.dialect.name
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+    savepoint = dialect == 'postgresql'
+
+    cursor = conn.connection.cursor()
+    try:
+        if savepoint:
+            cursor.execute('SAVEPOINT slow_query_explain')
+        try:
+            cursor.execute(prefix + statement, parameters)
+            rows = cursor.fetchall()
+        except Exception:
+            if savepoint:
+                cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+            raise
+        if savepoint:
+            cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+    finally:
+        cursor.close()
+
+    if dialect == 'sqlite':
+        # (id, parent, notused, detail); indent each step under its parent
+        depth = {0: -1}
+        lines = []
+        for row in rows:
+            depth[row[0]] = depth.get(row[1], -1) + 1
+            lines.append('  ' * depth[row[0]] + row[-1])
+        return '\n'.join(lines)
+    return '\n'.join(' | '.join(str(column) for column in row) for row in rows)
+
+def record_slow_query(client, entry, conn=None, parameters=None):
+    """Add one slow execution to its fingerprint's totals, explaining new fingerprints"""
+    key = stats_key(entry['fingerprint'])
+    pipe = client.pipeline()
+    pipe.hsetnx(key, 'sql', entry['sql'])
+    pipe.hincrby(key, 'count', 1)
+    pipe.hincrbyfloat(key, 'total_ms', entry['duration_ms'])
+    pipe.hset(key, mapping={
+        'last_endpoint': entry['endpoint'] or '',
+        'last_location': entry['location'] or '',
+        'last_parameters': json.dumps(entry['parameters']),
+        'last_seen': entry['recorded_at'],
+    })
+    pipe.zincrby(TOTALS_KEY, entry['duration_ms'], entry['fingerprint'])
+    pipe.lpush(RECENT_KEY, json.dumps(entry))
+    pipe.ltrim(RECENT_KEY, 0, RECENT_LIMIT - 1)
+    pipe.execute()
+
+    # No atomic HMAX; a lost race only under-reports the max by one sample
+    if entry['duration_ms'] > float(client.hget(key, 'max_ms') or 0):
+        client.hset(key, 'max_ms', entry['duration_ms'])
+
+    # Claim the plan slot so only one worker runs EXPLAIN per fingerprint
+    if conn is not None and EXPLAINABLE_RE.match(entry['sql']) and client.hsetnx(key, 'plan', ''):
+        try:
+            plan = explain_statement(conn, entry['statement'], parameters)
+        except Exception as e:
+            plan = f"EXPLAIN failed: {str(e)}"
+        client.hset(key, 'plan', plan)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_start_time'].pop()
+    duration_ms = (time.perf_counter() - started) * 1000
+    if _threshold_ms is None or duration_ms < _threshold_ms or not has_app_context():
+        return
+
+    sql, fingerprint = fingerprint_statement(statement)
+    entry = {
+        'fingerprint': fingerprint,
+        'sql': sql,
+        'statement': statement,
+        'parameters': [] if executemany else redact_parameters(parameters, context),
+        'duration_ms': round(duration_ms, 2),
+        'endpoint': request.endpoint if has_request_context() else None,
+        'location': calling_frame(current_app.root_path),
+        'recorded_at': datetime.utcnow().isoformat(),
+    }
+    current_app.logger.warning(
+        f"Slow query ({entry['duration_ms']} ms) from {entry['endpoint']} at {entry['location']}: "
+        f"{sql} {entry['parameters']}"
+    )
+
+    from utils import get_redis
+    try:
+        record_slow_query(get_redis(), entry,
+                          conn=None if executemany or not current_app.config['SLOW_QUERY_EXPLAIN'] else conn,
+                          parameters=parameters)
+    except redis.RedisError as e:
+        current_app.logger.error(f"Failed to record slow query: {str(e)}")
+
+def init_slow_query_log(app):
+    """Time every statement on every engine and record those over SLOW_QUERY_THRESHOLD_MS"""
+    global _listeners_registered, _threshold_ms
+    threshold = app.config.get('SLOW_QUERY_THRESHOLD_MS')
+    if not threshold or threshold <= 0:
+        return
+
+    _threshold_ms = threshold
+    if _listeners_registered:
+        return
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    _listeners_registered = True
+
+def get_slow_queries(client, limit=50):
+    """Top fingerprints by total time, with counts, averages and captured plans"""
+    queries = []
+    for fingerprint, total_ms in client.zrevrange(TOTALS_KEY, 0, limit - 1, withscores=True):
+        fingerprint = fingerprint.decode('utf-8')
+        stats = {name.decode('utf-8'): value.decode('utf-8')
+                 for name, value in client.hgetall(stats_key(fingerprint)).items()}
+        count = int(stats.get('count', 0))
+        queries.append({
+            'fingerprint': fingerprint,
+            'sql': stats.get('sql', ''),
+            'count': count,
+            'total_ms': round(total_ms, 2),
+            'avg_ms': round(total_ms / count, 2) if count else 0.0,
+            'max_ms': round(float(stats.get('max_ms', 0)), 2),
+            'last_endpoint': stats.get('last_endpoint') or None,
+            'last_location': stats.get('last_location') or None,
+            'last_parameters': json.loads(stats.get('last_parameters') or '[]'),
+            'last_seen': stats.get('last_seen'),
+            'plan': stats.get('plan') or None,
+        })
+    return queries
+
+def reset_slow_queries(client):
+    """Forget every recorded fingerprint, e.g. after adding an index"""
+    fingerprints = [fingerprint.decode('utf-8') for fingerprint in client.zrange(TOTALS_KEY, 0, -1)]
+    client.delete(TOTALS_KEY, RECENT_KEY, *[stats_key(fingerprint) for fingerprint in fingerprints])
+    return len(fingerprints)
@@ -0,0 +1,77 @@
+// Live chat client for CreateProResume
+// Receives new messages over server-sent events, posts replies and pages
+// back through older history with fetch.
+
+document.addEventListener('DOMContentLoaded', function() {
+    const chatContainer = document.getElementById('chatMessages');
+    const chatForm = document.getElementById('chatForm');
+    if (!chatContainer || !chatForm) {
+        return;
+    }
+
+    const sessionId = chatContainer.dataset.sessionId;
+    const lastMessageId = chatContainer.dataset.lastMessageId || '';
+    const loadEarlier = document.getElementById('chatLoadEarlier');
+    let firstMessageId = chatContainer.dataset.firstMessageId || '';
+
+    function messageElement(message) {
+        const item = document.createElement('div');
+        item.className = 'chat-message chat-message-' + message.sender_type;
+        item.dataset.messageId = message.id;
+
+        const sender = document.createElement('strong');
+        sender.textContent = (message.sender_name || message.sender_type) + ': ';
+        item.appendChild(sender);
+        item.appendChild(document.createTextNode(message.message));
+        return item;
+    }
+
+    function appendMessage(message) {
+        if (chatContainer.querySelector('[data-message-id="' + message.id + '"]')) {
+            return;
+        }
+        chatContainer.appendChild(messageElement(message));
+        chatContainer.scrollTop = chatContainer.scrollHeight;
+    }
+
+    if (loadEarlier) {
+        loadEarlier.addEventListener('click', function() {
+            fetch('/chat/' + sessionId + '/messages?before=' + firstMessageId, {
+                credentials: 'same-origin'
+            }).then(function(response) {
+                return response.json();
+            }).then(function(data) {
+                const previousHeight = chatContainer.scrollHeight;
+                data.messages.slice().reverse().forEach(function(message) {
+                    chatContainer.insertBefore(messageElement(message), chatContainer.firstChild);
+                });
+                if (data.messages.length) {
+                    firstMessageId = data.messages[0].id;
+                }
+                // Keep the messages the visitor was reading in place
+                chatContainer.scrollTop += chatContainer.scrollHeight - previousHeight;
+                loadEarlier.hidden = !data.next_before;
+            });
+        });
+    }
+
+    // EventSource reconnects automatically and resends Last-Event-ID
+    const source = new EventSource('/chat/' + sessionId + '/stream?after=' + lastMessageId);
+    source.addEventListener('message', function(e) {
+        appendMessage(JSON.parse(e.data));
+    });
+
+    chatForm.addEventListener('submit', function(e) {
+        e.preventDefault();
+
+        fetch('/chat/' + sessionId + '/messages', {
+            method: 'POST',
+            body: new FormData(chatForm),
+            credentials: 'same-origin'
+        }).then(function(response) {
+            if (response.ok) {
+                chatForm.querySelector('[name="message"]').value = '';
+            }
+        });
+    });
+});
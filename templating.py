@@ -0,0 +1,86 @@
+import os
+import time
+import statistics
+from jinja2 import FileSystemBytecodeCache, TemplateError
+from fragments import FragmentCacheExtension
+
+# Path prefixes left out of the first-request benchmark (need login, arguments or are not HTML)
+BENCHMARK_SKIP_PREFIXES = ('/admin', '/api', '/static', '/assets', '/chat', '/download', '/logout')
+
+def init_templating(app):
+    """Set up fragment caching and shared bytecode, then warm templates up at boot"""
+    cache_folder = os.path.join(app.root_path, app.config['TEMPLATE_CACHE_FOLDER'])
+    os.makedirs(cache_folder, exist_ok=True)
+    # Buckets are keyed by template name and source checksum, so deploys never serve stale code
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_folder)
+    app.jinja_env.add_extension(FragmentCacheExtension)
+
+    if app.config.get('TEMPLATE_WARMUP'):
+        warm_templates(app)
+
+    return app
+
+def warm_templates(app):
+    """Compile every template so the first request of a worker does not pay for it"""
+    started = time.perf_counter()
+    compiled = 0
+
+    for name in app.jinja_env.list_templates(extensions=('html',)):
+        try:
+            app.jinja_env.get_template(name)
+            compiled += 1
+        except TemplateError as e:
+            app.logger.error(f"Failed to precompile template {name}: {str(e)}")
+
+    elapsed = (time.perf_counter() - started) * 1000
+    app.logger.info(f"Precompiled {compiled} template(s) in {elapsed:.0f} ms")
+    return compiled
+
+def benchmark_paths(app):
+    """Public GET pages without URL arguments"""
+    paths = []
+    for rule in app.url_map.iter_rules():
+        if 'GET' not in rule.methods or rule.arguments or rule.rule.startswith(BENCHMARK_SKIP_PREFIXES):
+            continue
+        paths.append(rule.rule)
+    return sorted(paths)
+
+def _percentile(samples, percentile):
+    """Nearest-rank percentile of a list of timings"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(percentile / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def _timed_get(client, path, run):
+    """Time one GET in milliseconds; the query string keeps the page cache out of it"""
+    started = time.perf_counter()
+    client.get(f"{path}?_bench={run}")
+    return (time.perf_counter() - started) * 1000
+
+def benchmark_first_request(app_factory, paths=None, runs=5, warm_requests=20):
+    """Measure first-request latency of fresh apps against warm requests, per path
+
+    Each cold sample builds a new app (and so a new Jinja environment) and
+    times its very first request to the path; warm samples reuse one app.
+    """
+    results = {}
+    warm_app = app_factory()
+    paths = paths or benchmark_paths(warm_app)
+    warm_client = warm_app.test_client()
+
+    for path in paths:
+        cold = []
+        for run in range(runs):
+            cold.append(_timed_get(app_factory().test_client(), path, f"cold{run}"))
+
+        _timed_get(warm_client, path, 'prime')
+        warm = [_timed_get(warm_client, path, f"warm{run}") for run in range(warm_requests)]
+
+        results[path] = {
+            'cold_p50': statistics.median(cold),
+            'cold_p99': _percentile(cold, 99),
+            'warm_p50': statistics.median(warm),
+            'warm_p99': _percentile(warm, 99),
+        }
+
+    return results
@@ -0,0 +1,98 @@
+import os
+import re
+import tempfile
+
+import pytest
+
+# The app is created at import time, so point it at throwaway storage first
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp, 'test.db')}")
+os.environ.setdefault("SESSION_BACKEND", "sqlite")
+os.environ.setdefault("SESSION_SQLITE_PATH", os.path.join(_tmp, "sessions.db"))
+os.environ.setdefault("RATELIMIT_ENABLED", "0")
+os.environ.setdefault("SESSION_SECRET", "test")
+
+from app import app as flask_app  # noqa: E402
+from models import Admin  # noqa: E402
+
+# (method, url) for every view added on top of the original routes
+NEW_PUBLIC_URLS = [
+    ('GET', '/search?q=resume'),
+    ('GET', '/chat'),
+]
+
+NEW_ADMIN_URLS = [
+    ('GET', '/admin/orders/search?q=smith'),
+    ('GET', '/admin/analytics/funnel'),
+    ('GET', '/admin/analytics/rollups'),
+    ('GET', '/admin/db/pool'),
+    ('POST', '/admin/profiler'),
+    ('GET', '/admin/slow-queries'),
+    ('POST', '/admin/slow-queries/reset'),
+    ('GET', '/admin/breakers'),
+    ('GET', '/admin/admission'),
+]
+
+@pytest.fixture
+def client():
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return flask_app.test_client()
+
+@pytest.fixture
+def admin_client(client):
+    with flask_app.app_context():
+        admin_id = Admin.query.filter_by(username='admin').first().id
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin_id)
+        session['_fresh'] = True
+    return client
+
+def _registered(url):
+    adapter = flask_app.url_map.bind('localhost')
+    path = url.split('?')[0]
+    for method in ('GET', 'POST'):
+        try:
+            adapter.match(path, method=method)
+            return True
+        except Exception:
+            continue
+    return False
+
+@pytest.mark.parametrize('method,url', NEW_PUBLIC_URLS + NEW_ADMIN_URLS)
+def test_new_urls_are_registered(method, url):
+    assert _registered(url), f"{url} is not in the app's url_map"
+
+@pytest.mark.parametrize('method,url', NEW_PUBLIC_URLS)
+def test_new_public_urls_respond(client, method, url):
+    response = client.open(url, method=method)
+    assert response.status_code != 404
+
+@pytest.mark.parametrize('method,url', NEW_ADMIN_URLS)
+def test_new_admin_urls_respond(admin_client, method, url):
+    response = admin_client.open(url, method=method)
+    assert response.status_code != 404
+
+def test_chat_messages_can_be_posted_and_paged(client):
+    page = client.get('/chat')
+    assert page.status_code == 200
+    assert b'js/chat.js' in page.data
+    session_id = re.search(rb'data-session-id="([^"]+)"', page.data).group(1).decode()
+
+    posted = client.post(f'/chat/{session_id}/messages', data={'message': 'Hello, is anyone there?'})
+    assert posted.status_code == 201
+
+    history = client.get(f'/chat/{session_id}/messages')
+    assert history.status_code == 200
+    assert [m['message'] for m in history.get_json()['messages']] == ['Hello, is anyone there?']
+
+@pytest.mark.parametrize('url', ['/', '/testimonials', '/faq'])
+def test_public_pages_answer_conditional_requests(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers.get('ETag')
+
+    revalidated = client.get(url, headers={'If-None-Match': response.headers['ETag']})
+    assert revalidated.status_code == 304
+
+def test_track_order_form_renders(client):
+    assert client.get('/track-order').status_code == 200
@@ -226,13 +226,28 @@ def send_email_notification(notification_type, to_email, user_name, order=None):
         logging.error(f"Email sending failed: {str(e)}")
         return False
 =======
+import re
 import uuid
-import json
+import redis
 from datetime import datetime, timedelta
 from flask import session, request, current_app
 from werkzeug.utils import secure_filename
 from models import Analytics, DiscountCode, OrderDiscount
 from app import db
+from events import validate_event, project_event_fields, sample_weight
+from admission import admission
+
+SLUG_INVALID_CHARS_RE = re.compile(r'[^a-z0-9\-]')
+SLUG_HYPHENS_RE = re.compile(r'-+')
+MOBILE_KEYWORDS = ('mobile', 'android', 'iphone', 'ipad', 'tablet', 'phone')
+
+def get_redis():
+    """Get the app's shared Redis client (chat fan-out, profiler, slow-query log)"""
+    client = current_app.extensions.get('redis')
+    if client is None:
+        client = redis.Redis.from_url(current_app.config['REDIS_URL'])
+        current_app.extensions['redis'] = client
+    return client
 
 def generate_referral_code():
     """Generate a unique referral code"""
@@ -242,25 +257,55 @@ def generate_session_id():
     """Generate a unique session ID for live chat"""
     return str(uuid.uuid4())
 
+def analytics_user_id():
+    """The visitor's analytics id, created on first use
+
+    Only views that track events touch the session, so cacheable responses
+    (assets, cached pages on a hit) never load it or set a cookie.
+    """
+    if 'user_id' not in session:
+        session['user_id'] = str(uuid.uuid4())
+    return session['user_id']
+
 def track_event(event_type, event_data=None, user_id=None):
     """Track analytics event"""
     if not current_app.config.get('ENABLE_ANALYTICS', False):
         return
     
     try:
-        analytics_entry = Analytics(
+        event_data = validate_event(event_type, event_data)
+        user_id = user_id or analytics_user_id()
+        
+        # Drop bots, reloads and sampled-out events before touching the DB
+        weight = sample_weight(event_type, event_data, user_id)
+        if weight is None:
+            return
+        
+        fields = dict(
             event_type=event_type,
-            event_data=json.dumps(event_data) if event_data else None,
-            user_id=user_id or session.get('user_id', 'anonymous'),
+            event_data=event_data or None,
+            user_id=user_id,
             ip_address=request.remote_addr,
             user_agent=request.headers.get('User-Agent'),
-            referrer=request.referrer
+            referrer=request.referrer,
+            sample_weight=weight,
+            **project_event_fields(event_data)
         )
-        db.session.add(analytics_entry)
+        # Under overload the row waits in memory and is written in a batch once load drops
+        if admission.overloaded():
+            admission.defer(save_analytics_events, dict(fields, created_at=datetime.utcnow()))
+            return
+        
+        db.session.add(Analytics(**fields))
         db.session.commit()
     except Exception as e:
         current_app.logger.error(f"Analytics tracking error: {e}")
 
+def save_analytics_events(rows):
+    """Insert deferred analytics events in one transaction"""
+    db.session.add_all([Analytics(**fields) for fields in rows])
+    db.session.commit()
+
 def validate_discount_code(code, order_amount):
     """Validate and apply discount code"""
     if not code:
@@ -403,21 +448,18 @@ def get_client_ip():
 def is_mobile_device():
     """Check if request is from mobile device"""
     user_agent = request.headers.get('User-Agent', '').lower()
-    mobile_keywords = ['mobile', 'android', 'iphone', 'ipad', 'tablet', 'phone']
-    return any(keyword in user_agent for keyword in mobile_keywords)
+    return any(keyword in user_agent for keyword in MOBILE_KEYWORDS)
 
 def generate_seo_friendly_slug(text):
     """Generate SEO-friendly slug from text"""
-    import re
-    
     # Convert to lowercase and replace spaces with hyphens
     slug = text.lower().replace(' ', '-')
     
     # Remove special characters except hyphens
-    slug = re.sub(r'[^a-z0-9\-]', '', slug)
+    slug = SLUG_INVALID_CHARS_RE.sub('', slug)
     
     # Remove multiple consecutive hyphens
-    slug = re.sub(r'-+', '-', slug)
+    slug = SLUG_HYPHENS_RE.sub('-', slug)
     
     # Remove leading/trailing hyphens
     slug = slug.strip('-')
@@ -0,0 +1,153 @@
+import os
+import json
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+from sqlalchemy import event
+from flask import current_app, request, g
+from app import db
+from models import Service, Testimonial, Portfolio, FAQ, Template, TableVersion
+
+# Models whose writes invalidate cached public pages
+VERSIONED_MODELS = (Service, Testimonial, Portfolio, FAQ, Template)
+
+# ETag suffixes added by compress_response for each content encoding
+ENCODING_SUFFIXES = ('', '-gzip', '-br')
+
+def bump_version(connection, table_name):
+    """Increment a table's data version on the connection doing the write"""
+    table = TableVersion.__table__
+    now = datetime.utcnow()
+    result = connection.execute(
+        table.update()
+        .where(table.c.table_name == table_name)
+        .values(version=table.c.version + 1, updated_at=now)
+    )
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(table_name=table_name, version=1, updated_at=now))
+
+def _make_listener(table_name):
+    """Build a mapper listener that bumps one table's version"""
+
+    def bump(mapper, connection, target):
+        bump_version(connection, table_name)
+
+    return bump
+
+_listeners_registered = False
+
+def register_version_listeners():
+    """Bump table versions on ORM inserts, updates and deletes"""
+    global _listeners_registered
+    if _listeners_registered:
+        return
+    _listeners_registered = True
+
+    for model in VERSIONED_MODELS:
+        bump = _make_listener(model.__tablename__)
+        event.listen(model, 'after_insert', bump)
+        event.listen(model, 'after_update', bump)
+        event.listen(model, 'after_delete', bump)
+
+def init_table_versions():
+    """Create a version row for every versioned table that lacks one"""
+    existing = {row.table_name for row in db.session.query(TableVersion.table_name).all()}
+    for model in VERSIONED_MODELS:
+        if model.__tablename__ not in existing:
+            db.session.add(TableVersion(table_name=model.__tablename__, version=0, updated_at=datetime.utcnow()))
+    db.session.commit()
+
+def get_table_versions(table_names):
+    """Get {table name: (version, updated_at)} in a single primary key lookup"""
+    rows = db.session.query(TableVersion.table_name, TableVersion.version, TableVersion.updated_at).filter(
+        TableVersion.table_name.in_(table_names)
+    ).all()
+    return {row.table_name: (row.version, row.updated_at) for row in rows}
+
+def deploy_fingerprint(app):
+    """Hash of what a deploy can change without touching table data
+
+    Covers the application modules, every template and the fingerprinted
+    asset manifest, so new markup or new asset hashes change every ETag
+    while identical deploys on several hosts agree.
+    """
+    digest = hashlib.sha1(app.config['ETAG_SALT'].encode('utf-8'))
+    digest.update(json.dumps(app.extensions.get('asset_manifest', {}), sort_keys=True).encode('utf-8'))
+
+    template_folder = os.path.join(app.root_path, app.template_folder)
+    paths = [os.path.join(app.root_path, name) for name in os.listdir(app.root_path) if name.endswith('.py')]
+    for folder, _, files in os.walk(template_folder):
+        paths.extend(os.path.join(folder, name) for name in files)
+
+    for path in sorted(paths):
+        digest.update(os.path.relpath(path, app.root_path).encode('utf-8'))
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+def init_etag_salt(app):
+    """Fold the deploy fingerprint into page ETags; after the asset manifest is loaded"""
+    app.extensions['etag_salt'] = deploy_fingerprint(app)
+    return app
+
+def _matching_etag(etag):
+    """Find the client's ETag for any encoding of the current representation"""
+    if_none_match = request.if_none_match
+    if if_none_match.star_tag:
+        return etag
+    for suffix in ENCODING_SUFFIXES:
+        if if_none_match.contains_weak(etag + suffix):
+            return etag + suffix
+    return None
+
+def _not_modified_since(last_modified):
+    """Check If-Modified-Since, which only applies without If-None-Match"""
+    if_modified_since = request.if_modified_since
+    if not last_modified or not if_modified_since or request.if_none_match:
+        return False
+    last_modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+    return last_modified <= if_modified_since
+
+def conditional(*models):
+    """Serve strong ETags and Last-Modified from the data version of models
+
+    The ETag is derived from the version counters of the tables the view
+    reads and the deploy fingerprint, so a matching If-None-Match or If-Modified-Since returns 304
+    before the view runs any queries or renders a template.
+    """
+    table_names = tuple(model.__tablename__ for model in models)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            versions = get_table_versions(table_names)
+            token = ':'.join(
+                [current_app.extensions['etag_salt'], request.endpoint]
+                + [f"{name}={versions.get(name, (0, None))[0]}" for name in table_names]
+            )
+            etag = hashlib.sha1(token.encode('utf-8')).hexdigest()[:20]
+            updated = [updated_at for _, updated_at in versions.values() if updated_at]
+            last_modified = max(updated) if updated else None
+            g.data_etag = etag
+
+            matched = _matching_etag(etag)
+            if matched or _not_modified_since(last_modified):
+                response = current_app.response_class(status=304)
+                response.set_etag(matched or etag)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                response.set_etag(etag)
+
+            if last_modified:
+                response.last_modified = last_modified
+            # Browsers keep the page but always revalidate it
+            response.headers.setdefault('Cache-Control', 'no-cache')
+            return response
+        return wrapper
+    return decorator
+
+def versioned_cache_key():
+    """Page cache key that changes whenever the view's data version does"""
+    return f"view/{request.full_path}/{g.get('data_etag', '')}"